@@ -0,0 +1,166 @@
+import random
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+class TransitionRing:
+    # Single-producer/single-consumer ring of transitions in shared memory. An actor process
+    # writes rows and advances `head`; the learner reads them and advances `tail`. States are
+    # stored like in ReplayBuffer: SLAM cells as uint8, the remaining features as float32.
+    def __init__(self, ctx, capacity, state_dim, quantized_dim, quant_scale=5, quant_min=-1.0):
+        self.capacity = capacity
+        self.quantized_dim = quantized_dim
+        self.quant_scale = quant_scale
+        self.quant_min = quant_min
+        feature_dim = state_dim - quantized_dim
+        self.tensors = {
+            'quantized': torch.zeros((capacity, 2, quantized_dim), dtype=torch.uint8),
+            'features': torch.zeros((capacity, 2, feature_dim), dtype=torch.float32),
+            'actions': torch.zeros(capacity, dtype=torch.int64),
+            'rewards': torch.zeros(capacity, dtype=torch.float32),
+            'dones': torch.zeros(capacity, dtype=torch.bool),
+        }
+        for tensor in self.tensors.values():
+            tensor.share_memory_()
+        self.head = ctx.Value('q', 0)
+        self.tail = ctx.Value('q', 0)
+        self._make_views()
+
+    def _make_views(self):
+        for name, tensor in self.tensors.items():
+            setattr(self, name, tensor.numpy())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.tensors:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_views()
+
+    def put(self, state, action, reward, next_state, done, stop_event):
+        # Blocks while the learner is a full ring behind; returns False if asked to stop
+        head = self.head.value
+        while head - self.tail.value >= self.capacity:
+            if stop_event.is_set():
+                return False
+            time.sleep(0.0005)
+        row = head % self.capacity
+        for i, s in enumerate((state, next_state)):
+            self.quantized[row, i] = np.rint((s[:self.quantized_dim] - self.quant_min) * self.quant_scale)
+            self.features[row, i] = s[self.quantized_dim:]
+        self.actions[row] = action
+        self.rewards[row] = reward
+        self.dones[row] = done
+        self.head.value = head + 1  # Publish only after the row is complete
+        return True
+
+    def drain_into(self, agent):
+        tail = self.tail.value
+        head = self.head.value
+        scale = 1 / self.quant_scale
+        for position in range(tail, head):
+            row = position % self.capacity
+            states = [np.concatenate((self.quantized[row, i] * scale + self.quant_min, self.features[row, i]))
+                      for i in range(2)]
+            agent.remember(states[0], int(self.actions[row]), float(self.rewards[row]),
+                           states[1], bool(self.dones[row]))
+        self.tail.value = head
+        return head - tail
+
+
+def _run_actor(actor_id, simulator_kwargs, seed, ring, shared_model, weights_lock, weights_version,
+               epsilon, stop_event, max_steps):
+    # Imported here so the learner module itself does not need pygame
+    from simulator import Simulator
+
+    torch.set_num_threads(1)  # Actors share the box with each other and the learner
+    random.seed(seed + actor_id)
+    np.random.seed(seed + actor_id)
+    torch.manual_seed(seed + actor_id)
+
+    simulator = Simulator(**dict(simulator_kwargs, seed=seed + actor_id, headless=True))
+    agent = simulator.agent
+    local_version = -1
+
+    state = simulator.get_state()
+    steps = 0
+    while not stop_event.is_set():
+        if weights_version.value != local_version:
+            with weights_lock:
+                agent.model.load_state_dict(shared_model.state_dict())
+                local_version = weights_version.value
+        agent.epsilon = epsilon.value
+
+        action = agent.get_action(state)
+        next_state, reward, done = simulator.step(action)
+        if not ring.put(state, action, reward, next_state, done, stop_event):
+            break
+
+        state = next_state
+        steps += 1
+        if done or steps >= max_steps:
+            state = simulator.reset()
+            steps = 0
+
+
+def train_actor_learner(simulator_kwargs, num_actors, num_train_steps, batch_size=32,
+                        sync_every=100, target_update_every=1000, ring_capacity=256,
+                        max_steps=1000, seed=0):
+    # Actor processes each run a headless Simulator with a periodically synced copy of the
+    # DQN weights and stream transitions through shared-memory rings. This process is the
+    # learner: it drains the rings into its replay buffer and calls DQNAgent.train
+    # continuously. Returns the trained DQNAgent.
+    from simulator import Simulator
+
+    ctx = mp.get_context('spawn')
+    agent = Simulator(**dict(simulator_kwargs, headless=True)).agent
+
+    shared_model = agent.build_model()
+    shared_model.load_state_dict(agent.model.state_dict())
+    shared_model.share_memory()
+    weights_lock = ctx.Lock()
+    weights_version = ctx.Value('q', 0)
+    epsilon = ctx.Value('d', agent.epsilon)
+    stop_event = ctx.Event()
+
+    rings = [TransitionRing(ctx, ring_capacity, agent.state_dim, agent.memory.quantized_dim)
+             for _ in range(num_actors)]
+    actors = [ctx.Process(target=_run_actor, daemon=True,
+                          args=(i, simulator_kwargs, seed, rings[i], shared_model, weights_lock,
+                                weights_version, epsilon, stop_event, max_steps))
+              for i in range(num_actors)]
+    for actor in actors:
+        actor.start()
+
+    try:
+        train_steps = 0
+        while train_steps < num_train_steps:
+            received = sum(ring.drain_into(agent) for ring in rings)
+            if len(agent.memory) < batch_size:
+                if not received:
+                    time.sleep(0.001)
+                continue
+
+            agent.train(batch_size)
+            train_steps += 1
+            epsilon.value = agent.epsilon
+
+            if train_steps % sync_every == 0:
+                with weights_lock:
+                    shared_model.load_state_dict(agent.model.state_dict())
+                    weights_version.value += 1
+            if train_steps % target_update_every == 0:
+                agent.update_target_model()
+    finally:
+        stop_event.set()
+        for actor in actors:
+            actor.join(timeout=10)
+            if actor.is_alive():
+                actor.terminate()
+
+    return agent
@@ -0,0 +1,62 @@
+# Sampling cost of the prioritized replay buffer as it grows.
+#
+#   python -m benchmarks.replay_sampling
+#
+# SumTree.find/update should stay flat (O(log n)) from a thousand to a million entries,
+# and PrioritizedReplayBuffer.sample should cost about the same at every fill level.
+import time
+import numpy as np
+from replay_buffer import SumTree, PrioritizedReplayBuffer
+
+BATCH_SIZE = 32
+
+
+def time_call(fn, repeats=200):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_sum_tree(sizes, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        tree = SumTree(size)
+        tree.update(np.arange(size), rng.random(size))
+        leaves = rng.integers(0, size, BATCH_SIZE)
+        results.append({
+            'size': size,
+            'find_us': 1e6 * time_call(lambda: tree.find(rng.random(BATCH_SIZE) * tree.total)),
+            'update_us': 1e6 * time_call(lambda: tree.update(leaves, rng.random(BATCH_SIZE))),
+        })
+    return results
+
+
+def bench_prioritized_sample(sizes, state_dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        buffer = PrioritizedReplayBuffer(size, state_dim, seed=seed)
+        state = rng.random(state_dim)
+        for _ in range(size):
+            next_state = rng.random(state_dim)
+            buffer.add(state, 0, 0.0, next_state, False)
+            state = next_state
+        results.append({'size': size, 'sample_us': 1e6 * time_call(lambda: buffer.sample(BATCH_SIZE))})
+    return results
+
+
+def main():
+    print(f"{'entries':>10} {'find us':>10} {'update us':>10}")
+    for row in bench_sum_tree([10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]):
+        print(f"{row['size']:>10} {row['find_us']:>10.1f} {row['update_us']:>10.1f}")
+
+    print(f"\n{'entries':>10} {'sample us':>10}")
+    for row in bench_prioritized_sample([10 ** 3, 10 ** 4, 10 ** 5]):
+        print(f"{row['size']:>10} {row['sample_us']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
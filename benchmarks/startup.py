@@ -0,0 +1,56 @@
+# Startup cost: importing the simulator and constructing one, each in a fresh interpreter.
+#
+#   python -m benchmarks.startup
+#
+# Manual driving, tests and headless workers only pay for the first two; torch is imported
+# and the DQN networks are allocated when Simulator.agent is first used, timed separately.
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import simulator
+imported = time.perf_counter()
+sim = simulator.Simulator(*{args}, headless=True, seed=0)
+constructed = time.perf_counter()
+torch_loaded = 'torch' in sys.modules
+sim.agent
+agent_built = time.perf_counter()
+print(json.dumps({{'import_s': imported - start, 'init_s': constructed - imported,
+                  'agent_s': agent_built - constructed, 'torch_at_startup': torch_loaded}}))
+'''
+
+
+def probe_startup(simulator_args):
+    # One fresh interpreter: nothing is cached in sys.modules
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    output = subprocess.run([sys.executable, '-c', PROBE.format(args=tuple(simulator_args))], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_startup(simulator_args, rounds=5):
+    probes = [probe_startup(simulator_args) for _ in range(rounds)]
+    row = {key: float(np.median([probe[key] for probe in probes])) for key in ('import_s', 'init_s', 'agent_s')}
+    row['torch_at_startup'] = any(probe['torch_at_startup'] for probe in probes)
+    return row
+
+
+def main():
+    from benchmarks.suite import SIMULATOR_ARGS
+
+    row = bench_startup(SIMULATOR_ARGS)
+    print(f"import simulator   {1e3 * row['import_s']:8.1f} ms")
+    print(f"Simulator(...)     {1e3 * row['init_s']:8.1f} ms")
+    print(f"first .agent       {1e3 * row['agent_s']:8.1f} ms")
+    print(f"torch at startup   {row['torch_at_startup']}")
+
+
+if __name__ == '__main__':
+    main()
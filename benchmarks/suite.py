@@ -0,0 +1,311 @@
+# Reproducible performance benchmarks for the simulator, radar, SLAM map and learner.
+#
+#   python -m benchmarks --output results.json
+#   python -m benchmarks --output new.json --baseline results.json   # exit code 1 on regressions
+#
+# Every benchmark runs in a fresh process with fixed seeds, so peak RSS is per benchmark
+# and results do not depend on what ran before. Results are written as JSON: one record
+# per (benchmark, parameters) with a value, its unit and whether lower is better.
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import numpy as np
+
+SEED = 0
+SIMULATOR_ARGS = (800, 600, 5, 0.2, 0.15, 200, 60, 5)
+
+
+def seed_random(seed=SEED):
+    # Python and NumPy only: torch is seeded by the benchmarks that use it, so the others
+    # never import it (peak_rss is measured per benchmark)
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def median_time(fn, repeats, rounds=5):
+    fn()  # Warm-up
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        times.append((time.perf_counter() - start) / repeats)
+    return float(np.median(times))
+
+
+def result(name, params, value, unit, lower_is_better=True):
+    return {'name': name, 'params': params, 'value': value, 'unit': unit, 'lower_is_better': lower_is_better}
+
+
+def bench_simulator_step(quick):
+    from simulator import Simulator
+    results = []
+    for observation in ('slam', 'local', 'radar'):
+        seed_random()
+        simulator = Simulator(*SIMULATOR_ARGS, headless=True, observation=observation, seed=SEED)
+        actions = np.random.randint(0, 4, 10000)
+        steps = 200 if quick else 2000
+        start = time.perf_counter()
+        for action in actions[:steps]:
+            _, _, done = simulator.step(action)
+            if done:
+                simulator.reset()
+        elapsed = time.perf_counter() - start
+        results.append(result('simulator_step', {'observation': observation}, steps / elapsed, 'steps/s', False))
+    return results
+
+
+def bench_vector_simulator_step(quick):
+    from vector_simulator import VectorSimulator
+    results = []
+    for num_envs in ((64,) if quick else (64, 1024)):
+        envs = VectorSimulator(num_envs, *SIMULATOR_ARGS, seed=SEED, observation='radar')
+        rng = np.random.default_rng(SEED)
+        seconds = median_time(lambda: envs.step(rng.integers(0, 4, num_envs)), repeats=10, rounds=3)
+        results.append(result('vector_simulator_step', {'num_envs': num_envs}, num_envs / seconds, 'steps/s', False))
+    return results
+
+
+def bench_multi_car_step(quick):
+    # Traffic density is kept constant: the world grows with the number of cars
+    from multi_car import MultiCarWorld
+    results = []
+    for num_cars in ((100,) if quick else (100, 1000, 5000)):
+        scale = (num_cars / 100) ** 0.5
+        world = MultiCarWorld(num_cars, int(800 * scale), int(600 * scale), *SIMULATOR_ARGS[2:7],
+                              num_obstacles=num_cars // 5, seed=SEED)
+        rng = np.random.default_rng(SEED)
+        seconds = median_time(lambda: world.step(rng.integers(0, 4, num_cars)), repeats=10, rounds=3)
+        results.append(result('multi_car_step', {'num_cars': num_cars}, num_cars / seconds, 'car-steps/s', False))
+    return results
+
+
+def bench_radar_scan(quick):
+    from car import Car
+    from obstacle import Obstacle, ObstacleSet
+    from radar import Radar
+    results = []
+    counts = (5, 500) if quick else (5, 50, 500, 2000, 10000)
+    for count in counts:
+        # Constant density: the world grows with the obstacle count, like a larger map would
+        rng = np.random.default_rng(SEED)
+        side = int(np.sqrt(count / 5 * 800 * 600))
+        positions = rng.integers(0, side - 40, (count, 2))
+        obstacles = ObstacleSet(Obstacle(int(x), int(y), 40, 40) for x, y in positions)
+        car = Car(side // 2, side // 2, 5, 0.2, 0.15)
+        radar = Radar(200, 60)
+        seconds = median_time(lambda: radar._compute_ranges(car, obstacles), repeats=50)  # Uncached
+        results.append(result('radar_scan', {'obstacles': count}, seconds, 's'))
+    return results
+
+
+def bench_radar_beams(quick):
+    # Dense sensors: a 60 degree radar at 5 and 0.25 degree spacing, and a 360 degree lidar
+    from car import Car
+    from obstacle import Obstacle, ObstacleSet
+    from radar import Radar
+    rng = np.random.default_rng(SEED)
+    side = int(np.sqrt(500 / 5 * 800 * 600))
+    positions = rng.integers(0, side - 40, (500, 2))
+    obstacles = ObstacleSet(Obstacle(int(x), int(y), 40, 40) for x, y in positions)
+    car = Car(side // 2, side // 2, 5, 0.2, 0.15)
+    results = []
+    layouts = ((60, 5), (360, 0.25)) if quick else ((60, 5), (60, 0.25), (360, 1), (360, 0.25))
+    for angle, spacing in layouts:
+        radar = Radar(200, angle, spacing)
+        seconds = median_time(lambda: radar._compute_ranges(car, obstacles), repeats=20)
+        results.append(result('radar_scan_beams', {'fov': angle, 'spacing': spacing, 'beams': radar.num_beams},
+                              seconds, 's'))
+    return results
+
+
+def bench_moving_obstacles(quick):
+    from moving_obstacles import MovingObstacles
+    results = []
+    for count in ((100,) if quick else (100, 1000, 10000)):
+        side = int(np.sqrt(count / 5 * 800 * 600))
+        movers = MovingObstacles((0, 0, side, side), seed=SEED)
+        movers.spawn(count, behaviour=['bounce', 'patrol', 'random_walk'] * (count // 3) + ['bounce'] * (count % 3))
+        seconds = median_time(movers.update, repeats=20)
+        results.append(result('movers_update', {'movers': count}, seconds, 's'))
+    return results
+
+
+def update_per_detection(grid, car_pos, car_angle, radar_detections, resolution):
+    # The SlamMap.update this repo started with, kept as the reference point for
+    # slam_update: one Python iteration per hit, hit cells only, no free space
+    car_x, car_y = car_pos
+    for distance, angle in radar_detections:
+        abs_angle = car_angle + angle
+        grid_x = int((car_x + distance * np.cos(np.radians(abs_angle))) / resolution)
+        grid_y = int((car_y - distance * np.sin(np.radians(abs_angle))) / resolution)
+        if 0 <= grid_x < grid.shape[1] and 0 <= grid_y < grid.shape[0]:
+            grid[grid_y, grid_x] = min(grid[grid_y, grid_x] + 0.2, 1)
+
+
+def bench_slam_map(quick):
+    import pygame
+    from slam_map import SlamMap, ChunkedSlamMap
+    results = []
+    rel_angles = np.arange(-30, 31, 5)
+    rng = np.random.default_rng(SEED)
+    distances = np.where(rng.random(len(rel_angles)) < 0.5, rng.uniform(20, 200, len(rel_angles)), np.inf)
+    detections = [(d, angle) for d, angle in zip(distances.tolist(), rel_angles.tolist()) if np.isfinite(d)]
+    for resolution in ((5,) if quick else (10, 5, 2)):
+        slam_map = SlamMap(800, 600, resolution)
+        update = median_time(lambda: slam_map.update_ranges((400, 300), 0, rel_angles, distances, 200), repeats=100)
+        draw = median_time(slam_map.draw, repeats=20)
+        results.append(result('slam_update', {'resolution': resolution}, update, 's'))
+        grid = np.zeros_like(slam_map.grid, dtype=np.float64)
+        per_detection = median_time(lambda: update_per_detection(grid, (400, 300), 0, detections, resolution),
+                                    repeats=100)
+        results.append(result('slam_update_per_detection', {'resolution': resolution}, per_detection, 's'))
+        results.append(result('slam_update_vs_per_detection', {'resolution': resolution}, update / per_detection, 'x'))
+        results.append(result('slam_draw', {'resolution': resolution}, draw, 's'))
+        chunked = ChunkedSlamMap(800, 600, resolution)
+        update = median_time(lambda: chunked.update_ranges((400, 300), 0, rel_angles, distances, 200), repeats=100)
+        results.append(result('slam_update_chunked', {'resolution': resolution}, update, 's'))
+    pygame.quit()
+    return results
+
+
+def bench_dqn_train(quick):
+    import torch
+    from dqn_agent import DQNAgent
+    results = []
+    state_dim = 160 * 120 + 6  # Default 'slam' observation
+    batch_sizes = (32,) if quick else (32, 128, 512)
+    replay_sizes = (1000,) if quick else (1000, 10000)
+    for replay_size in replay_sizes:
+        seed_random()
+        torch.manual_seed(SEED)
+        agent = DQNAgent(state_dim, 4, memory_size=replay_size, quantized_dim=state_dim - 6)
+        state = np.random.randint(-5, 6, state_dim) * 0.2
+        for _ in range(replay_size):
+            next_state = state.copy()
+            next_state[np.random.randint(0, state_dim, 50)] = 0.2
+            agent.remember(state, np.random.randint(0, 4), -1.0, next_state, False)
+            state = next_state
+        for batch_size in batch_sizes:
+            seconds = median_time(lambda: agent.train(batch_size), repeats=5, rounds=3)
+            results.append(result('dqn_train', {'batch_size': batch_size, 'replay_size': replay_size}, seconds, 's'))
+    return results
+
+
+def bench_replay_sampling(quick):
+    from benchmarks.replay_sampling import bench_sum_tree
+    sizes = (10 ** 3, 10 ** 5) if quick else (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+    return [result('sum_tree_find', {'size': row['size']}, row['find_us'] * 1e-6, 's')
+            for row in bench_sum_tree(sizes, seed=SEED)]
+
+
+def bench_startup(quick):
+    from benchmarks.startup import bench_startup
+    row = bench_startup(SIMULATOR_ARGS, rounds=1 if quick else 5)
+    return [result('startup', {'phase': 'import_simulator'}, row['import_s'], 's'),
+            result('startup', {'phase': 'simulator_init'}, row['init_s'], 's'),
+            result('startup', {'phase': 'agent_build'}, row['agent_s'], 's')]
+
+
+BENCHMARKS = {
+    'simulator_step': bench_simulator_step,
+    'vector_simulator_step': bench_vector_simulator_step,
+    'multi_car_step': bench_multi_car_step,
+    'radar_scan': bench_radar_scan,
+    'radar_beams': bench_radar_beams,
+    'moving_obstacles': bench_moving_obstacles,
+    'slam_map': bench_slam_map,
+    'dqn_train': bench_dqn_train,
+    'replay_sampling': bench_replay_sampling,
+    'startup': bench_startup,
+}
+
+
+def _run_isolated(name, quick):
+    results = BENCHMARKS[name](quick)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    return results + [result('peak_rss', {'benchmark': name}, peak_rss_mb, 'MiB')]
+
+
+def run(names, quick=False):
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for name in names:
+        with ctx.Pool(1) as pool:
+            results += pool.apply(_run_isolated, (name, quick))
+    return results
+
+
+def metadata(quick):
+    import torch
+    return {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': SEED,
+        'quick': quick,
+    }
+
+
+def _key(record):
+    return record['name'], json.dumps(record['params'], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    # A result regresses when it is worse than the baseline by more than `threshold` (relative)
+    baseline_by_key = {_key(record): record for record in baseline}
+    regressions = []
+    for record in results:
+        previous = baseline_by_key.get(_key(record))
+        if previous is None or previous['value'] == 0:
+            continue
+        change = record['value'] / previous['value'] - 1
+        worse = change if record['lower_is_better'] else -change
+        if worse > threshold:
+            regressions.append((record, previous, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run the performance benchmarks.')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the results (JSON)')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative slowdown that counts as a regression (default: 0.2)')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Run only these benchmarks')
+    parser.add_argument('--quick', action='store_true', help='Fewer sizes and repeats, for smoke runs')
+    args = parser.parse_args(argv)
+
+    names = args.only or list(BENCHMARKS)
+    results = run(names, args.quick)
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(args.quick), 'results': results}, f, indent=2)
+
+    for record in results:
+        params = ', '.join(f'{k}={v}' for k, v in record['params'].items())
+        print(f"{record['name']:<24} {params:<36} {record['value']:>14.6g} {record['unit']}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for record, previous, change in regressions:
+            print(f"REGRESSION {record['name']} {record['params']}: "
+                  f"{previous['value']:.6g} -> {record['value']:.6g} {record['unit']} ({change:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
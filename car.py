@@ -1,16 +1,67 @@
 import pygame
 import math
+from utils import obb_aabb_overlap
+
+CAR_SIZE = (40, 20)
+CAR_HALF_SIZE = (CAR_SIZE[0] / 2, CAR_SIZE[1] / 2)
 
 class Car:
-    def __init__(self, x, y, max_speed, acceleration, deceleration):
-        self.image = pygame.Surface((40, 20), pygame.SRCALPHA)
-        pygame.draw.rect(self.image, (255, 0, 0), [0, 0, 40, 20])
-        self.rect = self.image.get_rect(center=(x, y))
+    # Pose and speed are plain floats integrated at a fixed timestep `dt` (in frames, split
+    # into `substeps`). The pygame Rect and Surface are only built when asked for, for
+    # collision checks and drawing, and the Surface is shared by all cars.
+    # model='point' turns in place by `turn_rate` degrees per frame (the original handling);
+    # model='bicycle' is a kinematic bicycle model: the arrow keys set the steering angle
+    # and the car turns with speed / wheelbase * tan(steering).
+    __slots__ = ('x', 'y', 'angle', 'speed', 'steering', 'max_speed', 'acceleration', 'deceleration',
+                 'dt', 'substeps', 'model', 'turn_rate', 'wheelbase', 'max_steering')
+
+    def __init__(self, x, y, max_speed, acceleration, deceleration, dt=1.0, substeps=1, model='point',
+                 turn_rate=2, wheelbase=30, max_steering=30):
+        if model not in ('point', 'bicycle'):
+            raise ValueError(f"Unknown car model {model!r}, expected 'point' or 'bicycle'")
+        self.x = float(x)
+        self.y = float(y)
         self.angle = 0
         self.speed = 0
+        self.steering = 0
         self.max_speed = max_speed
         self.acceleration = acceleration
         self.deceleration = deceleration
+        self.dt = dt
+        self.substeps = substeps
+        self.model = model
+        self.turn_rate = turn_rate
+        self.wheelbase = wheelbase
+        self.max_steering = max_steering
+
+    @property
+    def center(self):
+        return self.x, self.y
+
+    @center.setter
+    def center(self, center):
+        self.x, self.y = float(center[0]), float(center[1])
+
+    @property
+    def rect(self):
+        # A fresh, rounded Rect each time: moving it does not move the car (set `center`)
+        rect = pygame.Rect((0, 0), CAR_SIZE)
+        rect.center = (round(self.x), round(self.y))
+        return rect
+
+    def overlaps(self, rects):
+        # Exact test of the rotated car against (M, 4) rects, returns (M,) booleans
+        return obb_aabb_overlap(self.center, CAR_HALF_SIZE, self.angle, rects)
+
+    @property
+    def image(self):
+        return car_image()
+
+    def reset(self, x, y):
+        self.center = (x, y)
+        self.angle = 0
+        self.speed = 0
+        self.steering = 0
 
     def move(self, keys):
         if keys[pygame.K_UP]:
@@ -20,35 +71,63 @@ class Car:
         else:
             self.coast()
 
-        if keys[pygame.K_LEFT]:
-            self.rotate_left()
-        if keys[pygame.K_RIGHT]:
-            self.rotate_right()
+        self.turn(int(keys[pygame.K_LEFT]) - int(keys[pygame.K_RIGHT]))
 
         self.update_position()
 
     def accelerate(self):
-        self.speed = min(self.speed + self.acceleration, self.max_speed)
+        self.speed = min(self.speed + self.acceleration * self.dt, self.max_speed)
 
     def decelerate(self):
-        self.speed = max(self.speed - self.acceleration, -self.max_speed / 2)
+        self.speed = max(self.speed - self.acceleration * self.dt, -self.max_speed / 2)
 
     def coast(self):
-        self.speed *= (1 - self.deceleration)
+        self.speed *= (1 - self.deceleration) ** self.dt
+
+    def turn(self, direction):
+        # direction: 1 left, -1 right, 0 straight
+        if self.model == 'bicycle':
+            self.steering = direction * self.max_steering
+        else:
+            self.angle += direction * self.turn_rate * self.dt
 
     def rotate_left(self):
-        self.angle += 2
+        self.turn(1)
 
     def rotate_right(self):
-        self.angle -= 2
+        self.turn(-1)
 
     def update_position(self):
-        angle_rad = math.radians(self.angle)
-        self.rect.x += self.speed * math.cos(angle_rad)
-        self.rect.y -= self.speed * math.sin(angle_rad)
+        h = self.dt / self.substeps
+        for _ in range(self.substeps):
+            if self.model == 'bicycle':
+                self.angle += math.degrees(self.speed / self.wheelbase * math.tan(math.radians(self.steering))) * h
+            angle_rad = math.radians(self.angle)
+            self.x += self.speed * math.cos(angle_rad) * h
+            self.y -= self.speed * math.sin(angle_rad) * h
+
+    def clamp(self, left, top, right, bottom):
+        # Keep the (axis-aligned) car box inside the given bounds
+        half_w, half_h = CAR_HALF_SIZE
+        self.x = min(max(self.x, left + half_w), right - half_w)
+        self.y = min(max(self.y, top + half_h), bottom - half_h)
 
     def draw(self, screen):
-        rotated = pygame.transform.rotate(self.image, self.angle)
-        screen.blit(rotated, rotated.get_rect(center=self.rect.center))
-    def check_goal_reached(self):
-        return self.car.rect.colliderect(self.goal)
\ No newline at end of file
+        draw_car(screen, self.center, self.angle)
+
+
+_image = None
+
+
+def car_image():
+    # One sprite shared by every car, created on first use
+    global _image
+    if _image is None:
+        _image = pygame.Surface(CAR_SIZE, pygame.SRCALPHA)
+        pygame.draw.rect(_image, (255, 0, 0), [0, 0, *CAR_SIZE])
+    return _image
+
+
+def draw_car(screen, center, angle):
+    rotated = pygame.transform.rotate(car_image(), angle)
+    screen.blit(rotated, rotated.get_rect(center=(round(center[0]), round(center[1]))))
@@ -3,8 +3,7 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import random
-from collections import deque
-
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer
 
 
 class DQN(nn.Module):
@@ -19,46 +18,123 @@ class DQN(nn.Module):
         x = torch.relu(self.fc2(x))
         return self.fc3(x)
 
+class ConvDQN(nn.Module):
+    # Small conv encoder for flat states that start with a grid: the first grid_shape cells
+    # go through the convolutions, the trailing features join at the fully connected layer
+    def __init__(self, grid_shape, feature_dim, output_dim):
+        super(ConvDQN, self).__init__()
+        self.grid_shape = tuple(grid_shape)
+        self.grid_size = self.grid_shape[0] * self.grid_shape[1]
+        self.conv1 = nn.Conv2d(1, 16, kernel_size=5, stride=2, padding=2)
+        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, stride=2, padding=1)
+        self.pool = nn.AdaptiveAvgPool2d((4, 4))
+        self.fc1 = nn.Linear(32 * 4 * 4 + feature_dim, 64)
+        self.fc2 = nn.Linear(64, output_dim)
+
+    def forward(self, x):
+        grid = x[:, :self.grid_size].reshape(-1, 1, *self.grid_shape)
+        features = x[:, self.grid_size:]
+        grid = torch.relu(self.conv1(grid))
+        grid = torch.relu(self.conv2(grid))
+        grid = self.pool(grid).flatten(1)
+        x = torch.relu(self.fc1(torch.cat((grid, features), dim=1)))
+        return self.fc2(x)
+
 class DQNAgent:
-    def __init__(self, state_dim, action_dim, learning_rate=0.001, gamma=0.99, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01):
+    def __init__(self, state_dim, action_dim, learning_rate=0.001, gamma=0.99, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.01,
+                 memory_size=10000, quantized_dim=0, memory_path=None, prioritized=False, grid_shape=None,
+                 inference_backend=None):
         self.state_dim = state_dim
         self.action_dim = action_dim
         self.gamma = gamma
         self.epsilon = epsilon
         self.epsilon_decay = epsilon_decay
         self.epsilon_min = epsilon_min
-        self.memory = deque(maxlen=10000)
+        # quantized_dim: leading state entries (SLAM grid) stored as uint8 in the replay buffer
+        # memory_path: keep the replay buffer in memory-mapped files there (resumed if present)
+        # prioritized: sample by TD error from a sum-tree and weight the loss by importance sampling
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(memory_size, state_dim, quantized_dim, path=memory_path)
+        else:
+            self.memory = ReplayBuffer(memory_size, state_dim, quantized_dim, path=memory_path)
         
-        self.model = DQN(state_dim, action_dim)
-        self.target_model = DQN(state_dim, action_dim)
+        # grid_shape: the state starts with a grid of this shape, encode it with ConvDQN
+        self.grid_shape = grid_shape
+        self.model = self.build_model()
+        self.target_model = self.build_model()
         self.target_model.load_state_dict(self.model.state_dict())
         self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
 
+        # Acting path: inference_backend "script" (TorchScript) or "compile" (torch.compile)
+        # wraps self.model for CPU inference; both share its parameters, so training and
+        # load() are picked up without rebuilding. Inputs go through a reusable float32 buffer.
+        if inference_backend is None:
+            self.inference_model = self.model
+        elif inference_backend == "script":
+            self.inference_model = torch.jit.script(self.model)
+        elif inference_backend == "compile":
+            self.inference_model = torch.compile(self.model)
+        else:
+            raise ValueError(f"Unknown inference backend {inference_backend!r}")
+        self._input_buffer = torch.empty((0, state_dim), dtype=torch.float32)
+
+    def build_model(self):
+        if self.grid_shape is None:
+            return DQN(self.state_dim, self.action_dim)
+        feature_dim = self.state_dim - self.grid_shape[0] * self.grid_shape[1]
+        return ConvDQN(self.grid_shape, feature_dim, self.action_dim)
+
     def get_action(self, state):
         if random.random() < self.epsilon:
             return random.randint(0, self.action_dim - 1)
-        state = torch.FloatTensor(state).unsqueeze(0)
-        q_values = self.model(state)
-        return q_values.argmax().item()
+        return int(self._greedy_actions(np.asarray(state)[None])[0])
+
+    def get_actions(self, states):
+        # Epsilon-greedy actions for a batch of states (N, state_dim) with one forward pass
+        states = np.asarray(states)
+        actions = np.random.randint(0, self.action_dim, len(states))
+        greedy = np.random.random(len(states)) >= self.epsilon
+        if greedy.any():
+            actions[greedy] = self._greedy_actions(states[greedy])
+        return actions
+
+    def _greedy_actions(self, states):
+        batch_size = len(states)
+        if len(self._input_buffer) < batch_size:
+            self._input_buffer = torch.empty((max(batch_size, 2 * len(self._input_buffer)), self.state_dim),
+                                             dtype=torch.float32, pin_memory=torch.cuda.is_available())
+        inputs = self._input_buffer[:batch_size]
+        inputs.numpy()[:] = states  # Converts float64 states in place, no intermediate tensor
+        with torch.inference_mode():
+            return self.inference_model(inputs).argmax(dim=1).numpy()
 
     def train(self, batch_size=32):
         if len(self.memory) < batch_size:
             return
         
-        batch = random.sample(self.memory, batch_size)
-        states, actions, rewards, next_states, dones = zip(*batch)
-        
-        states = torch.FloatTensor(states)
-        actions = torch.LongTensor(actions)
-        rewards = torch.FloatTensor(rewards)
-        next_states = torch.FloatTensor(next_states)
-        dones = torch.FloatTensor(dones)
+        if self.prioritized:
+            states, actions, rewards, next_states, dones, slots, weights = self.memory.sample(batch_size)
+        else:
+            states, actions, rewards, next_states, dones = self.memory.sample(batch_size)
+
+        # The sampled arrays are fresh float32/int64 copies, so wrap them without copying again
+        states = torch.from_numpy(states)
+        actions = torch.from_numpy(actions)
+        rewards = torch.from_numpy(rewards)
+        next_states = torch.from_numpy(next_states)
+        dones = torch.from_numpy(dones)
 
         current_q_values = self.model(states).gather(1, actions.unsqueeze(1))
         next_q_values = self.target_model(next_states).max(1)[0]
         target_q_values = rewards + (1 - dones) * self.gamma * next_q_values
 
-        loss = nn.MSELoss()(current_q_values, target_q_values.unsqueeze(1))
+        if self.prioritized:
+            td_errors = target_q_values.detach() - current_q_values.squeeze(1)
+            loss = (torch.from_numpy(weights) * td_errors ** 2).mean()
+            self.memory.update_priorities(slots, td_errors.detach().numpy())
+        else:
+            loss = nn.MSELoss()(current_q_values, target_q_values.unsqueeze(1))
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
@@ -69,10 +145,11 @@ class DQNAgent:
         self.target_model.load_state_dict(self.model.state_dict())
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.add(state, action, reward, next_state, done)
 
     def save(self, filename):
         torch.save(self.model.state_dict(), filename)
+        self.memory.flush()
 
     def load(self, filename):
         self.model.load_state_dict(torch.load(filename))
@@ -0,0 +1,153 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+GOAL, COLLISION, TIMEOUT = 'goal', 'collision', 'timeout'
+DEFAULT_SIMULATOR_KWARGS = dict(width=800, height=600, car_speed=5, car_acceleration=0.2, car_deceleration=0.15,
+                                radar_range=200, radar_angle=60, num_obstacles=5)
+
+_worker = {}  # Per-process policy and settings, set up once by _init_worker
+
+
+def load_policy(checkpoint, simulator_kwargs):
+    # The DQNAgent a simulator with these settings would build, with the checkpoint's
+    # weights and exploration switched off
+    from simulator import Simulator
+
+    agent = Simulator(**dict(simulator_kwargs, headless=True)).agent
+    agent.load(checkpoint)
+    agent.epsilon = 0
+    return agent
+
+
+def _init_worker(checkpoint, simulator_kwargs, max_steps):
+    torch.set_num_threads(1)  # Workers share the box with each other
+    _worker.update(agent=load_policy(checkpoint, simulator_kwargs), simulator_kwargs=simulator_kwargs,
+                   max_steps=max_steps)
+
+
+def _evaluate_seeds(seeds):
+    # Runs the scenarios of one chunk in lockstep, so every tick is one batched forward pass
+    # for all of them. Returns [(seed, outcome, steps)] and the number of env steps taken.
+    from simulator import Simulator
+
+    agent = _worker['agent']
+    max_steps = _worker['max_steps']
+    simulators = [Simulator(**dict(_worker['simulator_kwargs'], headless=True, seed=seed, agent=agent))
+                  for seed in seeds]
+    states = np.stack([simulator.get_state() for simulator in simulators])
+    steps = np.zeros(len(seeds), dtype=np.int64)
+    outcomes = [None] * len(seeds)
+    active = list(range(len(seeds)))
+    while active:
+        actions = agent.get_actions(states[active])
+        still_active = []
+        for i, action in zip(active, actions.tolist()):
+            states[i], reward, done = simulators[i].step(action)
+            steps[i] += 1
+            if done:
+                outcomes[i] = GOAL if reward > 0 else COLLISION
+            elif steps[i] >= max_steps:
+                outcomes[i] = TIMEOUT
+            else:
+                still_active.append(i)
+        active = still_active
+    return [(seed, outcome, int(n)) for seed, outcome, n in zip(seeds, outcomes, steps)], int(steps.sum())
+
+
+def evaluate(checkpoint, simulator_kwargs=None, num_scenarios=1000, num_workers=None, max_steps=1000,
+             seed=0, chunk_size=None):
+    # Greedy evaluation of a saved DQNAgent on the headless scenarios seed .. seed +
+    # num_scenarios - 1, fanned out over a process pool (num_workers=0 runs in this process).
+    # A scenario's world and the greedy policy are both deterministic, so the same seeds give
+    # the same report. Returns success/collision/timeout rates, the steps-to-goal
+    # distribution of successful episodes, env steps/s and every episode's outcome.
+    simulator_kwargs = dict(DEFAULT_SIMULATOR_KWARGS if simulator_kwargs is None else simulator_kwargs)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    seeds = list(range(seed, seed + num_scenarios))
+    if chunk_size is None:
+        chunk_size = max(1, min(64, math.ceil(num_scenarios / (4 * max(num_workers, 1)))))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, num_scenarios, chunk_size)]
+
+    start = time.perf_counter()
+    if num_workers == 0:
+        _init_worker(checkpoint, simulator_kwargs, max_steps)
+        results = [_evaluate_seeds(chunk) for chunk in chunks]
+    else:
+        ctx = mp.get_context('spawn')
+        with ctx.Pool(num_workers, initializer=_init_worker,
+                      initargs=(checkpoint, simulator_kwargs, max_steps)) as pool:
+            results = list(pool.imap_unordered(_evaluate_seeds, chunks))
+    elapsed = time.perf_counter() - start
+
+    episodes = sorted(episode for chunk_episodes, _ in results for episode in chunk_episodes)
+    env_steps = sum(chunk_steps for _, chunk_steps in results)
+    return summarize(episodes, env_steps, elapsed)
+
+
+def summarize(episodes, env_steps, seconds):
+    outcomes = [outcome for _, outcome, _ in episodes]
+    count = max(len(episodes), 1)
+    to_goal = np.array([steps for _, outcome, steps in episodes if outcome == GOAL], dtype=np.float64)
+    if to_goal.size:
+        p50, p90, p99 = np.percentile(to_goal, [50, 90, 99]).tolist()
+        distribution = {'mean': float(to_goal.mean()), 'min': float(to_goal.min()), 'p50': p50,
+                        'p90': p90, 'p99': p99, 'max': float(to_goal.max())}
+    else:
+        distribution = None
+    return {
+        'scenarios': len(episodes),
+        'success_rate': outcomes.count(GOAL) / count,
+        'collision_rate': outcomes.count(COLLISION) / count,
+        'timeout_rate': outcomes.count(TIMEOUT) / count,
+        'steps_to_goal': distribution,
+        'env_steps': env_steps,
+        'seconds': seconds,
+        'env_steps_per_s': env_steps / seconds if seconds > 0 else float('inf'),
+        'episodes': episodes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a saved DQNAgent on seeded headless scenarios')
+    parser.add_argument('checkpoint', help='Model weights written by DQNAgent.save')
+    parser.add_argument('--scenarios', type=int, default=1000, help='Number of seeded scenarios')
+    parser.add_argument('--seed', type=int, default=0, help='First scenario seed')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU, 0: none)')
+    parser.add_argument('--max-steps', type=int, default=1000, help='Steps before an episode times out')
+    # The network shape follows these, so they must match the settings the agent was trained with
+    parser.add_argument('--observation', default='slam', help='Observation mode the agent was trained with')
+    parser.add_argument('--encoder', default='mlp', help='Grid encoder the agent was trained with (mlp or conv)')
+    parser.add_argument('--radar-spacing', type=float, default=5, help='Radar beam spacing in degrees')
+    parser.add_argument('--radar-beams', type=int, default=None, help='Number of radar beams (overrides the spacing)')
+    parser.add_argument('--num-obstacles', type=int, default=DEFAULT_SIMULATOR_KWARGS['num_obstacles'])
+    parser.add_argument('--output', help='Also write the full report (every episode) as JSON')
+    args = parser.parse_args(argv)
+
+    simulator_kwargs = dict(DEFAULT_SIMULATOR_KWARGS, observation=args.observation, encoder=args.encoder,
+                            radar_spacing=args.radar_spacing, radar_beams=args.radar_beams,
+                            num_obstacles=args.num_obstacles)
+    report = evaluate(args.checkpoint, simulator_kwargs, args.scenarios, args.workers, args.max_steps, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"scenarios       {report['scenarios']}")
+    print(f"success rate    {report['success_rate']:.1%}")
+    print(f"collision rate  {report['collision_rate']:.1%}")
+    print(f"timeout rate    {report['timeout_rate']:.1%}")
+    if report['steps_to_goal']:
+        print('steps to goal   ' + '  '.join(f"{k} {v:g}" for k, v in report['steps_to_goal'].items()))
+    print(f"env steps/s     {report['env_steps_per_s']:.0f} ({report['env_steps']} steps in {report['seconds']:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import pygame
+import profiling
 from simulator import Simulator
 
 def main():
@@ -13,20 +14,31 @@ def main():
     num_obstacles = 5
     mode = "ai"# ai or manual
     num_episodes = 10
+    headless = False  # True trains without a window (no rendering, no frame limiter)
+    render_every = 1  # Draw every N training steps, 0 disables rendering during training
+    observation = "slam"  # slam (full grid), local (patch around the car) or radar (beam ranges)
+    profile_path = None  # e.g. "profile.jsonl": time each phase of the loop and append a summary there
     pygame.init()
+    if profile_path:
+        profiler = profiling.enable()
     simulator = Simulator(width, height, car_speed, car_acceleration, car_deceleration, 
-                          radar_range, radar_angle, num_obstacles)
+                          radar_range, radar_angle, num_obstacles, headless=headless,
+                          observation=observation)
 
  
     if mode == "manual":
         simulator.run_manual()
     elif mode == "ai":
        
-        simulator.train(num_episodes)
+        simulator.train(num_episodes, render_every=render_every)
         simulator.run_trained_agent()
     else:
         print("Invalid mode selected. Exiting.")
 
+    if profile_path:
+        profiler.write_jsonl(profile_path)
+        profiling.disable()
+
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+import math
+import numpy as np
+from spatial_index import UniformGrid
+from obstacle import next_version
+from utils import obb_bounds, obb_aabb_overlap, rects_overlap
+
+BOUNCE, PATROL, RANDOM_WALK = range(3)
+BEHAVIOURS = {'bounce': BOUNCE, 'patrol': PATROL, 'random_walk': RANDOM_WALK}
+COLUMNS = ('x', 'y', 'w', 'h', 'vx', 'vy', 'start_x', 'start_y', 'end_x', 'end_y', 'phase', 'phase_step')
+
+
+class MovingObstacles:
+    # Moving rects held as a structure of arrays, so update() advances all of them with a
+    # handful of NumPy operations. Behaviours, per obstacle:
+    #   bounce      - constant velocity, reflected at the bounds
+    #   patrol      - back and forth between its spawn point and a second point
+    #   random_walk - velocity jittered every tick (capped at max_speed), reflected at the bounds
+    # Offers the same queries as ObstacleSet (rect_array, rects_within, rects_along,
+    # any_overlap, any_overlap_oriented, version), so Radar and collisions treat them alike.
+    # The grid index is updated incrementally: only movers that crossed a cell boundary are
+    # re-registered.
+    def __init__(self, bounds, max_speed=2.0, jitter=0.3, cell_size=64, seed=None):
+        self.bounds = tuple(bounds)  # (x, y, w, h) the movers stay inside
+        self.max_speed = max_speed
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+        self.index = UniformGrid(cell_size)
+        self.version = next_version()
+        self._rects = None
+        for name in COLUMNS:
+            setattr(self, name, np.zeros(0))
+        self.behaviour = np.zeros(0, dtype=np.int64)
+        self._cells = np.zeros((0, 4), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, x, y, w, h, vx, vy, behaviour='bounce', patrol_to=None):
+        # Appends movers; every argument is a scalar or one value per new mover. Patrol
+        # movers go back and forth between (x, y) and patrol_to (N, 2) at speed |(vx, vy)|.
+        x, y, w, h, vx, vy = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x, y, w, h, vx, vy)))
+        count = x.size
+        codes = np.broadcast_to(np.asarray([BEHAVIOURS[b] for b in np.atleast_1d(behaviour)]), (count,))
+        end = np.broadcast_to(np.asarray(patrol_to if patrol_to is not None else np.stack([x, y], -1),
+                                         dtype=np.float64), (count, 2))
+        length = np.hypot(end[:, 0] - x, end[:, 1] - y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phase_step = np.where(length > 0, np.hypot(vx, vy) / length, 0.0)
+
+        for name, values in (('x', x), ('y', y), ('w', w), ('h', h), ('vx', vx), ('vy', vy),
+                             ('start_x', x), ('start_y', y), ('end_x', end[:, 0]), ('end_y', end[:, 1]),
+                             ('phase', np.zeros(count)), ('phase_step', phase_step)):
+            setattr(self, name, np.concatenate([getattr(self, name), np.ravel(values)]))
+        self.behaviour = np.concatenate([self.behaviour, codes])
+
+        first = len(self) - count
+        self._cells = np.concatenate([self._cells, np.zeros((count, 4), dtype=np.int64)])
+        self._cells[first:] = self._cell_ranges()[first:]
+        for i in range(first, len(self)):
+            self.index.insert(i, self._rect(i))
+        self._changed()
+
+    def spawn(self, count, size=(15, 30), speed=(0.5, 2.0), behaviour='bounce', avoid=(), max_attempts=100):
+        # Random movers inside the bounds, away from the rects in avoid; with a random
+        # direction and speed, and patrol targets up to 200 px away
+        left, top, width, height = self.bounds
+        rng = self.rng
+        placed = 0
+        for _ in range(max_attempts):
+            if placed == count:
+                return
+            n = count - placed
+            side = rng.uniform(*size, n)
+            x = rng.uniform(left, left + width - side)
+            y = rng.uniform(top, top + height - side)
+            candidates = np.stack([x, y, side, side], -1)
+            ok = np.ones(n, dtype=bool)
+            for rect in avoid:
+                ok &= ~rects_overlap(candidates, np.asarray(tuple(rect), dtype=np.float64))
+            x, y, side = x[ok], y[ok], side[ok]
+            heading = rng.uniform(0, 2 * math.pi, x.size)
+            v = rng.uniform(*speed, x.size)
+            reach = rng.uniform(50, 200, x.size)
+            patrol_to = np.stack([np.clip(x + reach * np.cos(heading), left, left + width - side),
+                                  np.clip(y + reach * np.sin(heading), top, top + height - side)], -1)
+            self.add(x, y, side, side, v * np.cos(heading), v * np.sin(heading),
+                     behaviour=behaviour, patrol_to=patrol_to)
+            placed += x.size
+        if placed < count:
+            raise RuntimeError(f"Could only place {placed} of {count} moving obstacles")
+
+    def clear_area(self, rect, avoid=(), max_attempts=100):
+        # Moves every mover overlapping rect to a random spot inside the bounds, away from
+        # rect and the rects in avoid. Size, velocity and behaviour are kept; a patrol
+        # segment moves along with its mover. Returns how many movers were moved.
+        area = np.asarray(tuple(rect), dtype=np.float64)
+        pending = np.nonzero(rects_overlap(np.stack([self.x, self.y, self.w, self.h], -1), area))[0]
+        if not pending.size:
+            return 0
+        moved = pending
+        left, top, width, height = self.bounds
+        avoid = [area] + [np.asarray(tuple(r), dtype=np.float64) for r in avoid]
+        for _ in range(max_attempts):
+            w, h = self.w[pending], self.h[pending]
+            x = self.rng.uniform(left, left + width - w)
+            y = self.rng.uniform(top, top + height - h)
+            candidates = np.stack([x, y, w, h], -1)
+            ok = np.ones(pending.size, dtype=bool)
+            for a in avoid:
+                ok &= ~rects_overlap(candidates, a)
+            ids = pending[ok]
+            dx, dy = x[ok] - self.x[ids], y[ok] - self.y[ids]
+            self.x[ids] += dx
+            self.y[ids] += dy
+            self.start_x[ids] += dx
+            self.start_y[ids] += dy
+            self.end_x[ids] = np.clip(self.end_x[ids] + dx, left, left + width - self.w[ids])
+            self.end_y[ids] = np.clip(self.end_y[ids] + dy, top, top + height - self.h[ids])
+            pending = pending[~ok]
+            if not pending.size:
+                break
+        else:
+            raise RuntimeError(f"Could not move {pending.size} moving obstacles out of {tuple(rect)}")
+
+        for i in moved.tolist():
+            self.index.remove(i)
+            self.index.insert(i, self._rect(i))
+        self._cells = self._cell_ranges()
+        self._changed()
+        return moved.size
+
+    def _rect(self, i):
+        return self.x[i], self.y[i], self.w[i], self.h[i]
+
+    def _cell_ranges(self):
+        cs = self.index.cell_size
+        return np.stack([np.floor(self.x / cs), np.floor(self.y / cs),
+                         np.floor((self.x + self.w) / cs), np.floor((self.y + self.h) / cs)], -1).astype(np.int64)
+
+    def _changed(self):
+        self.version = next_version()
+        self._rects = None
+
+    def update(self, dt=1.0):
+        if not len(self):
+            return
+        left, top, width, height = self.bounds
+        walk = self.behaviour == RANDOM_WALK
+        patrol = self.behaviour == PATROL
+
+        if walk.any():
+            jitter = self.rng.normal(0, self.jitter * math.sqrt(dt), (2, len(self)))
+            vx = np.where(walk, self.vx + jitter[0], self.vx)
+            vy = np.where(walk, self.vy + jitter[1], self.vy)
+            scale = np.minimum(1, self.max_speed / np.maximum(np.hypot(vx, vy), 1e-12))
+            self.vx, self.vy = vx * np.where(walk, scale, 1), vy * np.where(walk, scale, 1)
+
+        # Free movers: integrate, then reflect position and velocity at the bounds
+        x = self.x + self.vx * dt
+        y = self.y + self.vy * dt
+        hi_x, hi_y = left + width - self.w, top + height - self.h
+        self.vx = np.where(x < left, np.abs(self.vx), np.where(x > hi_x, -np.abs(self.vx), self.vx))
+        self.vy = np.where(y < top, np.abs(self.vy), np.where(y > hi_y, -np.abs(self.vy), self.vy))
+        x = np.where(x < left, 2 * left - x, np.where(x > hi_x, 2 * hi_x - x, x))
+        y = np.where(y < top, 2 * top - y, np.where(y > hi_y, 2 * hi_y - y, y))
+
+        # Patrol movers: phase runs 0 -> 1 -> 0 along their segment
+        phase = self.phase + self.phase_step * dt
+        self.phase_step = np.where((phase > 1) | (phase < 0), -self.phase_step, self.phase_step)
+        self.phase = np.where(phase > 1, 2 - phase, np.abs(phase))
+        self.x = np.where(patrol, self.start_x + (self.end_x - self.start_x) * self.phase, x)
+        self.y = np.where(patrol, self.start_y + (self.end_y - self.start_y) * self.phase, y)
+
+        cells = self._cell_ranges()
+        for i in np.nonzero((cells != self._cells).any(axis=1))[0].tolist():
+            self.index.remove(i)
+            self.index.insert(i, self._rect(i))
+        self._cells = cells
+        self._changed()
+
+    def rect_array(self):
+        # (M, 4) rects, a new array after every update (never written in place)
+        if self._rects is None:
+            self._rects = np.stack([self.x, self.y, self.w, self.h], -1)
+        return self._rects
+
+    def rects_within(self, rect):
+        return self.rect_array()[sorted(self.index.query_rect(rect))]
+
+    def rects_along(self, origin, directions, max_range):
+        ids = set()
+        for direction in directions:
+            ids |= self.index.query_ray(origin, direction, max_range)
+        return self.rect_array()[sorted(ids)]
+
+    def any_overlap(self, rect):
+        ids = sorted(self.index.query_rect(rect))
+        rects = self.rect_array()[ids]
+        x, y, w, h = tuple(rect)
+        return bool(((rects[:, 0] < x + w) & (rects[:, 0] + rects[:, 2] > x) &
+                     (rects[:, 1] < y + h) & (rects[:, 1] + rects[:, 3] > y)).any())
+
+    def any_overlap_oriented(self, center, half_size, angle):
+        ids = self.index.query_rect(obb_bounds(center, half_size, angle))
+        if not ids:
+            return False
+        return bool(obb_aabb_overlap(center, half_size, angle, self.rect_array()[sorted(ids)]).any())
+
+    def snapshot(self):
+        state = {name: getattr(self, name).copy() for name in COLUMNS + ('behaviour',)}
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, snapshot):
+        for name, values in snapshot.items():
+            if name == 'rng':
+                self.rng.bit_generator.state = values
+            else:
+                setattr(self, name, values.copy())
+        self._cells = self._cell_ranges()
+        self.index.clear()
+        for i in range(len(self)):
+            self.index.insert(i, self._rect(i))
+        self._changed()
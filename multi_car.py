@@ -0,0 +1,245 @@
+from collections import namedtuple
+import numpy as np
+from car import CAR_SIZE, CAR_HALF_SIZE
+from obstacle import Obstacle, ObstacleSet, ObstacleLayers
+from moving_obstacles import MovingObstacles
+from observations import OBSERVATION_MODES
+from radar import Radar
+from spatial_index import sweep_pairs
+from utils import ray_aabb_distances, ray_obb_distances, obb_aabb_overlap, obb_obb_overlap, rects_overlap
+from vector_simulator import GOAL_SIZE, CarBatch
+
+# Candidate pairs from the broad phase, each a pair of index arrays:
+#   car_car          - (car, car) whose bounding boxes overlap
+#   car_obstacle     - (car, obstacle) whose bounding boxes overlap
+#   scanner_car      - (scanning car, other car) inside the bounds of the scanner's beams
+#   scanner_obstacle - (scanning car, obstacle) inside the bounds of the scanner's beams
+CandidatePairs = namedtuple('CandidatePairs', ['car_car', 'car_obstacle', 'scanner_car', 'scanner_obstacle'])
+
+
+class MultiCarWorld(CarBatch):
+    # Many cars driving in one shared world. Every car has its own action, reward, goal,
+    # SLAM grid and radar scan, and the radar sees the other cars as rotated boxes. Per-car
+    # quantities are arrays, so a tick is a handful of batched operations: all cars move
+    # together, one sort-and-sweep over the car boxes, the beam bounds and the obstacles
+    # finds every candidate pair, and exact tests resolve all pairs of a kind at once.
+    # Dynamics, rewards and the state layout are CarBatch's, shared with VectorSimulator.
+    def __init__(self, num_cars, width, height, car_speed, car_acceleration, car_deceleration,
+                 radar_range, radar_angle, num_obstacles, resolution=5, max_steps=1000, seed=None,
+                 observation="radar", radar_spacing=5, radar_beams=None, num_movers=0,
+                 mover_behaviour="bounce", max_attempts=1000):
+        if observation not in OBSERVATION_MODES:
+            raise ValueError(f"Unknown observation mode {observation!r}, expected one of {OBSERVATION_MODES}")
+        self.observation = observation
+        self.num_cars = num_cars
+        self.width = width
+        self.height = height
+        self.max_speed = car_speed
+        self.acceleration = car_acceleration
+        self.deceleration = car_deceleration
+        self.resolution = resolution
+        self.max_steps = max_steps
+        self.max_attempts = max_attempts
+        self.rng = np.random.default_rng(seed)
+        # One beam layout for every car, so all cars scan in one batch
+        self.radar = Radar(radar_range, radar_angle, radar_spacing, radar_beams)
+
+        self.grid_width = width // resolution
+        self.grid_height = height // resolution
+        # Per-car SLAM grids only when the observation reads them: with many cars in a large
+        # world they dominate memory and step time
+        grid_cars = num_cars if observation != "radar" else 0
+        self.grids = np.zeros((grid_cars, self.grid_height, self.grid_width), dtype=np.float32)
+
+        self.car_x = np.zeros(num_cars)
+        self.car_y = np.zeros(num_cars)
+        self.car_angle = np.zeros(num_cars)
+        self.car_speed = np.zeros(num_cars)
+        self.steps = np.zeros(num_cars, dtype=np.int64)
+        self.goals = np.zeros((num_cars, 4))
+
+        self.obstacles = ObstacleSet()
+        self._spawn_obstacles(num_obstacles)
+        self.movers = MovingObstacles((0, 0, width, height), seed=int(self.rng.integers(2 ** 32)))
+        self.movers.spawn(num_movers, behaviour=mover_behaviour, avoid=[o.rect for o in self.obstacles])
+        self.scene = ObstacleLayers(self.obstacles, self.movers)
+
+        all_cars = np.arange(num_cars)
+        self._place_cars(all_cars)
+        self._spawn_goals(all_cars)
+        self._last_distances = self.scan()
+
+    # CarBatch reads the beam layout from the shared radar
+    @property
+    def beam_offsets(self):
+        return self.radar.offsets
+
+    @property
+    def beam_table(self):
+        return self.radar.directions
+
+    @property
+    def radar_range(self):
+        return self.radar.range
+
+    def _spawn_obstacles(self, num_obstacles):
+        for _ in range(num_obstacles):
+            for _ in range(self.max_attempts):
+                size = int(self.rng.integers(20, 60 + 1))
+                x = int(self.rng.integers(0, self.width - size + 1))
+                y = int(self.rng.integers(0, self.height - size + 1))
+                obstacle = Obstacle(x, y, size, size)
+                if not self.obstacles.any_overlap(obstacle.rect):
+                    self.obstacles.append(obstacle)
+                    break
+            else:
+                raise RuntimeError(f"Could not place obstacle {len(self.obstacles) + 1} "
+                                   f"in {self.max_attempts} attempts")
+
+    def _place_cars(self, car_ids):
+        # Each car at a random spot, heading 0, clear of the obstacles and of every car
+        # already on the road (the cars not being placed, and those placed before it)
+        half_w, half_h = CAR_HALF_SIZE
+        placed = np.ones(self.num_cars, dtype=bool)
+        placed[car_ids] = False
+        bounds = self.car_bounds()
+        for i in np.asarray(car_ids).tolist():
+            for _ in range(self.max_attempts):
+                x = self.rng.uniform(half_w, self.width - half_w)
+                y = self.rng.uniform(half_h, self.height - half_h)
+                rect = (x - half_w, y - half_h, CAR_SIZE[0], CAR_SIZE[1])
+                if not self.scene.any_overlap(rect) and not rects_overlap(bounds[placed], np.array(rect)).any():
+                    break
+            else:
+                raise RuntimeError(f"Could not place car {i} in {self.max_attempts} attempts")
+            self.car_x[i], self.car_y[i] = x, y
+            self.car_angle[i] = 0
+            self.car_speed[i] = 0
+            self.steps[i] = 0
+            bounds[i] = rect
+            placed[i] = True
+
+    def _spawn_goals(self, car_ids):
+        for i in np.asarray(car_ids).tolist():
+            for _ in range(self.max_attempts):
+                x = int(self.rng.integers(50, self.width - 50 + 1))
+                y = int(self.rng.integers(50, self.height - 50 + 1))
+                if not self.obstacles.any_overlap((x, y, GOAL_SIZE, GOAL_SIZE)):
+                    self.goals[i] = x, y, GOAL_SIZE, GOAL_SIZE
+                    break
+            else:
+                raise RuntimeError(f"Could not place the goal of car {i} in {self.max_attempts} attempts")
+
+    def car_centers(self):
+        return np.stack([self.car_x, self.car_y], axis=-1)
+
+    def car_bounds(self):
+        # (N, 4) axis-aligned bounds of the rotated car boxes, like utils.obb_bounds
+        angle_rad = np.radians(self.car_angle)
+        c, s = np.abs(np.cos(angle_rad)), np.abs(np.sin(angle_rad))
+        half_w, half_h = CAR_HALF_SIZE
+        extent_x = half_w * c + half_h * s
+        extent_y = half_w * s + half_h * c
+        return np.stack([self.car_x - extent_x, self.car_y - extent_y, 2 * extent_x, 2 * extent_y], axis=-1)
+
+    def candidate_pairs(self, directions=None):
+        # Broad phase: one sort-and-sweep over [car boxes | beam bounds | obstacle rects].
+        # Cost grows with the number of overlapping boxes, not with the number of car pairs.
+        if directions is None:
+            directions = self.beam_directions()
+        n = self.num_cars
+        origins = self.car_centers()
+        ends = origins[:, None] + self.radar.range * directions
+        lo = np.minimum(ends.min(axis=1), origins)
+        hi = np.maximum(ends.max(axis=1), origins)
+        boxes = np.concatenate([self.car_bounds(), np.concatenate([lo, hi - lo], axis=-1),
+                                self.scene.rect_array()])
+        i, j = sweep_pairs(boxes)  # i < j, so cars come first, then beams, then obstacles
+
+        car_car = j < n
+        car_obstacle = (i < n) & (j >= 2 * n)
+        scanner_car = (i < n) & (j >= n) & (j < 2 * n) & (j - n != i)
+        scanner_obstacle = (i >= n) & (i < 2 * n) & (j >= 2 * n)
+        return CandidatePairs((i[car_car], j[car_car]),
+                              (i[car_obstacle], j[car_obstacle] - 2 * n),
+                              (j[scanner_car] - n, i[scanner_car]),
+                              (i[scanner_obstacle] - n, j[scanner_obstacle] - 2 * n))
+
+    def collisions(self, pairs=None):
+        # Narrow phase: exact rotated-box tests on the candidate pairs only. Returns (N,)
+        # booleans (hit another car, hit an obstacle).
+        if pairs is None:
+            pairs = self.candidate_pairs()
+        centers = self.car_centers()
+        hit_car = np.zeros(self.num_cars, dtype=bool)
+        a, b = pairs.car_car
+        overlap = obb_obb_overlap(centers[a], CAR_HALF_SIZE, self.car_angle[a],
+                                  centers[b], CAR_HALF_SIZE, self.car_angle[b])
+        hit_car[a[overlap]] = True
+        hit_car[b[overlap]] = True
+
+        hit_obstacle = np.zeros(self.num_cars, dtype=bool)
+        cars, obstacles = pairs.car_obstacle
+        rects = self.scene.rect_array()[obstacles][:, None]
+        hit_obstacle[cars[obb_aabb_overlap(centers[cars], CAR_HALF_SIZE, self.car_angle[cars], rects)[:, 0]]] = True
+        return hit_car, hit_obstacle
+
+    def scan(self, pairs=None, directions=None):
+        # (N, B) distance to the nearest obstacle or other car along each beam, np.inf
+        # where nothing is in range. Each candidate pair is one batched slab test.
+        if directions is None:
+            directions = self.beam_directions()
+        if pairs is None:
+            pairs = self.candidate_pairs(directions)
+        max_range = self.radar.range
+        origins = self.car_centers()
+        distances = np.full((self.num_cars, self.radar.num_beams), np.inf)
+
+        scanners, cars = pairs.scanner_car
+        if scanners.size:
+            hits = ray_obb_distances(origins[scanners], directions[scanners], origins[cars][:, None],
+                                     CAR_HALF_SIZE, self.car_angle[cars][:, None], max_range)
+            np.minimum.at(distances, scanners, hits[..., 0])
+        scanners, obstacles = pairs.scanner_obstacle
+        if scanners.size:
+            rects = self.scene.rect_array()[obstacles][:, None]
+            hits = ray_aabb_distances(origins[scanners], directions[scanners], rects, max_range)
+            np.minimum.at(distances, scanners, hits)
+        return distances
+
+    def reset(self):
+        all_cars = np.arange(self.num_cars)
+        self._place_cars(all_cars)
+        self._spawn_goals(all_cars)
+        self.grids[:] = 0
+        self._last_distances = self.scan()
+        self._update_slam(self._last_distances)
+        return self.get_states()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        self.movers.update()
+        self._move_cars(actions)
+        self.steps += 1
+
+        directions = self.beam_directions()
+        pairs = self.candidate_pairs(directions)
+        hit_car, hit_obstacle = self.collisions(pairs)
+        goal_reached = obb_aabb_overlap(self.car_centers(), CAR_HALF_SIZE, self.car_angle, self.goals[:, None])[:, 0]
+
+        rewards, dones, truncated = self._outcomes(hit_car | hit_obstacle, goal_reached)
+
+        # Finished cars (done or truncated) start a new episode right away at a free spot, as
+        # in VectorSimulator. Both cars of a crash are done, so neither is left overlapping.
+        done_ids = np.nonzero(dones | truncated)[0]
+        if done_ids.size:
+            self._place_cars(done_ids)
+            self._spawn_goals(done_ids)
+            if len(self.grids):
+                self.grids[done_ids] = 0
+            directions = self.beam_directions()
+            pairs = self.candidate_pairs(directions)
+
+        self._last_distances = self.scan(pairs, directions)
+        self._update_slam(self._last_distances)
+        return self.get_states(), rewards, dones, truncated
@@ -0,0 +1,38 @@
+import numpy as np
+
+# Observation modes for Simulator / VectorSimulator. Every mode ends with the same 6 car and
+# goal features; they differ in what describes the surroundings:
+#   'slam'  - the whole SLAM grid, flattened (the original state, 19,200 values at 800x600)
+#   'local' - a patch of the SLAM grid centred on the car, max-pooled (256 values by default)
+#   'radar' - the radar range of every beam, normalised to [0, 1] (1 = nothing in range)
+OBSERVATION_MODES = ('slam', 'local', 'radar')
+LOCAL_PATCH_CELLS = 32  # Side of the cropped patch, in grid cells
+LOCAL_PATCH_STRIDE = 2  # Max-pooling factor applied to the crop
+
+
+def local_patch_shape(cells=LOCAL_PATCH_CELLS, stride=LOCAL_PATCH_STRIDE):
+    return cells // stride, cells // stride
+
+
+def local_patches(grids, car_x, car_y, resolution, cells=LOCAL_PATCH_CELLS, stride=LOCAL_PATCH_STRIDE):
+    # grids: (N, H, W), car_x/car_y: (N,) world coordinates. Returns (N, cells // stride,
+    # cells // stride) axis-aligned crops around each car; cells outside the map read as
+    # unknown (0). Pooling keeps the strongest evidence per block: any occupied cell wins,
+    # otherwise the most confidently free one.
+    num, height, width = grids.shape
+    offsets = np.arange(cells) - cells // 2
+    rows = (np.asarray(car_y) // resolution).astype(np.int64)[:, None] + offsets
+    cols = (np.asarray(car_x) // resolution).astype(np.int64)[:, None] + offsets
+    inside = ((rows >= 0) & (rows < height))[:, :, None] & ((cols >= 0) & (cols < width))[:, None, :]
+    patch = grids[np.arange(num)[:, None, None],
+                  np.clip(rows, 0, height - 1)[:, :, None],
+                  np.clip(cols, 0, width - 1)[:, None, :]]
+    patch = np.where(inside, patch, 0).astype(np.float32)
+    pooled = cells // stride
+    blocks = patch.reshape(num, pooled, stride, pooled, stride)
+    occupied = blocks.max(axis=(2, 4))
+    return np.where(occupied > 0, occupied, np.minimum(blocks.min(axis=(2, 4)), 0))
+
+
+def normalized_ranges(distances, max_range):
+    return np.minimum(np.asarray(distances) / max_range, 1.0).astype(np.float32)
@@ -1,8 +1,161 @@
+import itertools
 import pygame
+import numpy as np
+from spatial_index import UniformGrid
+from utils import obb_bounds, obb_aabb_overlap
 
 class Obstacle:
     def __init__(self, x, y, width, height):
         self.rect = pygame.Rect(x, y, width, height)
 
     def draw(self, screen):
-        pygame.draw.rect(screen, (0, 0, 0), self.rect)
\ No newline at end of file
+        pygame.draw.rect(screen, (0, 0, 0), self.rect)
+
+
+_versions = itertools.count()
+
+
+def next_version():
+    # Versions are unique across all obstacle containers, so a version identifies contents
+    return next(_versions)
+
+
+class ObstacleSet(list):
+    # A list of obstacles that keeps a UniformGrid index in sync with its contents.
+    # Appends are indexed incrementally; every other mutation (remove, insert, item
+    # assignment, sort, reverse, *=) shifts list positions and rebuilds the index.
+    # Obstacle rects must not be moved in place.
+    # `version` changes on every mutation and is unique across sets, so it identifies contents.
+    def __init__(self, obstacles=(), cell_size=64):
+        super().__init__()
+        self.index = UniformGrid(cell_size)
+        self.version = next_version()
+        self._rects = None
+        self.extend(obstacles)
+
+    def _changed(self):
+        self.version = next_version()
+        self._rects = None
+
+    def _reindex(self):
+        self.index.clear()
+        for i, obstacle in enumerate(self):
+            self.index.insert(i, obstacle.rect)
+        self._changed()
+
+    def append(self, obstacle):
+        super().append(obstacle)
+        self.index.insert(len(self) - 1, obstacle.rect)
+        self._changed()
+
+    def extend(self, obstacles):
+        for obstacle in obstacles:
+            self.append(obstacle)
+
+    def __iadd__(self, obstacles):
+        self.extend(obstacles)
+        return self
+
+    def clear(self):
+        super().clear()
+        self.index.clear()
+        self._changed()
+
+    def pop(self, i=-1):
+        obstacle = super().pop(i)
+        self._reindex()
+        return obstacle
+
+    def insert(self, i, obstacle):
+        super().insert(i, obstacle)
+        self._reindex()
+
+    def remove(self, obstacle):
+        super().remove(obstacle)
+        self._reindex()
+
+    def __setitem__(self, i, value):
+        super().__setitem__(i, value)
+        self._reindex()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._reindex()
+
+    def sort(self, *, key=None, reverse=False):
+        super().sort(key=key, reverse=reverse)
+        self._reindex()
+
+    def reverse(self):
+        super().reverse()
+        self._reindex()
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._reindex()
+        return self
+
+    def rect_array(self):
+        # (M, 4) float array of all obstacle rects, cached until the set changes
+        if self._rects is None:
+            self._rects = np.array([obstacle.rect for obstacle in self], dtype=np.float64).reshape(-1, 4)
+        return self._rects
+
+    def overlapping(self, rect):
+        return [self[i] for i in self.index.query_rect(rect) if self[i].rect.colliderect(rect)]
+
+    def any_overlap(self, rect):
+        return any(self[i].rect.colliderect(rect) for i in self.index.query_rect(rect))
+
+    def any_overlap_oriented(self, center, half_size, angle):
+        # Rotated box: the grid prunes to obstacles near its bounds, then an exact SAT test
+        ids = self.index.query_rect(obb_bounds(center, half_size, angle))
+        if not ids:
+            return False
+        return bool(obb_aabb_overlap(center, half_size, angle, self.rect_array()[sorted(ids)]).any())
+
+    def rects_within(self, rect):
+        # Rects of the obstacles in the grid cells covered by rect
+        return self.rect_array()[sorted(self.index.query_rect(rect))]
+
+    def rects_along(self, origin, directions, max_range):
+        # Rects of the obstacles in the grid cells crossed by any of the rays
+        ids = set()
+        for direction in directions:
+            ids |= self.index.query_ray(origin, direction, max_range)
+        return self.rect_array()[sorted(ids)]
+
+
+class ObstacleLayers:
+    # Several obstacle containers (e.g. a static ObstacleSet and MovingObstacles) queried
+    # as one. The version is the tuple of the layers' versions.
+    def __init__(self, *layers):
+        self.layers = layers
+        self._rects = None
+        self._rects_version = None
+
+    @property
+    def version(self):
+        return tuple(layer.version for layer in self.layers)
+
+    def __len__(self):
+        return sum(len(layer) for layer in self.layers)
+
+    def rect_array(self):
+        version = self.version
+        if self._rects_version != version:
+            self._rects = np.concatenate([layer.rect_array() for layer in self.layers])
+            self._rects_version = version
+        return self._rects
+
+    def rects_within(self, rect):
+        return np.concatenate([layer.rects_within(rect) for layer in self.layers])
+
+    def rects_along(self, origin, directions, max_range):
+        return np.concatenate([layer.rects_along(origin, directions, max_range) for layer in self.layers])
+
+    def any_overlap(self, rect):
+        return any(layer.any_overlap(rect) for layer in self.layers)
+
+    def any_overlap_oriented(self, center, half_size, angle):
+        return any(layer.any_overlap_oriented(center, half_size, angle) for layer in self.layers)
@@ -0,0 +1,231 @@
+import importlib.abc
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in timing of the simulation loop. enable() wraps the methods below with timers and
+# disable() puts the originals back, so a disabled profiler costs nothing at all. Modules
+# not imported yet are instrumented when they are first imported, so enabling the profiler
+# never imports one itself (dqn_agent would pull in torch for manual driving).
+#
+#   profiler = profiling.enable()
+#   simulator.train(10)
+#   profiler.write_jsonl("profile.jsonl")
+#   profiling.disable()
+INSTRUMENTED = [
+    # (module, class, method, phase name)
+    ('simulator', 'Simulator', 'step', 'simulator.step'),
+    ('simulator', 'Simulator', 'update_display', 'simulator.update_display'),
+    ('simulator', 'Simulator', 'draw_frame', 'simulator.draw_frame'),
+    ('simulator', 'Simulator', 'get_state', 'simulator.get_state'),
+    ('radar', 'Radar', 'scan', 'radar.scan'),
+    ('radar', 'Radar', 'scan_ranges', 'radar.scan_ranges'),
+    ('slam_map', 'SlamMap', 'update', 'slam_map.update'),
+    ('slam_map', 'SlamMap', 'update_ranges', 'slam_map.update_ranges'),
+    ('slam_map', 'SlamMap', 'draw', 'slam_map.draw'),
+    ('dqn_agent', 'DQNAgent', 'train', 'agent.train'),
+    ('dqn_agent', 'DQNAgent', 'get_action', 'agent.get_action'),
+    ('dqn_agent', 'DQNAgent', 'get_actions', 'agent.get_actions'),
+]
+STEP_PHASE = 'simulator.step'
+TRAIN_PHASE = 'agent.train'
+
+_originals = {}
+_active = None
+
+
+class Histogram:
+    # Wall times in log-spaced buckets (20 per decade from 1 us to 100 s), so p50/p99 are
+    # estimated within ~6% with constant memory however many samples are recorded.
+    BUCKETS_PER_DECADE = 20
+    MIN_SECONDS = 1e-6
+    NUM_BUCKETS = 8 * BUCKETS_PER_DECADE + 1
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(int(math.log10(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DECADE) + 1,
+                         self.NUM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # Geometric midpoint of the bucket, never above the largest sample
+                upper = self.MIN_SECONDS * 10 ** (bucket / self.BUCKETS_PER_DECADE)
+                return min(upper * 10 ** (-0.5 / self.BUCKETS_PER_DECADE), self.max)
+        return self.max
+
+
+class Profiler:
+    # Safe to share between threads: with run_rendered the simulation thread records step
+    # and get_state while the main thread records draw_frame, so every update and read of
+    # the histograms holds the lock.
+    def __init__(self):
+        self.histograms = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.started = time.perf_counter()
+
+    def record(self, phase, seconds):
+        with self._lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = Histogram()
+            histogram.add(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            phases = {}
+            for name, histogram in sorted(self.histograms.items()):
+                phases[name] = {
+                    'count': histogram.count,
+                    'total_s': histogram.total,
+                    'mean_s': histogram.total / histogram.count,
+                    'p50_s': histogram.percentile(0.5),
+                    'p99_s': histogram.percentile(0.99),
+                    'max_s': histogram.max,
+                }
+
+        def rate(phase):
+            return phases[phase]['count'] / elapsed if phase in phases and elapsed > 0 else 0.0
+
+        return {
+            'timestamp': time.time(),
+            'elapsed_s': elapsed,
+            'steps_per_s': rate(STEP_PHASE),
+            'train_steps_per_s': rate(TRAIN_PHASE),
+            'phases': phases,
+        }
+
+    def write_jsonl(self, path):
+        # Appends one summary line per call, so periodic calls build a time series
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.summary()) + '\n')
+
+    def write_prometheus(self, path):
+        # Text exposition format, written atomically for node_exporter's textfile collector
+        summary = self.summary()
+        lines = ['# HELP sim_phase_seconds Wall time per call of an instrumented phase.',
+                 '# TYPE sim_phase_seconds summary']
+        for name, stats in summary['phases'].items():
+            lines.append(f'sim_phase_seconds{{phase="{name}",quantile="0.5"}} {stats["p50_s"]:.9g}')
+            lines.append(f'sim_phase_seconds{{phase="{name}",quantile="0.99"}} {stats["p99_s"]:.9g}')
+            lines.append(f'sim_phase_seconds_sum{{phase="{name}"}} {stats["total_s"]:.9g}')
+            lines.append(f'sim_phase_seconds_count{{phase="{name}"}} {stats["count"]}')
+        lines += ['# HELP sim_steps_per_second Simulator.step calls per second.',
+                  '# TYPE sim_steps_per_second gauge',
+                  f'sim_steps_per_second {summary["steps_per_s"]:.9g}',
+                  '# HELP sim_train_steps_per_second DQNAgent.train calls per second.',
+                  '# TYPE sim_train_steps_per_second gauge',
+                  f'sim_train_steps_per_second {summary["train_steps_per_s"]:.9g}']
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+def _timed(method, phase, profiler):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profiler.record(phase, time.perf_counter() - start)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    wrapper.__wrapped__ = method
+    return wrapper
+
+
+def _instrument(module):
+    for module_name, class_name, method_name, phase in INSTRUMENTED:
+        if module_name == module.__name__:
+            cls = getattr(module, class_name)
+            original = cls.__dict__[method_name]
+            _originals[(cls, method_name)] = original
+            setattr(cls, method_name, _timed(original, phase, _active))
+
+
+class _InstrumentOnImport(importlib.abc.MetaPathFinder):
+    # Finds instrumented modules through the other finders and instruments them right
+    # after they have been executed
+    def find_spec(self, name, path, target=None):
+        if not any(name == module_name for module_name, *_ in INSTRUMENTED):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        exec_module = spec.loader.exec_module
+
+        def exec_and_instrument(module):
+            exec_module(module)
+            if _active is not None:
+                _instrument(module)
+        spec.loader.exec_module = exec_and_instrument
+        return spec
+
+
+_finder = _InstrumentOnImport()
+
+
+def enable(profiler=None):
+    global _active
+    disable()
+    _active = profiler or Profiler()
+    for module_name in dict.fromkeys(module_name for module_name, *_ in INSTRUMENTED):
+        if module_name in sys.modules:
+            _instrument(sys.modules[module_name])
+    sys.meta_path.insert(0, _finder)
+    return _active
+
+
+def disable():
+    global _active
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    for (cls, method_name), original in _originals.items():
+        setattr(cls, method_name, original)
+    _originals.clear()
+    _active = None
+
+
+def active_profiler():
+    return _active
@@ -1,42 +1,115 @@
 import pygame
 import math
-from utils import line_rectangle_intersection
+import numpy as np
+from utils import ray_aabb_distances, rotate_directions
+
+def beam_offsets(angle, spacing=5, num_beams=None):
+    # Beam directions relative to the heading, in degrees, centred on the heading. With
+    # num_beams they are spread evenly over the field of view [-angle/2, angle/2] (a single
+    # beam points straight ahead); otherwise as many beams as fit `spacing` apart are
+    # centred in it. A full circle leaves out the endpoint, which would repeat the first beam.
+    full_circle = angle >= 360
+    if full_circle:
+        if num_beams is None:
+            num_beams = max(int(round(angle / spacing)), 1)
+        # Evenly around the circle with one beam straight ahead, sorted from -angle/2
+        offsets = np.arange(num_beams) * (angle / num_beams)
+        return np.sort((offsets + angle / 2) % angle - angle / 2)
+    if num_beams is None:
+        num_beams = int(np.floor(angle / spacing + 1e-9)) + 1
+    elif num_beams > 1:
+        spacing = angle / (num_beams - 1)
+    return (np.arange(num_beams) - (num_beams - 1) / 2) * spacing
+
 
 class Radar:
-    def __init__(self, range, angle):
+    def __init__(self, range, angle, spacing=5, num_beams=None):
         self.range = range
+        self.index_threshold = 64  # Below this many obstacles a brute-force scan is cheaper
+        self.ray_query_beams = 4  # Up to this many beams the grid is walked along each beam
+        # Last scan, keyed on the car pose and the obstacles' version: step, get_state and
+        # both radar views of one tick share it. Plain obstacle lists are never cached.
+        self._cache_key = None
+        self._cache = None
+        self.computed_scans = 0
+        self._config = 0
+        self.configure(angle, spacing, num_beams)
+
+    def configure(self, angle, spacing=5, num_beams=None):
+        # Field of view and beam layout. Unit directions are tabulated once here and only
+        # rotated by the heading on each scan (screen coordinates: y points down).
         self.angle = angle
+        self.offsets = beam_offsets(angle, spacing, num_beams)
+        offsets_rad = np.radians(self.offsets)
+        self.directions = np.stack([np.cos(offsets_rad), -np.sin(offsets_rad)], axis=-1)
+        self._config += 1
+
+    @property
+    def num_beams(self):
+        return len(self.offsets)
+
+    def beam_angles(self, car):
+        return car.angle + self.offsets
+
+    def beam_directions(self, car):
+        # The direction table rotated by the heading, no trig per beam
+        return rotate_directions(self.directions, car.angle)
+
+    def _key(self, car, obstacles):
+        if not hasattr(obstacles, 'version'):
+            return None
+        return car.x, car.y, car.angle, self.range, self._config, obstacles.version
+
+    def scan_ranges(self, car, obstacles):
+        # (relative angles, distances), cached until the car or the obstacles change; the
+        # returned arrays are read-only because every consumer of the tick shares them
+        key = self._key(car, obstacles)
+        if key is None or key != self._cache_key:
+            rel_angles, distances = self._compute_ranges(car, obstacles)
+            rel_angles.setflags(write=False)
+            distances.setflags(write=False)
+            self._cache = (rel_angles, distances), None
+            self._cache_key = key
+        return self._cache[0]
+
+    def _compute_ranges(self, car, obstacles):
+        # Distance to the nearest obstacle for every beam (np.inf if none within range),
+        # computed for all beam x obstacle pairs in one array operation
+        self.computed_scans += 1
+        directions = self.beam_directions(car)
+        if hasattr(obstacles, 'rect_array'):
+            # ObstacleSet, MovingObstacles or ObstacleLayers
+            if len(obstacles) <= self.index_threshold:
+                rects = obstacles.rect_array()
+            elif self.num_beams <= self.ray_query_beams:
+                # Only test obstacles in grid cells the beams actually cross
+                rects = obstacles.rects_along(car.center, directions, self.range)
+            else:
+                # More beams: one query over the bounds of all beam segments instead of
+                # walking the grid once per beam
+                ends = np.asarray(car.center) + self.range * directions
+                lo = np.minimum(ends.min(axis=0), car.center)
+                hi = np.maximum(ends.max(axis=0), car.center)
+                rects = obstacles.rects_within((lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1]))
+        else:
+            rects = np.array([obstacle.rect for obstacle in obstacles], dtype=np.float64).reshape(-1, 4)
+        distances = ray_aabb_distances(car.center, directions, rects, self.range)
+        return self.offsets.copy(), distances
 
     def scan(self, car, obstacles):
-        detections = []
-        car_center = car.rect.center
-        start_angle = car.angle - self.angle / 2
-        end_angle = car.angle + self.angle / 2
-
-        for angle in range(int(start_angle), int(end_angle) + 1, 5):  # 5 degree steps
-            angle_rad = math.radians(angle)
-            end_x = car_center[0] + self.range * math.cos(angle_rad)
-            end_y = car_center[1] - self.range * math.sin(angle_rad)
-            
-            for obstacle in obstacles:
-                intersection = line_rectangle_intersection(car_center, (end_x, end_y), obstacle.rect)
-                if intersection:
-                    distance = math.sqrt((intersection[0] - car_center[0])**2 + (intersection[1] - car_center[1])**2)
-                    detections.append((distance, angle - car.angle))
-                    break
-
-        return detections
+        # (distance, relative angle) of every hit
+        rel_angles, distances = self.scan_ranges(car, obstacles)
+        ranges, detections = self._cache
+        if detections is None or self._key(car, obstacles) is None:
+            hits = np.isfinite(distances)
+            detections = list(zip(distances[hits].tolist(), rel_angles[hits].tolist()))
+            self._cache = ranges, detections
+        return list(detections)
 
     def draw(self, screen, car, detections):
-        car_center = car.rect.center
-        start_angle = car.angle - self.angle / 2
-        end_angle = car.angle + self.angle / 2
-
-        for angle in range(int(start_angle), int(end_angle) + 1, 5):
-            angle_rad = math.radians(angle)
-            end_x = car_center[0] + self.range * math.cos(angle_rad)
-            end_y = car_center[1] - self.range * math.sin(angle_rad)
-            pygame.draw.line(screen, (0, 255, 0), car_center, (end_x, end_y), 1)
+        car_center = car.center
+        for end in (np.asarray(car_center) + self.range * self.beam_directions(car)).tolist():
+            pygame.draw.line(screen, (0, 255, 0), car_center, end, 1)
 
         for detection in detections:
             distance, rel_angle = detection
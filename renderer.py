@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import namedtuple
+
+# Immutable view of one simulation tick: everything the renderer needs, nothing it can
+# mutate. The SLAM grid is a copy; the obstacle array is replaced, never written, when
+# the obstacles change.
+Pose = namedtuple('Pose', ['center', 'angle', 'speed'])
+Frame = namedtuple('Frame', ['tick', 'car', 'goal', 'obstacles', 'detections', 'slam_grid'])
+
+
+class FrameMailbox:
+    # Single-slot, latest-wins hand-off from the simulation thread to the renderer.
+    # publish() never waits for the renderer; frames it did not get to are dropped.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self.closed = False
+        self.dropped = 0
+
+    def publish(self, frame):
+        with self._condition:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        # Newest unseen frame, or None on timeout / once closed and drained
+        with self._condition:
+            self._condition.wait_for(lambda: self._frame is not None or self.closed, timeout)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class SimulationThread(threading.Thread):
+    # Calls advance() at a fixed rate (ticks per second, 0 = as fast as possible) and
+    # publishes make_frame() after every tick. advance() returns False after its last tick.
+    # A tick that overruns restarts the schedule instead of bursting to catch up.
+    def __init__(self, advance, make_frame, mailbox, rate=60):
+        super().__init__(daemon=True)
+        self.advance = advance
+        self.make_frame = make_frame
+        self.mailbox = mailbox
+        self.rate = rate
+        self.ticks = 0
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        period = 1 / self.rate if self.rate else 0
+        next_tick = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                running = self.advance()
+                self.ticks += 1
+                self.mailbox.publish(self.make_frame(self.ticks))
+                if not running:
+                    break
+                if period:
+                    next_tick += period
+                    delay = next_tick - time.perf_counter()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        next_tick = time.perf_counter()
+        except BaseException as error:
+            self.error = error  # Re-raised by the thread that joins us
+        finally:
+            self.mailbox.close()
@@ -0,0 +1,243 @@
+import json
+import os
+import numpy as np
+
+
+class ReplayBuffer:
+    # Preallocated ring buffer of transitions in contiguous NumPy arrays.
+    #
+    # Slot i holds one state. If valid[i], slot i is also the start of a transition whose
+    # action/reward/done live at i and whose next state is the state in slot i + 1, so a
+    # continuing episode stores every state once. When a new transition does not start from
+    # the previous next_state (episode boundary), that next_state keeps its own slot.
+    #
+    # The first `quantized_dim` state entries (the SLAM grid, multiples of 1 / quant_scale
+    # in [quant_min, quant_min + 255 / quant_scale]) are stored as uint8, the remaining
+    # features as float32.
+    #
+    # With `path`, the arrays are np.memmap'd .npy files in that directory plus a small
+    # index.json, so capacity is bounded by disk rather than RAM and an existing buffer at
+    # `path` is reopened with its experience intact. The index is written by flush(), which
+    # runs every `flush_every` adds.
+    def __init__(self, capacity, state_dim, quantized_dim=0, quant_scale=5, quant_min=-1.0, seed=None,
+                 path=None, flush_every=1000):
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.quantized_dim = quantized_dim
+        self.quant_scale = quant_scale
+        self.quant_min = quant_min
+        self.rng = np.random.default_rng(seed)
+        self.path = path
+        self.flush_every = flush_every
+
+        self.pos = 0  # Slot holding the most recent next_state
+        self.size = 0  # Number of slots written so far (<= capacity)
+        self.num_valid = 0
+        self._pending = False  # Whether slot `pos` holds the next_state of the latest transition
+        self._last_next_state = None
+        self._adds_since_flush = 0
+
+        resume = path is not None and os.path.exists(self._index_file())
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        self.quantized = self._allocate('quantized', (capacity, quantized_dim), np.uint8, resume)
+        self.features = self._allocate('features', (capacity, state_dim - quantized_dim), np.float32, resume)
+        self.actions = self._allocate('actions', (capacity,), np.int64, resume)
+        self.rewards = self._allocate('rewards', (capacity,), np.float32, resume)
+        self.dones = self._allocate('dones', (capacity,), np.float32, resume)
+        self.valid = self._allocate('valid', (capacity,), np.bool_, resume)
+        if resume:
+            self._load_index()
+
+    def _index_file(self):
+        return os.path.join(self.path, 'index.json')
+
+    def _allocate(self, name, shape, dtype, resume):
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        filename = os.path.join(self.path, name + '.npy')
+        if not resume:
+            return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        array = np.lib.format.open_memmap(filename, mode='r+')
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError(f"Replay file {filename} holds {array.dtype}{array.shape}, "
+                             f"expected {np.dtype(dtype)}{shape}")
+        return array
+
+    def _load_index(self):
+        with open(self._index_file()) as f:
+            index = json.load(f)
+        if (index['quant_scale'], index['quant_min']) != (self.quant_scale, self.quant_min):
+            raise ValueError(f"Replay buffer at {self.path} was written with quant_scale={index['quant_scale']}, "
+                             f"quant_min={index['quant_min']}")
+        self.pos = index['pos']
+        self.size = index['size']
+        self._pending = index['pending']
+        # Arrays may have been flushed after the index: slot pos only ever holds a next_state
+        self.valid[self.pos] = False
+        self.num_valid = int(np.count_nonzero(self.valid[:self.size]))
+
+    def flush(self):
+        if self.path is None:
+            return
+        for array in (self.quantized, self.features, self.actions, self.rewards, self.dones, self.valid):
+            array.flush()
+        index = {'pos': self.pos, 'size': self.size, 'pending': self._pending,
+                 'quant_scale': self.quant_scale, 'quant_min': self.quant_min}
+        tmp_file = self._index_file() + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self._index_file())
+        self._adds_since_flush = 0
+
+    def __len__(self):
+        return self.num_valid
+
+    def _quantize(self, state):
+        return np.rint((state[:self.quantized_dim] - self.quant_min) * self.quant_scale).astype(np.uint8)
+
+    def _write_state(self, slot, state):
+        state = np.asarray(state)
+        if self.valid[slot]:
+            # Overwriting the oldest slot drops the transition starting there
+            self._set_valid(slot, False)
+        self.quantized[slot] = self._quantize(state)
+        self.features[slot] = state[self.quantized_dim:]
+        self.size = max(self.size, slot + 1)
+
+    def _set_valid(self, slot, valid):
+        self.valid[slot] = valid
+        self.num_valid += 1 if valid else -1
+
+    def _holds_state(self, slot, state):
+        state = np.asarray(state)
+        return (np.array_equal(self.quantized[slot], self._quantize(state)) and
+                np.array_equal(self.features[slot], state[self.quantized_dim:].astype(np.float32)))
+
+    def add(self, state, action, reward, next_state, done):
+        if not self._pending:
+            self._write_state(self.pos, state)
+        elif state is not self._last_next_state and not self._holds_state(self.pos, state):
+            self.pos = (self.pos + 1) % self.capacity
+            self._write_state(self.pos, state)
+
+        i = self.pos
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+
+        self.pos = (i + 1) % self.capacity
+        self._write_state(self.pos, next_state)
+        self._set_valid(i, True)
+        self._pending = True
+        self._last_next_state = next_state
+
+        if self.path is not None:
+            self._adds_since_flush += 1
+            if self._adds_since_flush >= self.flush_every:
+                self.flush()
+
+    def _read_states(self, slots):
+        states = np.empty((len(slots), self.state_dim), dtype=np.float32)
+        quantized = states[:, :self.quantized_dim]
+        np.multiply(self.quantized[slots], np.float32(1 / self.quant_scale), out=quantized)
+        quantized += np.float32(self.quant_min)
+        states[:, self.quantized_dim:] = self.features[slots]
+        return states
+
+    def sample(self, batch_size):
+        # Uniform over valid transitions (with replacement); frame-only slots are redrawn
+        slots = self.rng.integers(0, self.size, batch_size)
+        invalid = ~self.valid[slots]
+        while invalid.any():
+            slots[invalid] = self.rng.integers(0, self.size, invalid.sum())
+            invalid = ~self.valid[slots]
+
+        next_slots = (slots + 1) % self.capacity
+        return (self._read_states(slots), self.actions[slots], self.rewards[slots],
+                self._read_states(next_slots), self.dones[slots])
+
+
+class SumTree:
+    # Array-backed binary tree whose internal nodes hold the sum of their children. Leaf i
+    # is node capacity + i (capacity rounded up to a power of two), node 1 is the root.
+    # Updates and prefix-sum lookups are O(log n) and vectorized over a batch of leaves.
+    def __init__(self, capacity):
+        self.num_leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.depth = self.num_leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.num_leaves)
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def __getitem__(self, leaves):
+        return self.nodes[np.asarray(leaves) + self.num_leaves]
+
+    def update(self, leaves, values):
+        nodes = np.asarray(leaves) + self.num_leaves
+        self.nodes[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        # Leaf whose cumulative range [prefix, prefix + value) contains each value
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.nodes[2 * nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes = 2 * nodes + go_right
+        return nodes - self.num_leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    # Proportional prioritized replay: transition i is sampled with probability
+    # p_i^alpha / sum_k p_k^alpha using a SumTree, and importance-sampling weights
+    # (N * P(i))^-beta correct the bias, with beta annealed towards 1. New transitions get
+    # the highest priority seen so far; update_priorities() sets p_i = |TD error| + eps.
+    def __init__(self, capacity, state_dim, quantized_dim=0, quant_scale=5, quant_min=-1.0, seed=None,
+                 path=None, flush_every=1000, alpha=0.6, beta=0.4, beta_increment=0.001, eps=1e-6):
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        super().__init__(capacity, state_dim, quantized_dim, quant_scale, quant_min, seed, path, flush_every)
+        if self.num_valid:
+            # Priorities are not persisted; resumed transitions start at the max priority
+            slots = np.nonzero(self.valid[:self.size])[0]
+            self.tree.update(slots, self.max_priority ** self.alpha)
+
+    def _set_valid(self, slot, valid):
+        super()._set_valid(slot, valid)
+        self.tree.update([slot], self.max_priority ** self.alpha if valid else 0.0)
+
+    def sample(self, batch_size):
+        # Stratified: one draw from each of batch_size equal slices of the total priority
+        total = self.tree.total
+        bounds = np.arange(batch_size) * (total / batch_size)
+        values = np.minimum(bounds + self.rng.random(batch_size) * (total / batch_size), total * (1 - 1e-12))
+        slots = self.tree.find(values)
+        priorities = self.tree[slots]
+        invalid = priorities <= 0  # Only reachable through float round-off in the node sums
+        if invalid.any():
+            slots[invalid] = self.rng.choice(np.nonzero(self.valid[:self.size])[0], invalid.sum())
+            priorities = self.tree[slots]
+
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        weights = (self.num_valid * priorities / total) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+
+        next_slots = (slots + 1) % self.capacity
+        return (self._read_states(slots), self.actions[slots], self.rewards[slots],
+                self._read_states(next_slots), self.dones[slots], slots, weights)
+
+    def update_priorities(self, slots, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        # A slot drawn twice in one batch keeps its last update
+        self.tree.update(slots, priorities ** self.alpha)
@@ -2,66 +2,170 @@ import pygame
 import random
 import math
 import numpy as np
-import torch
-import torch.nn as nn
-import torch.optim as optim
-from collections import deque
-from car import Car
-from obstacle import Obstacle
+from car import Car, CAR_HALF_SIZE, draw_car
+from obstacle import Obstacle, ObstacleSet, ObstacleLayers
+from moving_obstacles import MovingObstacles
 from radar import Radar
-from slam_map import SlamMap
-from dqn_agent import DQNAgent
+from slam_map import SlamMap, ChunkedSlamMap
+from observations import OBSERVATION_MODES, local_patch_shape, normalized_ranges
+from renderer import Frame, FrameMailbox, Pose, SimulationThread
+
+
+def __getattr__(name):
+    # DQNAgent (and with it torch) is only imported when first asked for
+    if name == 'DQNAgent':
+        from dqn_agent import DQNAgent
+        return DQNAgent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class Simulator:
     def __init__(self, width, height, car_speed, car_acceleration, car_deceleration, 
-                 radar_range, radar_angle, num_obstacles):
+                 radar_range, radar_angle, num_obstacles, headless=False, observation="slam", encoder="mlp",
+                 seed=None, radar_spacing=5, radar_beams=None, chunked_slam=False, num_movers=0,
+                 mover_behaviour="bounce", agent=None):
+        if observation not in OBSERVATION_MODES:
+            raise ValueError(f"Unknown observation mode {observation!r}, expected one of {OBSERVATION_MODES}")
+        if encoder not in ("mlp", "conv") or (encoder == "conv" and observation == "radar"):
+            raise ValueError(f"Encoder {encoder!r} is not available for observation mode {observation!r}")
+
         self.width = width * 3  # Triple the width to accommodate all views
         self.height = height
-        self.screen = pygame.display.set_mode((self.width, self.height))
-        pygame.display.set_caption("Car Simulator with Radar, SLAM, and DQN")
-        
+        self.headless = headless
+        self.observation = observation
+        self.rng = random.Random(seed)  # Own stream for obstacles and goals, so a seed reproduces the world
+        if headless:
+            # No window, frame limiter or fonts: steps run as fast as physics and learning allow
+            self.screen = None
+            self.clock = None
+        else:
+            self.screen = pygame.display.set_mode((self.width, self.height))
+            pygame.display.set_caption("Car Simulator with Radar, SLAM, and DQN")
+            self.clock = pygame.time.Clock()
+
         self.car = Car(width // 2, height // 2, car_speed, car_acceleration, car_deceleration)
-        self.radar = Radar(radar_range, radar_angle)
+        self.radar = Radar(radar_range, radar_angle, radar_spacing, radar_beams)
         self.obstacles = []
-        self.clock = pygame.time.Clock()
-        self.slam_map = SlamMap(width, height)
+        # The chunked map only stores explored tiles (and can spill them to disk)
+        self.slam_map = ChunkedSlamMap(width, height) if chunked_slam else SlamMap(width, height)
         
         self.goal = self.spawn_goal()
         self.spawn_initial_obstacles(num_obstacles)
-
-        self.font = pygame.font.Font(None, 24)
-
-        # DQN Agent
-        state_dim = self.slam_map.grid.size + 6  # SLAM map + car position, angle, speed, goal position
+        # Moving obstacles pass through static ones; they keep clear of the start area and goal
+        self.movers = MovingObstacles((0, 0, width, height), seed=self.rng.getrandbits(32))
+        self.start_area = pygame.Rect(0, 0, 120, 80)
+        self.start_area.center = self.car.rect.center
+        self.movers.spawn(num_movers, behaviour=mover_behaviour,
+                          avoid=[self.start_area, self.goal] + [obstacle.rect for obstacle in self.obstacles])
+        self._scene = None
+
+        self.font = None if headless else pygame.font.Font(None, 24)
+
+        # DQN Agent: passed in (e.g. one policy shared by many simulators) or built on first
+        # use, so manual driving never imports torch or allocates the networks
+        self.encoder = encoder
+        self._agent = agent
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            self._agent = self.build_agent()
+        return self._agent
+
+    @agent.setter
+    def agent(self, agent):
+        self._agent = agent
+
+    def build_agent(self):
+        from dqn_agent import DQNAgent
+
+        # Surroundings (see observations.py) + car position, angle, speed, goal position
+        if self.observation == "radar":
+            grid_shape = None
+            surroundings_dim = self.radar.num_beams
+        else:
+            grid_shape = self.slam_map.grid.shape if self.observation == "slam" else local_patch_shape()
+            surroundings_dim = grid_shape[0] * grid_shape[1]
+        state_dim = surroundings_dim + 6
         action_dim = 4  # Up, Down, Left, Right
-        self.agent = DQNAgent(state_dim, action_dim)
-
-    def spawn_goal(self):
-        while True:
-            x = random.randint(50, self.width // 3 - 50)
-            y = random.randint(50, self.height - 50)
+        return DQNAgent(state_dim, action_dim,
+                        quantized_dim=0 if grid_shape is None else surroundings_dim,  # Grid cells fit in uint8
+                        grid_shape=grid_shape if self.encoder == "conv" else None)
+
+    @property
+    def obstacles(self):
+        return self._obstacles
+
+    @obstacles.setter
+    def obstacles(self, obstacles):
+        # Always hold obstacles in an ObstacleSet so the spatial index follows every change
+        self._obstacles = ObstacleSet(obstacles)
+
+    @property
+    def scene(self):
+        # Everything the car can hit: the static obstacles, plus the moving ones if any
+        if not len(self.movers):
+            return self.obstacles
+        if self._scene is None or self._scene.layers[0] is not self.obstacles:
+            self._scene = ObstacleLayers(self.obstacles, self.movers)
+        return self._scene
+
+    def spawn_goal(self, max_attempts=1000):
+        for _ in range(max_attempts):
+            x = self.rng.randint(50, self.width // 3 - 50)
+            y = self.rng.randint(50, self.height - 50)
             goal_rect = pygame.Rect(x, y, 20, 20)
-            if not any(goal_rect.colliderect(obs.rect) for obs in self.obstacles):
+            if not self.obstacles.any_overlap(goal_rect):
                 return goal_rect
+        raise RuntimeError(f"Could not place the goal in {max_attempts} attempts")
 
-    def spawn_initial_obstacles(self, num_obstacles):
+    def spawn_initial_obstacles(self, num_obstacles, max_attempts=1000):
         for _ in range(num_obstacles):
-            while True:
-                size = random.randint(20, 60)
-                x = random.randint(0, self.width // 3 - size)  # Limit to left third
-                y = random.randint(0, self.height - size)
+            for _ in range(max_attempts):
+                size = self.rng.randint(20, 60)
+                x = self.rng.randint(0, self.width // 3 - size)  # Limit to left third
+                y = self.rng.randint(0, self.height - size)
                 new_obstacle = Obstacle(x, y, size, size)
                 
                 if not self.car.rect.colliderect(new_obstacle.rect) and \
-                   not any(new_obstacle.rect.colliderect(obs.rect) for obs in self.obstacles) and \
+                   not self.obstacles.any_overlap(new_obstacle.rect) and \
                    not new_obstacle.rect.colliderect(self.goal):
                     self.obstacles.append(new_obstacle)
                     break
+            else:
+                raise RuntimeError(f"Could not place obstacle {len(self.obstacles) + 1} "
+                                   f"in {max_attempts} attempts")
+
+    def snapshot(self):
+        # Everything needed to reproduce the world and episode: plain numbers and arrays,
+        # no pygame objects. Obstacles and the SLAM grid are copied.
+        return {
+            'car': (self.car.x, self.car.y, self.car.angle, self.car.speed, self.car.steering),
+            'goal': tuple(self.goal),
+            'obstacles': self.obstacles.rect_array().astype(np.int64),
+            'slam_map': self.slam_map.snapshot(),
+            'movers': self.movers.snapshot(),
+            'rng': self.rng.getstate(),
+        }
+
+    def restore(self, snapshot):
+        # Returns the state, like reset(). Obstacles are only rebuilt when they differ, so
+        # restoring a snapshot of the same world is cheap enough to use for episode resets.
+        self.car.x, self.car.y, self.car.angle, self.car.speed, self.car.steering = snapshot['car']
+        self.goal = pygame.Rect(snapshot['goal'])
+        if not np.array_equal(self.obstacles.rect_array(), snapshot['obstacles']):
+            self.obstacles = [Obstacle(*rect) for rect in snapshot['obstacles'].tolist()]
+        self.slam_map.restore(snapshot['slam_map'])
+        self.movers.restore(snapshot['movers'])
+        self.rng.setstate(snapshot['rng'])
+        return self.get_state()
 
     def check_collision(self):
-        return any(self.car.rect.colliderect(obstacle.rect) for obstacle in self.obstacles)
+        # The car as drawn: a rotated box, not its unrotated rect
+        return self.scene.any_overlap_oriented(self.car.center, CAR_HALF_SIZE, self.car.angle)
 
     def check_goal_reached(self):
-        return self.car.rect.colliderect(self.goal)
+        return bool(self.car.overlaps([tuple(self.goal)])[0])
 
     def draw_radar_view(self, radar_detections):
         radar_surface = pygame.Surface((self.width // 3, self.height))
@@ -87,17 +191,18 @@ class Simulator:
 
         return radar_surface
 
-    def draw_data(self):
+    def draw_data(self, frame):
         data_surface = pygame.Surface((self.width, 100))
         data_surface.fill((200, 200, 200))  # Light gray background
         
         # Car data
-        car_pos = f"Car Position: ({self.car.rect.centerx:.2f}, {self.car.rect.centery:.2f})"
-        car_speed = f"Car Speed: {self.car.speed:.2f}"
-        car_angle = f"Car Angle: {self.car.angle:.2f}"
+        car_pos = f"Car Position: ({frame.car.center[0]:.2f}, {frame.car.center[1]:.2f})"
+        car_speed = f"Car Speed: {frame.car.speed:.2f}"
+        car_angle = f"Car Angle: {frame.car.angle:.2f}"
         
         # Goal data
-        goal_pos = f"Goal Position: ({self.goal.centerx}, {self.goal.centery})"
+        goal = pygame.Rect(frame.goal)
+        goal_pos = f"Goal Position: ({goal.centerx}, {goal.centery})"
         
         # Render text
         texts = [
@@ -114,16 +219,42 @@ class Simulator:
         return data_surface
 
     def get_state(self):
-        slam_state = self.slam_map.grid.flatten()
+        if self.observation == "slam":
+            surroundings = self.slam_map.grid.reshape(-1)
+        elif self.observation == "local":
+            surroundings = self.slam_map.local_patch(self.car.x, self.car.y).reshape(-1)
+        else:
+            _, distances = self.radar.scan_ranges(self.car, self.scene)
+            surroundings = normalized_ranges(distances, self.radar.range)
         car_state = np.array([
-            self.car.rect.centerx / self.width,
-            self.car.rect.centery / self.height,
+            self.car.x / self.width,
+            self.car.y / self.height,
             self.car.angle / 360,
             self.car.speed / self.car.max_speed,
             self.goal.centerx / self.width,
             self.goal.centery / self.height
-        ])
-        return np.concatenate((slam_state, car_state))
+        ], dtype=np.float32)
+        return np.concatenate((surroundings, car_state))
+
+    def update_slam_map(self):
+        # Full scan, so beams that see nothing still carve free space up to the radar range
+        rel_angles, distances = self.radar.scan_ranges(self.car, self.scene)
+        self.slam_map.update_ranges(self.car.center, self.car.angle, rel_angles, distances, self.radar.range)
+
+    def reset(self):
+        # Start a new episode in the same world: car back to the start, new goal, empty map
+        self.goal = self.spawn_goal()
+        self.reset_car()
+        self.slam_map.reset()
+        return self.get_state()
+
+    def reset_car(self):
+        # Movers wander into the start area during an episode: move them away again, so
+        # the new episode does not begin inside one
+        if len(self.movers):
+            self.movers.clear_area(self.start_area,
+                                   avoid=[self.goal] + [obstacle.rect for obstacle in self.obstacles])
+        self.car.reset(self.width // 6, self.height // 2)
 
     def step(self, action):
         # Convert action to key presses
@@ -137,10 +268,11 @@ class Simulator:
         elif action == 3:
             keys[pygame.K_RIGHT] = True
 
+        self.movers.update()
         self.car.move(keys)
 
         # Ensure car stays in the left third
-        self.car.rect.clamp_ip(pygame.Rect(0, 0, self.width // 3, self.height))
+        self.car.clamp(0, 0, self.width // 3, self.height)
 
         collision = self.check_collision()
         goal_reached = self.check_goal_reached()
@@ -158,70 +290,116 @@ class Simulator:
             self.slam_map.reset()  # Reset SLAM map after reaching goal
 
         # Update SLAM map
-        radar_detections = self.radar.scan(self.car, self.obstacles)
-        self.slam_map.update(self.car.rect.center, self.car.angle, radar_detections)
+        self.update_slam_map()
 
         return self.get_state(), reward, done
 
-    def update_display(self):
+    def frame(self, tick=0):
+        # Snapshot of what is on screen, safe to hand to another thread
+        return Frame(tick, Pose(self.car.center, self.car.angle, self.car.speed), tuple(self.goal),
+                     self.scene.rect_array(), tuple(self.radar.scan(self.car, self.scene)),
+                     self.slam_map.grid.copy())
+
+    def draw_frame(self, frame):
+        # Draws only from the frame, never from live simulation state
         self.screen.fill((255, 255, 255))
-        for obstacle in self.obstacles:
-            obstacle.draw(self.screen)
-        self.radar.draw(self.screen, self.car, self.radar.scan(self.car, self.obstacles))
-        self.car.draw(self.screen)
+        for rect in frame.obstacles.tolist():
+            pygame.draw.rect(self.screen, (0, 0, 0), rect)
+        self.radar.draw(self.screen, frame.car, frame.detections)
+        draw_car(self.screen, frame.car.center, frame.car.angle)
         
         # Draw goal
-        pygame.draw.rect(self.screen, (0, 255, 0), self.goal)
+        pygame.draw.rect(self.screen, (0, 255, 0), frame.goal)
 
         # Radar view (middle third)
-        radar_surface = self.draw_radar_view(self.radar.scan(self.car, self.obstacles))
+        radar_surface = self.draw_radar_view(frame.detections)
         self.screen.blit(radar_surface, (self.width // 3, 0))
 
         # SLAM map view (right third)
-        slam_surface = self.slam_map.draw()
+        slam_surface = self.slam_map.draw(frame.slam_grid)
         self.screen.blit(slam_surface, (2 * self.width // 3, 0))
 
         # Draw data at the bottom of the screen
-        data_surface = self.draw_data()
+        data_surface = self.draw_data(frame)
         self.screen.blit(data_surface, (0, self.height - 100))
 
-        pygame.display.flip()
-        self.clock.tick(60)
+    def update_display(self, tick=True):
+        if self.headless:
+            return
 
-    def run_manual(self):
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
+        self.draw_frame(self.frame())
+        pygame.display.flip()
+        if tick:
+            self.clock.tick(60)
+
+    def run_rendered(self, advance, sim_rate=60, fps=60):
+        # Runs advance() on a simulation thread at sim_rate ticks/s while this (the main)
+        # thread handles events and draws the newest frame at up to fps. The simulation never
+        # waits for the display: frames the renderer is too slow for are skipped. Returns
+        # False if the window was closed.
+        self._keys = dict.fromkeys((pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT), False)
+        mailbox = FrameMailbox()
+        simulation = SimulationThread(advance, self.frame, mailbox, sim_rate)
+        simulation.start()
+        window_open = True
+        try:
+            while True:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        window_open = False
+                        simulation.stop()
+                pressed = pygame.key.get_pressed()
+                self._keys = {key: pressed[key] for key in self._keys}  # Replaced, never mutated
+
+                frame = mailbox.take(timeout=1 / fps)
+                if frame is None:
+                    if mailbox.closed:
+                        break
+                    continue
+                self.draw_frame(frame)
+                pygame.display.flip()
+                self.clock.tick(fps)
+        finally:
+            simulation.stop()
+            simulation.join()
+        if simulation.error is not None:
+            raise simulation.error
+        return window_open
+
+    def manual_tick(self, keys):
+        self.movers.update()
+        self.car.move(keys)
 
-            keys = pygame.key.get_pressed()
-            self.car.move(keys)
+        # Ensure car stays in the left third
+        self.car.clamp(0, 0, self.width // 3, self.height)
 
-            # Ensure car stays in the left third
-            self.car.rect.clamp_ip(pygame.Rect(0, 0, self.width // 3, self.height))
+        if self.check_collision():
+            print("Collision detected!")
+            self.reset_car()
+            self.slam_map.reset()  # Reset SLAM map after collision
 
-            if self.check_collision():
-                print("Collision detected!")
-                self.car.rect.center = (self.width // 6, self.height // 2)
-                self.car.angle = 0
-                self.car.speed = 0
-                self.slam_map.reset()  # Reset SLAM map after collision
+        if self.check_goal_reached():
+            print("Goal reached!")
+            self.goal = self.spawn_goal()
+            self.slam_map.reset()  # Reset SLAM map after reaching goal
 
-            if self.check_goal_reached():
-                print("Goal reached!")
-                self.goal = self.spawn_goal()
-                self.slam_map.reset()  # Reset SLAM map after reaching goal
+        # Update SLAM map
+        self.update_slam_map()
 
-            # Update SLAM map
-            radar_detections = self.radar.scan(self.car, self.obstacles)
-            self.slam_map.update(self.car.rect.center, self.car.angle, radar_detections)
+    def run_manual(self, sim_rate=60, fps=60):
+        if self.headless:
+            raise RuntimeError("Manual mode needs a display; create the Simulator with headless=False")
 
-            self.update_display()
+        def advance():
+            self.manual_tick(self._keys)
+            return True
 
+        self.run_rendered(advance, sim_rate, fps)
         pygame.quit()
 
-    def train(self, num_episodes):
+    def train(self, num_episodes, render_every=1, max_steps=1000):
+        # render_every: draw every N steps (0 disables rendering); ignored when headless
+        render = not self.headless and render_every > 0
         for episode in range(num_episodes):
             state = self.get_state()
             total_reward = 0
@@ -238,14 +416,16 @@ class Simulator:
                 total_reward += reward
                 steps += 1
 
-                self.update_display()
+                if render and steps % render_every == 0:
+                    self.update_display(tick=False)
 
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        return
+                if not self.headless:
+                    for event in pygame.event.get():
+                        if event.type == pygame.QUIT:
+                            pygame.quit()
+                            return
 
-                if steps >= 1000:  # Max steps per episode
+                if steps >= max_steps:  # Max steps per episode
                     done = True
 
             print(f"Episode: {episode + 1}, Steps: {steps}, Total Reward: {total_reward}")
@@ -253,23 +433,36 @@ class Simulator:
             if episode % 10 == 0:
                 self.agent.update_target_model()
 
-            # Reset the environment
-            self.car.rect.center = (self.width // 6, self.height // 2)
-            self.car.angle = 0
-            self.car.speed = 0
-            self.goal = self.spawn_goal()
-            self.slam_map.reset()
+            self.reset()
 
-    def run_trained_agent(self):
+    def run_trained_agent(self, sim_rate=60, fps=60, max_steps=1000):
+        # One greedy episode; the agent's exploration rate is put back afterwards, so training
+        # can carry on from where it was
+        epsilon = self.agent.epsilon
+        self.agent.epsilon = 0
+        try:
+            self._run_greedy(sim_rate, fps, max_steps)
+        finally:
+            self.agent.epsilon = epsilon
+
+    def _run_greedy(self, sim_rate, fps, max_steps):
         state = self.get_state()
-        done = False
+        steps = 0
+
+        if self.headless:
+            done = False
+            while not done and steps < max_steps:
+                action = self.agent.get_action(state)
+                state, _, done = self.step(action)
+                steps += 1
+            return
 
-        while not done:
+        def advance():
+            nonlocal state, steps
             action = self.agent.get_action(state)
             state, _, done = self.step(action)
-            self.update_display()
+            steps += 1
+            return not done and steps < max_steps
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
\ No newline at end of file
+        if not self.run_rendered(advance, sim_rate, fps):
+            pygame.quit()
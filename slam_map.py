@@ -1,5 +1,99 @@
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
 import pygame
 import numpy as np
+from observations import LOCAL_PATCH_CELLS, local_patches
+
+# Grid cells hold log-odds occupancy divided by LOG_ODDS_SCALE, clamped to [-1, 1]:
+# 0 is unknown, > 0 occupied, < 0 free. Hits and misses move a cell by fixed steps, so
+# values stay multiples of 0.2 (which the replay buffer stores losslessly as uint8).
+LOG_ODDS_SCALE = 3.5
+HIT_STEP = 0.4  # Log-odds +1.4, P(occupied | hit) ~ 0.8
+MISS_STEP = -0.2  # Log-odds -0.7, P(occupied | beam passed through) ~ 0.33
+FREE_TINT = np.array([55, 25, 55])  # Free cells fade from white towards pale green
+
+
+def scan_cells(origin_x, origin_y, angles, distances, max_range, resolution):
+    # Cells touched by a batch of beams, all rays at once. angles (degrees) and distances
+    # (np.inf where nothing was hit) have one entry per beam; the origins are scalars or
+    # per-beam arrays. Free cells are an exact grid traversal of each beam up to its hit or
+    # max_range, the same cells as UniformGrid.ray_cells (Amanatides-Woo DDA): the start
+    # cell and one cell per grid line crossed (not in beam order). A hit marks the cell the
+    # beam enters at the hit distance, so a hit exactly on a grid line (an obstacle face)
+    # lands in the obstacle's cell, not in the free cell before it.
+    # Returns (beam, cell_y, cell_x) for free cells and for hits.
+    distances = np.asarray(distances, dtype=np.float64)
+    beams = len(distances)
+    hit = np.isfinite(distances)
+    angles_rad = np.radians(angles)
+    # Cell units, row 0 for x and row 1 for y (screen y points down). Scalar origins stay
+    # one column and broadcast over the beams.
+    direction = np.array([np.cos(angles_rad), -np.sin(angles_rad)])
+    origin = np.array([origin_x, origin_y], dtype=np.float64).reshape(2, -1) / resolution
+    nudge = 1e-6  # Puts boundary points on the far side, along the beam
+    reach = np.where(hit, distances, max_range) / resolution
+    start = np.floor(origin).astype(np.int64)
+    end = np.floor(origin + np.maximum(reach - nudge, 0) * direction).astype(np.int64)
+    hit_cell = np.floor(origin + (reach + nudge) * direction).astype(np.int64)
+
+    # Every grid line a beam crosses enters one new cell: the start cell plus one cell per
+    # crossing of a vertical (axis 0) or horizontal (axis 1) line. Along its axis, crossing
+    # k = 1, 2, .. enters cell start + k * step; across it the beam is at base + k * rate
+    # (in cells) there. Both coordinates of both axes are one floor over a (coordinate,
+    # axis, beam, k) block padded to the longest beam, kept within each beam's cell range
+    # against rounding; k = 0 on axis 0 is the start cell. integrate_scan does not care
+    # about order, so no per-beam sorting is needed.
+    step = np.sign(end - start)
+    count = np.abs(end - start)
+    # A beam parallel to an axis crosses none of its lines, so any finite slope will do there
+    slope = direction[::-1] / (direction + (direction == 0))
+    base = origin[::-1] + (start + (step < 0) - origin) * slope
+    along = np.eye(2, dtype=bool)[:, :, None]
+    offset = np.where(along, start + 0.5, base)  # + 0.5: floor gives the exact integer
+    rate = np.where(along, step, step * slope)
+    k = np.arange(count.max(initial=0) + 1)
+    cells = np.multiply(rate[..., None], k)
+    cells += offset[..., None]
+    np.floor(cells, out=cells)
+    lower, upper = np.minimum(start, end), np.maximum(start, end)
+    np.maximum(cells, lower[:, None, :, None], out=cells)
+    np.minimum(cells, upper[:, None, :, None], out=cells)
+    cells[1, 0, :, 0] = start[1]
+    entered = k <= count[:, :, None]
+    entered[1, :, 0] = False  # The start cell once, from axis 0
+
+    rows = count + np.array([[1], [0]])  # Entered cells per (axis, beam), in mask order
+    free_beam = np.repeat(np.arange(2 * beams) % beams, rows.reshape(-1))
+    free_x = cells[0][entered].astype(np.int64)
+    free_y = cells[1][entered].astype(np.int64)
+    hit_beam = np.nonzero(hit)[0]
+    return (free_beam, free_y, free_x), (hit_beam, hit_cell[1, hit_beam], hit_cell[0, hit_beam])
+
+
+def integrate_scan(grids, free_cells, hit_cells):
+    # Apply one scan to a stack of grids (G, H, W). Cells are (grid, y, x) index arrays; a
+    # grid index may be a scalar for all of them. Every free cell is decremented once per
+    # scan, hit cells accumulate with np.add.at. Only the touched cells are clamped: free
+    # cells only move down and hit cells only up.
+    _, height, width = grids.shape
+    flat = grids.reshape(-1)
+
+    def linear(cells):
+        g, y, x = cells
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        return ((g * height + y) * width + x)[inside]
+
+    free = linear(free_cells)
+    hits = linear(hit_cells)
+    before_hits = flat[hits]
+    flat[free] = np.maximum(flat[free] + MISS_STEP, -1)  # Duplicates write the same value: once per cell
+    flat[hits] = before_hits  # A cell with a hit this scan is not free
+    np.add.at(flat, hits, HIT_STEP)
+    flat[hits] = np.minimum(flat[hits], 1)
+
 
 class SlamMap:
     def __init__(self, width, height, resolution=5):
@@ -8,35 +102,213 @@ class SlamMap:
         self.resolution = resolution
         self.grid_width = width // resolution
         self.grid_height = height // resolution
-        self.grid = np.zeros((self.grid_height, self.grid_width))
+        self._allocate()
         self.surface = pygame.Surface((width, height))
         self.surface.fill((255, 255, 255))  # White background
+        # One pixel per cell; draw() fills it from the grid and scales it onto the map area
+        self.cell_surface = pygame.Surface((self.grid_width, self.grid_height))
+        self.map_area = self.surface.subsurface(
+            (0, 0, self.grid_width * resolution, self.grid_height * resolution))
+
+    def _allocate(self):
+        self.grid = np.zeros((self.grid_height, self.grid_width), dtype=np.float32)
 
     def update(self, car_pos, car_angle, radar_detections):
-        car_x, car_y = car_pos
-        for distance, angle in radar_detections:
-            # Calculate absolute angle
-            abs_angle = car_angle + angle
-            # Calculate obstacle position
-            obs_x = car_x + distance * np.cos(np.radians(abs_angle))
-            obs_y = car_y - distance * np.sin(np.radians(abs_angle))
-            # Convert to grid coordinates
-            grid_x = int(obs_x / self.resolution)
-            grid_y = int(obs_y / self.resolution)
-            if 0 <= grid_x < self.grid_width and 0 <= grid_y < self.grid_height:
-                self.grid[grid_y, grid_x] = min(self.grid[grid_y, grid_x] + 0.2, 1)
-
-    def draw(self):
-        self.surface.fill((255, 255, 255))
-        for y in range(self.grid_height):
-            for x in range(self.grid_width):
-                if self.grid[y, x] > 0:
-                    color = (int(255 * (1 - self.grid[y, x])),) * 3
-                    pygame.draw.rect(self.surface, color, 
-                                     (x * self.resolution, y * self.resolution, 
-                                      self.resolution, self.resolution))
+        # radar_detections: (distance, relative angle) hits; free space is carved up to each hit
+        if not radar_detections:
+            return
+        distances, angles = np.array(radar_detections, dtype=np.float64).T
+        self.update_ranges(car_pos, car_angle, angles, distances, np.max(distances))
+
+    def update_ranges(self, car_pos, car_angle, rel_angles, distances, max_range):
+        # Full scan: one range per beam, np.inf for beams that saw nothing within max_range
+        free_cells, hit_cells = scan_cells(car_pos[0], car_pos[1], car_angle + np.asarray(rel_angles), distances,
+                                           max_range, self.resolution)
+        self._integrate(free_cells[1:], hit_cells[1:])
+
+    def _integrate(self, free_cells, hit_cells):
+        # Single grid: index 0 of a one-grid stack for every cell
+        integrate_scan(self.grid[None], (0,) + free_cells, (0,) + hit_cells)
+
+    def local_patch(self, x, y):
+        # Observation patch around world position (x, y), see observations.local_patches
+        return local_patches(self.grid[None], [x], [y], self.resolution)[0]
+
+    def snapshot(self):
+        return self.grid.copy()
+
+    def restore(self, snapshot):
+        np.copyto(self.grid, snapshot)
+
+    def occupancy_probability(self):
+        return 1 / (1 + np.exp(-LOG_ODDS_SCALE * self.grid))
+
+    def draw(self, grid=None):
+        # Paint the whole grid in one blit instead of one pygame.draw.rect per cell. `grid`
+        # draws a copy (e.g. from a render frame) instead of the live map.
+        grid = self.grid if grid is None else grid
+        occupied = np.clip(grid, 0, 1)[:, :, None]
+        free = np.clip(-grid, 0, 1)[:, :, None]
+        pixels = np.rint(255 - 255 * occupied - FREE_TINT * free).astype(np.uint8)
+        pygame.surfarray.blit_array(self.cell_surface, pixels.transpose(1, 0, 2))  # surfarray is [x, y]
+        pygame.transform.scale(self.cell_surface, self.map_area.get_size(), self.map_area)
         return self.surface
 
     def reset(self):
-        self.grid = np.zeros((self.grid_height, self.grid_width))
-        self.surface.fill((255, 255, 255))
\ No newline at end of file
+        # In place: nothing is allocated per episode. Only the grid is touched; the surface
+        # belongs to draw(), which may be running on the render thread at the same time.
+        self.grid.fill(0)
+
+
+class ChunkedSlamMap(SlamMap):
+    # Occupancy map of unbounded size, stored as tile_size x tile_size int8 tiles (one unit
+    # = MISS_STEP) created the first time a scan touches them. Memory follows the explored
+    # area, not the world. With max_tiles set, the least recently used tiles beyond that
+    # are spilled to raw int8 files in spill_dir (a temporary directory by default, removed by
+    # close()) and loaded back when a scan touches them again. `grid` is a float copy of the
+    # window the map draws: width x height from the origin; read it, but write through
+    # update/update_ranges.
+    UNIT = -MISS_STEP
+    HIT = int(round(HIT_STEP / UNIT))
+    LIMIT = int(round(1 / UNIT))
+
+    def __init__(self, width, height, resolution=5, tile_size=64, max_tiles=None, spill_dir=None):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.spill_dir = spill_dir
+        self._remove_spill_dir = None
+        super().__init__(width, height, resolution)
+
+    def _allocate(self):
+        self.tiles = OrderedDict()  # (tile_y, tile_x) -> int8 tile, most recently used last
+        self.spilled = set()
+        self._pool = []  # Zeroed tiles kept for reuse after reset() or spilling
+
+    @property
+    def grid(self):
+        return self.window(0, 0, self.grid_width, self.grid_height)
+
+    @property
+    def nbytes(self):
+        return len(self.tiles) * self.tile_size ** 2
+
+    def _spill_path(self, key):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='slam_tiles_')
+            # Ours alone: removed by close(), or when the map is collected or at exit
+            self._remove_spill_dir = weakref.finalize(self, shutil.rmtree, self.spill_dir, ignore_errors=True)
+        return os.path.join(self.spill_dir, f'{key[0]}_{key[1]}.tile')
+
+    def _tile(self, key):
+        # Tile for writing: created or loaded back, made most recently used
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        if key in self.spilled:
+            tile = self._load_spilled(key)
+            os.remove(self._spill_path(key))
+            self.spilled.discard(key)
+        else:
+            tile = self._pool.pop() if self._pool else np.zeros((self.tile_size,) * 2, dtype=np.int8)
+        self.tiles[key] = tile
+        self._evict()
+        return tile
+
+    def _read_tile(self, key):
+        # Tile for reading, None if unexplored. grid is read every tick, so this leaves the
+        # LRU order alone and reads spilled tiles in place instead of swapping them back in.
+        tile = self.tiles.get(key)
+        if tile is None and key in self.spilled:
+            tile = self._load_spilled(key)
+        return tile
+
+    def _load_spilled(self, key):
+        # Raw bytes, no .npy header to parse: the shape and dtype are always the same
+        return np.fromfile(self._spill_path(key), dtype=np.int8).reshape(self.tile_size, self.tile_size)
+
+    def _evict(self):
+        while self.max_tiles is not None and len(self.tiles) > self.max_tiles:
+            key, tile = self.tiles.popitem(last=False)
+            tile.tofile(self._spill_path(key))
+            self.spilled.add(key)
+            tile.fill(0)
+            self._pool.append(tile)
+
+    def _integrate(self, free_cells, hit_cells):
+        # Same rules as integrate_scan, applied tile by tile
+        size = self.tile_size
+        y = np.concatenate([free_cells[0], hit_cells[0]])
+        x = np.concatenate([free_cells[1], hit_cells[1]])
+        if not y.size:
+            return
+        tile_y, tile_x = y // size, x // size
+        local = (y - tile_y * size) * size + (x - tile_x * size)
+        # One scan spans a few neighbouring tiles: number them relative to the first
+        y0, x0 = tile_y.min(), tile_x.min()
+        span = tile_x.max() - x0 + 1
+        tile_ids = (tile_y - y0) * span + (tile_x - x0)
+        is_hit = np.arange(y.size) >= free_cells[0].size
+
+        for tile_id in np.unique(tile_ids).tolist():
+            flat = self._tile((int(y0 + tile_id // span), int(x0 + tile_id % span))).reshape(-1)
+            in_tile = tile_ids == tile_id
+            hits, counts = np.unique(local[in_tile & is_hit], return_counts=True)
+            free = local[in_tile & ~is_hit]
+            before_hits = flat[hits]
+            flat[free] = np.maximum(flat[free], 1 - self.LIMIT) - 1  # Stays within int8
+            flat[hits] = np.minimum(before_hits + self.HIT * np.minimum(counts, self.LIMIT), self.LIMIT)
+
+    def window(self, cell_x, cell_y, width, height):
+        # Float values of the cells [cell_y, cell_y + height) x [cell_x, cell_x + width);
+        # unexplored cells read as 0. Reading never creates, loads back or evicts tiles
+        out = np.zeros((height, width), dtype=np.float32)
+        size = self.tile_size
+        for tile_y in range(cell_y // size, (cell_y + height - 1) // size + 1):
+            for tile_x in range(cell_x // size, (cell_x + width - 1) // size + 1):
+                tile = self._read_tile((tile_y, tile_x))
+                if tile is None:
+                    continue
+                y0, x0 = max(cell_y, tile_y * size), max(cell_x, tile_x * size)
+                y1, x1 = min(cell_y + height, (tile_y + 1) * size), min(cell_x + width, (tile_x + 1) * size)
+                out[y0 - cell_y:y1 - cell_y, x0 - cell_x:x1 - cell_x] = \
+                    tile[y0 - tile_y * size:y1 - tile_y * size, x0 - tile_x * size:x1 - tile_x * size]
+        out *= self.UNIT
+        return out
+
+    def local_patch(self, x, y):
+        # Crop only the cells around (x, y) instead of materialising the whole view
+        cells = LOCAL_PATCH_CELLS
+        cell_x = int(x // self.resolution) - cells // 2
+        cell_y = int(y // self.resolution) - cells // 2
+        patch = self.window(cell_x, cell_y, cells, cells)
+        centre = (cells // 2 + 0.5) * self.resolution
+        return local_patches(patch[None], [centre], [centre], self.resolution)[0]
+
+    def snapshot(self):
+        tiles = {key: tile.copy() for key, tile in self.tiles.items()}
+        for key in self.spilled:
+            tiles[key] = self._read_tile(key)
+        return tiles
+
+    def restore(self, snapshot):
+        self.reset()
+        for key, saved in snapshot.items():
+            self._tile(key)[:] = saved
+
+    def reset(self):
+        # Tiles go back to the pool zeroed, spilled files are deleted: nothing is allocated
+        for tile in self.tiles.values():
+            tile.fill(0)
+            self._pool.append(tile)
+        self.tiles.clear()
+        for key in self.spilled:
+            os.remove(self._spill_path(key))
+        self.spilled.clear()
+
+    def close(self):
+        # Drops the spilled tiles; a spill directory the map created itself goes with them
+        self.reset()
+        if self._remove_spill_dir is not None:
+            self._remove_spill_dir()
+            self._remove_spill_dir = self.spill_dir = None
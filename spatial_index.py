@@ -0,0 +1,106 @@
+import math
+import numpy as np
+from collections import defaultdict
+
+
+class UniformGrid:
+    # Uniform hash grid over axis-aligned rects (x, y, w, h). Every item is registered in
+    # each cell its rect touches, so queries only look at the few cells around the query.
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)
+        self.item_cells = {}
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def _cell_range(self, rect):
+        x, y, w, h = rect
+        cs = self.cell_size
+        return (math.floor(x / cs), math.floor(y / cs),
+                math.floor((x + w) / cs), math.floor((y + h) / cs))
+
+    def _covered_cells(self, rect):
+        x0, y0, x1, y1 = self._cell_range(rect)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item_id, rect):
+        cells = self._covered_cells(rect)
+        for cell in cells:
+            self.cells[cell].add(item_id)
+        self.item_cells[item_id] = cells
+
+    def remove(self, item_id):
+        for cell in self.item_cells.pop(item_id):
+            items = self.cells[cell]
+            items.discard(item_id)
+            if not items:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+        self.item_cells.clear()
+
+    def query_rect(self, rect):
+        # Candidate ids whose cells intersect rect; callers do the exact overlap test
+        found = set()
+        for cell in self._covered_cells(rect):
+            items = self.cells.get(cell)
+            if items:
+                found |= items
+        return found
+
+    def ray_cells(self, origin, direction, max_range):
+        # Amanatides-Woo DDA: yields the cells a ray passes through, in order, up to max_range
+        cs = self.cell_size
+        x, y = origin
+        dx, dy = direction
+        cx, cy = math.floor(x / cs), math.floor(y / cs)
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        t_max_x = ((cx + (dx > 0)) * cs - x) / dx if dx != 0 else math.inf
+        t_max_y = ((cy + (dy > 0)) * cs - y) / dy if dy != 0 else math.inf
+        t_delta_x = cs / abs(dx) if dx != 0 else math.inf
+        t_delta_y = cs / abs(dy) if dy != 0 else math.inf
+
+        t = 0.0
+        while t <= max_range:
+            yield cx, cy
+            if t_max_x < t_max_y:
+                t = t_max_x
+                t_max_x += t_delta_x
+                cx += step_x
+            else:
+                t = t_max_y
+                t_max_y += t_delta_y
+                cy += step_y
+
+    def query_ray(self, origin, direction, max_range):
+        found = set()
+        for cell in self.ray_cells(origin, direction, max_range):
+            items = self.cells.get(cell)
+            if items:
+                found |= items
+        return found
+
+
+def sweep_pairs(boxes):
+    # Sort-and-sweep broad phase over (N, 4) boxes (x, y, w, h): boxes are sorted by left
+    # edge, and each one is only paired with the following boxes that start before it
+    # ends. Returns index arrays (i, j), i < j, of every pair whose boxes overlap (strictly).
+    boxes = np.asarray(boxes, dtype=np.float64)
+    order = np.argsort(boxes[:, 0], kind='stable')
+    left = boxes[order, 0]
+    right = left + boxes[order, 2]
+    count = len(boxes)
+    ends = np.searchsorted(left, right, side='left')           # First box starting at/after our end
+    spans = np.maximum(ends - np.arange(count) - 1, 0)
+    first = np.repeat(np.arange(count), spans)
+    offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+    second = first + 1 + offsets
+
+    a, b = order[first], order[second]
+    top_a, top_b = boxes[a, 1], boxes[b, 1]
+    keep = (top_a < top_b + boxes[b, 3]) & (top_b < top_a + boxes[a, 3])
+    a, b = a[keep], b[keep]
+    return np.minimum(a, b), np.maximum(a, b)
@@ -1,8 +1,31 @@
 import unittest
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import pygame
 import numpy as np
 import torch
 from simulator import Simulator, DQNAgent, Car, Obstacle, Radar, SlamMap
+from slam_map import ChunkedSlamMap, scan_cells
+from moving_obstacles import MovingObstacles
+from vector_simulator import VectorSimulator
+from multi_car import MultiCarWorld
+from observations import local_patches
+import profiling
+from benchmarks import suite
+from obstacle import ObstacleSet
+from spatial_index import UniformGrid, sweep_pairs
+from utils import obb_aabb_overlap, obb_obb_overlap, ray_aabb_distances, ray_obb_distances
+from renderer import FrameMailbox, SimulationThread
+from radar import beam_offsets
+import time
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer, SumTree
+from actor_learner import TransitionRing, train_actor_learner
+import evaluation
+import torch.multiprocessing as mp
 
 class TestSimulator(unittest.TestCase):
     def setUp(self):
@@ -41,7 +64,7 @@ class TestSimulator(unittest.TestCase):
         self.simulator.obstacles.clear()
 
         # Place car in a position where it's not colliding
-        self.simulator.car.rect.center = (100, 100)
+        self.simulator.car.center = (100, 100)
         self.assertFalse(self.simulator.check_collision())
 
         # Place an obstacle to collide with the car
@@ -50,17 +73,21 @@ class TestSimulator(unittest.TestCase):
         self.assertTrue(self.simulator.check_collision())
 
         # Move car away from the obstacle
-        self.simulator.car.rect.center = (200, 200)
+        self.simulator.car.center = (200, 200)
         self.assertFalse(self.simulator.check_collision())
 
+    def test_spawn_obstacles_gives_up_when_full(self):
+        with self.assertRaises(RuntimeError):
+            self.simulator.spawn_initial_obstacles(10000, max_attempts=10)
+
     def test_check_goal_reached(self):
         # Place car away from the goal
-        self.simulator.car.rect.center = (100, 100)
+        self.simulator.car.center = (100, 100)
         self.simulator.goal.center = (200, 200)
         self.assertFalse(self.simulator.check_goal_reached())
 
         # Place car on the goal
-        self.simulator.car.rect.center = self.simulator.goal.center
+        self.simulator.car.center = self.simulator.goal.center
         self.assertTrue(self.simulator.check_goal_reached())
 
     def test_get_state(self):
@@ -86,6 +113,462 @@ class TestSimulator(unittest.TestCase):
         self.simulator.slam_map.reset()
         self.assertTrue(np.all(self.simulator.slam_map.grid == 0))
 
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True, seed=1)
+
+    def test_seed_reproduces_world(self):
+        other = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True, seed=1)
+        np.testing.assert_array_equal(self.simulator.obstacles.rect_array(), other.obstacles.rect_array())
+        self.assertEqual(self.simulator.goal, other.goal)
+
+    def test_restore_replays_identical_episode(self):
+        for _ in range(5):
+            self.simulator.step(0)
+        snapshot = self.simulator.snapshot()
+        actions = [0, 0, 2, 0, 3, 1]
+
+        def rollout():
+            states = [self.simulator.step(action)[0] for action in actions]
+            return states, self.simulator.spawn_goal()
+
+        first_states, first_goal = rollout()
+        state = self.simulator.restore(snapshot)
+        self.assertEqual(len(state), len(first_states[0]))
+        second_states, second_goal = rollout()
+        for first, second in zip(first_states, second_states):
+            np.testing.assert_array_equal(first, second)
+        self.assertEqual(first_goal, second_goal)  # RNG stream restored too
+
+    def test_restore_rebuilds_changed_obstacles(self):
+        snapshot = self.simulator.snapshot()
+        self.simulator.obstacles.clear()
+        self.simulator.restore(snapshot)
+        self.assertEqual(len(self.simulator.obstacles), 5)
+        np.testing.assert_array_equal(self.simulator.obstacles.rect_array(), snapshot['obstacles'])
+        # The snapshot holds copies, not views of live state
+        self.simulator.step(0)
+        self.assertFalse(np.shares_memory(snapshot['slam_map'], self.simulator.slam_map.grid))
+
+class TestObservationModes(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+
+    def tearDown(self):
+        pygame.quit()
+
+    def make_simulator(self, observation, encoder="mlp"):
+        return Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True,
+                         observation=observation, encoder=encoder)
+
+    def test_state_sizes(self):
+        for observation, size in (("slam", 120 * 160 + 6), ("local", 16 * 16 + 6), ("radar", 13 + 6)):
+            simulator = self.make_simulator(observation)
+            state, _, _ = simulator.step(0)
+            self.assertEqual(state.shape, (size,))
+            self.assertEqual(state.dtype, np.float32)
+            self.assertEqual(simulator.agent.state_dim, size)
+
+    def test_compact_modes_shrink_the_model(self):
+        full = sum(p.numel() for p in self.make_simulator("slam").agent.model.parameters())
+        local = sum(p.numel() for p in self.make_simulator("local").agent.model.parameters())
+        radar = sum(p.numel() for p in self.make_simulator("radar").agent.model.parameters())
+        self.assertLess(local * 50, full)
+        self.assertLess(radar * 100, full)
+
+    def test_conv_encoder(self):
+        simulator = self.make_simulator("local", encoder="conv")
+        state = simulator.get_state()
+        for _ in range(32):
+            next_state, reward, done = simulator.step(0)
+            simulator.agent.remember(state, 0, reward, next_state, done)
+            state = next_state
+        simulator.agent.train()
+        self.assertLess(simulator.agent.epsilon, 1.0)
+        with self.assertRaises(ValueError):
+            self.make_simulator("radar", encoder="conv")
+
+    def test_local_patch_is_centred_on_the_car(self):
+        grids = np.zeros((1, 120, 160), dtype=np.float32)
+        grids[0, 60, 82] = 1.0  # Two cells right of the car at (400, 300)
+        grids[0, 0:30, 0:30] = -1.0
+        patch = local_patches(grids, [400], [300], 5)[0]
+        self.assertEqual(patch.shape, (16, 16))
+        self.assertEqual(patch[8, 9], 1.0)
+        self.assertEqual(np.count_nonzero(patch), 1)
+        corner = local_patches(grids, [0], [0], 5)[0]
+        self.assertEqual(corner[0, 0], 0.0)  # Outside the map reads as unknown
+        self.assertEqual(corner[8, 8], -1.0)
+
+class TestRadarResolution(unittest.TestCase):
+    def test_radar_observation_follows_beam_count(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True, observation="radar",
+                              radar_spacing=1, seed=0)
+        self.assertEqual(len(simulator.get_state()), 61 + 6)
+        envs = VectorSimulator(2, 800, 600, 5, 0.1, 0.05, 200, 60, 5, seed=0, observation="radar",
+                               radar_spacing=1)
+        self.assertEqual(envs.reset().shape, (2, 61 + 6))
+
+class TestHeadlessSimulator(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        self.simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True)
+
+    def tearDown(self):
+        pygame.quit()
+
+    def test_headless_has_no_display(self):
+        self.assertIsNone(self.simulator.screen)
+        self.assertIsNone(self.simulator.clock)
+        self.assertIsNone(pygame.display.get_surface())
+
+    def test_headless_train(self):
+        self.simulator.train(1, max_steps=5)
+        self.assertIsNone(pygame.display.get_surface())
+
+    def test_headless_manual_mode_rejected(self):
+        with self.assertRaises(RuntimeError):
+            self.simulator.run_manual()
+
+    def test_agent_is_built_on_first_use(self):
+        self.assertIsNone(self.simulator._agent)
+        self.simulator.step(0)
+        self.assertIsNone(self.simulator._agent)
+        agent = self.simulator.agent
+        self.assertIsInstance(agent, DQNAgent)
+        self.assertEqual(agent.state_dim, len(self.simulator.get_state()))
+        self.assertIs(self.simulator.agent, agent)
+
+    def test_startup_does_not_import_torch(self):
+        code = ("import sys, simulator; s = simulator.Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True); "
+                "s.step(0); print('torch' in sys.modules)")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1'))
+        self.assertEqual(output.stdout.strip(), 'False')
+
+class TestAsyncRendering(unittest.TestCase):
+    def test_mailbox_keeps_latest_frame(self):
+        mailbox = FrameMailbox()
+        self.assertIsNone(mailbox.take(timeout=0.01))
+        mailbox.publish(1)
+        mailbox.publish(2)
+        self.assertEqual(mailbox.take(), 2)
+        self.assertEqual(mailbox.dropped, 1)
+        mailbox.close()
+        self.assertIsNone(mailbox.take())
+
+    def test_simulation_thread_runs_and_reports_errors(self):
+        ticks = []
+
+        def advance():
+            ticks.append(len(ticks))
+            return len(ticks) < 5
+
+        mailbox = FrameMailbox()
+        thread = SimulationThread(advance, lambda tick: tick, mailbox, rate=0)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertEqual(thread.ticks, 5)
+        self.assertEqual(mailbox.take(), 5)  # The final tick is published too
+        self.assertTrue(mailbox.closed)
+
+        def fail():
+            raise ValueError("boom")
+
+        thread = SimulationThread(fail, lambda tick: tick, FrameMailbox(), rate=0)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertIsInstance(thread.error, ValueError)
+
+    def test_slow_rendering_does_not_slow_simulation(self):
+        pygame.init()
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, seed=0)
+        drawn = []
+        draw_frame = simulator.draw_frame
+
+        def slow_draw(frame):
+            draw_frame(frame)
+            drawn.append(frame.tick)
+            time.sleep(0.05)
+
+        simulator.draw_frame = slow_draw
+        ticks = []
+
+        def advance():
+            simulator.manual_tick(simulator._keys)
+            ticks.append(1)
+            return len(ticks) < 40
+
+        start = time.perf_counter()
+        self.assertTrue(simulator.run_rendered(advance, sim_rate=0, fps=1000))
+        self.assertEqual(len(ticks), 40)
+        self.assertLess(len(drawn), 40)
+        self.assertEqual(drawn[-1], 40)  # The renderer still shows the final state
+        self.assertLess(time.perf_counter() - start, 40 * 0.05)
+        pygame.quit()
+
+class TestSlamMap(unittest.TestCase):
+    def setUp(self):
+        self.slam_map = SlamMap(800, 600)
+
+    def test_draw_shades_cells(self):
+        self.slam_map.grid[2, 3] = 0.4
+        self.slam_map.grid[0, 0] = 1.0
+        surface = self.slam_map.draw()
+        self.assertEqual(surface.get_at((3 * 5 + 2, 2 * 5 + 4))[:3], (153, 153, 153))
+        self.assertEqual(surface.get_at((0, 0))[:3], (0, 0, 0))
+        self.assertEqual(surface.get_at((400, 300))[:3], (255, 255, 255))
+
+    def test_update_marks_hit_and_carves_free_space(self):
+        self.slam_map.update((100, 100), 0, [(50, 0)])
+        self.assertAlmostEqual(self.slam_map.grid[20, 30], 0.4)
+        np.testing.assert_allclose(self.slam_map.grid[20, 20:30], -0.2)
+        self.assertEqual(np.count_nonzero(self.slam_map.grid), 11)
+
+    def test_update_ranges_carves_misses_and_clamps(self):
+        for _ in range(10):
+            self.slam_map.update_ranges((100, 100), 0, np.array([0, 90]), np.array([50, np.inf]), 30)
+        self.assertEqual(self.slam_map.grid[20, 30], 1.0)
+        np.testing.assert_allclose(self.slam_map.grid[14:21, 20], -1.0)  # Miss carved up to max range
+        self.assertEqual(self.slam_map.grid[13, 20], 0.0)
+        probability = self.slam_map.occupancy_probability()
+        self.assertGreater(probability[20, 30], 0.95)
+        self.assertLess(probability[20, 20], 0.05)
+
+    def test_scan_cells_traverse_the_grid_exactly(self):
+        rng = np.random.default_rng(0)
+        n = 500
+        x, y = rng.uniform(0, 800, n), rng.uniform(0, 600, n)
+        angles = rng.uniform(0, 360, n)
+        distances = np.where(rng.random(n) < 0.5, rng.uniform(0, 200, n), np.inf)
+        (free_beam, free_y, free_x), _ = scan_cells(x, y, angles, distances, 200, 5)
+        grid = UniformGrid(5)
+        for beam in range(n):
+            length = distances[beam] if np.isfinite(distances[beam]) else 200
+            direction = (np.cos(np.radians(angles[beam])), -np.sin(np.radians(angles[beam])))
+            expected = set(grid.ray_cells((x[beam], y[beam]), direction, length - 1e-5))
+            mask = free_beam == beam
+            self.assertEqual(set(zip(free_x[mask].tolist(), free_y[mask].tolist())), expected)
+
+    def test_corner_clipping_beam_marks_the_cell(self):
+        # From (4.5, 0.5) at 40 degrees the beam clips cell (1, 0) for only 0.13 px, between
+        # two half-cell samples; the traversal still finds it
+        (free_beam, free_y, free_x), (_, hit_y, hit_x) = scan_cells(
+            np.array([4.5]), np.array([0.5]), np.array([40.0]), np.array([9.0]), 200, 5)
+        self.assertEqual(set(zip(free_x.tolist(), free_y.tolist())), {(0, 0), (1, 0), (1, -1), (2, -1), (2, -2)})
+        self.assertEqual((int(hit_x[0]), int(hit_y[0])), (2, -2))
+
+class TestChunkedSlamMap(unittest.TestCase):
+    def scans(self, count=30, seed=0):
+        rng = np.random.default_rng(seed)
+        rel_angles = np.arange(-30, 31, 5)
+        for _ in range(count):
+            distances = np.where(rng.random(13) < 0.5, rng.uniform(10, 150, 13), np.inf)
+            yield rng.uniform(50, 750, 2), rng.uniform(0, 360), rel_angles, distances
+
+    def test_matches_dense_map(self):
+        dense = SlamMap(800, 600)
+        chunked = ChunkedSlamMap(800, 600, tile_size=16)
+        for pos, angle, rel_angles, distances in self.scans():
+            dense.update_ranges(pos, angle, rel_angles, distances, 150)
+            chunked.update_ranges(pos, angle, rel_angles, distances, 150)
+        np.testing.assert_allclose(chunked.grid, dense.grid, atol=1e-6)
+        np.testing.assert_allclose(chunked.local_patch(400, 300), dense.local_patch(400, 300), atol=1e-6)
+        self.assertEqual(chunked.tiles[next(iter(chunked.tiles))].dtype, np.int8)
+        self.assertLess(chunked.nbytes, dense.grid.nbytes)
+
+    def test_spills_cold_tiles_and_resets_in_place(self):
+        with tempfile.TemporaryDirectory() as path:
+            reference = ChunkedSlamMap(800, 600, tile_size=16)
+            chunked = ChunkedSlamMap(800, 600, tile_size=16, max_tiles=4, spill_dir=path)
+            for pos, angle, rel_angles, distances in self.scans():
+                reference.update_ranges(pos, angle, rel_angles, distances, 150)
+                chunked.update_ranges(pos, angle, rel_angles, distances, 150)
+            self.assertLessEqual(len(chunked.tiles), 4)
+            self.assertEqual(len(os.listdir(path)), len(chunked.spilled))
+            self.assertGreater(len(chunked.spilled), 0)
+            np.testing.assert_allclose(chunked.grid, reference.grid)
+            # Reads (grid is read every tick) leave tiles, their order and the files alone
+            resident, files = list(chunked.tiles), sorted(os.listdir(path))
+            chunked.local_patch(400, 300)
+            self.assertEqual((list(chunked.tiles), sorted(os.listdir(path))), (resident, files))
+
+            tiles = list(chunked.tiles.values())
+            chunked.reset()
+            self.assertEqual((len(chunked.tiles), len(chunked.spilled), os.listdir(path)), (0, 0, []))
+            chunked.update_ranges((100, 100), 0, [0], [50], 150)
+            self.assertTrue(any(tile is chunked.tiles[key] for tile in tiles for key in chunked.tiles))
+            self.assertFalse(np.any(chunked.grid[:, :15]))
+
+    def test_close_removes_its_spill_directory(self):
+        chunked = ChunkedSlamMap(800, 600, tile_size=16, max_tiles=2)
+        for pos, angle, rel_angles, distances in self.scans(count=5):
+            chunked.update_ranges(pos, angle, rel_angles, distances, 150)
+        spill_dir = chunked.spill_dir
+        self.assertTrue(os.listdir(spill_dir))
+        chunked.close()
+        self.assertFalse(os.path.exists(spill_dir))
+
+    def test_unbounded_world(self):
+        chunked = ChunkedSlamMap(800, 600)
+        far = 5_000_000  # 5 km at 1 px per mm
+        chunked.update_ranges((far, far), 0, [0], [50], 200)
+        chunked.update_ranges((-far, 2), 180, [0], [50], 200)
+        cell = far // chunked.resolution
+        self.assertAlmostEqual(float(chunked.window(cell + 10, cell, 1, 1)[0, 0]), 0.4)
+        # Heading -x, the hit is on a cell boundary: the obstacle is the cell beyond it
+        self.assertAlmostEqual(float(chunked.window(-cell - 11, 0, 1, 1)[0, 0]), 0.4)
+        self.assertAlmostEqual(float(chunked.window(-cell - 10, 0, 1, 1)[0, 0]), -0.2)
+        self.assertLessEqual(len(chunked.tiles), 4)  # Only the tiles the two scans touched
+        self.assertFalse(np.any(chunked.grid))
+
+    def test_dense_reset_keeps_grid(self):
+        slam_map = SlamMap(800, 600)
+        grid = slam_map.grid
+        slam_map.update((100, 100), 0, [(50, 0)])
+        slam_map.reset()
+        self.assertIs(slam_map.grid, grid)
+        self.assertFalse(np.any(grid))
+
+    def test_reset_leaves_the_surface_to_draw(self):
+        # The simulation thread resets while the render thread draws: reset must not paint
+        for slam_map in (SlamMap(200, 100), ChunkedSlamMap(200, 100)):
+            slam_map.update((100, 50), 0, [(50, 0)])
+            slam_map.draw()
+            before = pygame.surfarray.array3d(slam_map.surface)
+            slam_map.reset()
+            np.testing.assert_array_equal(pygame.surfarray.array3d(slam_map.surface), before)
+            self.assertEqual(pygame.surfarray.array3d(slam_map.draw()).min(), 255)  # The next draw clears it
+            self.assertFalse(np.any(slam_map.grid))
+
+    def test_simulator_with_chunked_map(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True, observation="local",
+                              chunked_slam=True, seed=0)
+        for _ in range(3):
+            state, _, _ = simulator.step(0)
+        snapshot = simulator.snapshot()
+        simulator.slam_map.reset()
+        np.testing.assert_array_equal(simulator.restore(snapshot), state)
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        self.simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True)
+
+    def tearDown(self):
+        profiling.disable()
+        pygame.quit()
+
+    def test_histogram_percentiles(self):
+        histogram = profiling.Histogram()
+        for i in range(1, 101):
+            histogram.add(i * 1e-3)
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.05, delta=0.05 * 0.13)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.099, delta=0.099 * 0.13)
+        self.assertEqual(histogram.count, 100)
+
+    def test_profiler_records_from_several_threads(self):
+        profiler = profiling.Profiler()
+
+        def record():
+            for _ in range(2000):
+                profiler.record('simulator.step', 1e-4)
+                profiler.record('simulator.draw_frame', 1e-3)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        phases = profiler.summary()['phases']
+        self.assertEqual(phases['simulator.step']['count'], 8000)
+        self.assertEqual(phases['simulator.draw_frame']['count'], 8000)
+
+    def test_enable_records_phases_and_disable_restores(self):
+        original_step = Simulator.step
+        profiler = profiling.enable()
+        self.assertIsNot(Simulator.step, original_step)
+        for _ in range(5):
+            self.simulator.step(0)
+        summary = profiler.summary()
+        self.assertEqual(summary['phases']['simulator.step']['count'], 5)
+        self.assertEqual(summary['phases']['slam_map.update_ranges']['count'], 5)
+        self.assertGreater(summary['steps_per_s'], 0)
+
+        profiling.disable()
+        self.assertIs(Simulator.step, original_step)
+        self.simulator.step(0)
+        self.assertEqual(profiler.summary()['phases']['simulator.step']['count'], 5)
+
+    def test_exports(self):
+        profiler = profiling.enable()
+        self.simulator.step(0)
+        with tempfile.TemporaryDirectory() as path:
+            jsonl_path = os.path.join(path, 'profile.jsonl')
+            profiler.write_jsonl(jsonl_path)
+            profiler.write_jsonl(jsonl_path)
+            with open(jsonl_path) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(len(lines), 2)
+            self.assertIn('simulator.step', lines[0]['phases'])
+
+            prometheus_path = os.path.join(path, 'sim.prom')
+            profiler.write_prometheus(prometheus_path)
+            with open(prometheus_path) as f:
+                text = f.read()
+            self.assertIn('sim_phase_seconds{phase="simulator.step",quantile="0.99"}', text)
+            self.assertIn('sim_steps_per_second ', text)
+
+    def test_enable_instruments_the_agent_on_first_import(self):
+        # Manual driving with the profiler on stays torch-free; the agent is timed once built
+        code = ("import sys, profiling, simulator; p = profiling.enable(); "
+                "s = simulator.Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True); "
+                "s.step(0); print('torch' in sys.modules); "
+                "s.agent.get_action(s.get_state()); print(p.summary()['phases']['agent.get_action']['count'])")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1'))
+        self.assertEqual(output.stdout.split(), ['False', '1'])
+
+class TestBenchmarks(unittest.TestCase):
+    def test_compare_flags_regressions(self):
+        baseline = [suite.result('radar_scan', {'obstacles': 5}, 1.0, 's'),
+                    suite.result('simulator_step', {'observation': 'slam'}, 1000.0, 'steps/s', False)]
+        results = [suite.result('radar_scan', {'obstacles': 5}, 1.1, 's'),
+                   suite.result('simulator_step', {'observation': 'slam'}, 700.0, 'steps/s', False),
+                   suite.result('radar_scan', {'obstacles': 50}, 9.0, 's')]
+        regressions = suite.compare(results, baseline, threshold=0.2)
+        self.assertEqual([record['name'] for record, _, _ in regressions], ['simulator_step'])
+        self.assertEqual(suite.compare(results, baseline, threshold=0.5), [])
+
+    def test_cli_writes_results_and_compares_baseline(self):
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'results.json')
+            self.assertEqual(suite.main(['--quick', '--only', 'replay_sampling', '--output', output]), 0)
+            with open(output) as f:
+                data = json.load(f)
+            self.assertEqual(data['meta']['seed'], suite.SEED)
+            names = {record['name'] for record in data['results']}
+            self.assertEqual(names, {'sum_tree_find', 'peak_rss'})
+
+            # A baseline that was 100x faster makes every timing a regression
+            for record in data['results']:
+                record['value'] /= 100
+            baseline = os.path.join(path, 'baseline.json')
+            with open(baseline, 'w') as f:
+                json.dump(data, f)
+            self.assertEqual(suite.main(['--quick', '--only', 'replay_sampling', '--output', output,
+                                         '--baseline', baseline]), 1)
+
+    def test_simulator_step_does_not_import_torch(self):
+        # Its peak_rss would otherwise be mostly torch
+        code = "import sys; from benchmarks import suite; suite.bench_simulator_step(True); print('torch' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1'))
+        self.assertEqual(output.stdout.strip(), 'False')
+
 class TestCar(unittest.TestCase):
     def setUp(self):
         self.car = Car(400, 300, 5, 0.1, 0.05)
@@ -108,6 +591,44 @@ class TestCar(unittest.TestCase):
             self.car.move(keys)
         self.assertGreater(self.car.rect.x, initial_x)
 
+    def test_slow_car_moves_sub_pixel(self):
+        # 0.3 px per step used to be truncated away by the integer Rect
+        self.car.speed = 0.3
+        self.car.deceleration = 0
+        for _ in range(10):
+            self.car.update_position()
+        self.assertAlmostEqual(self.car.x, 403.0)
+        self.assertEqual(self.car.rect.center, (403, 300))
+
+    def test_rect_and_image_are_built_on_demand(self):
+        self.assertFalse(hasattr(self.car, '__dict__'))
+        rect = self.car.rect
+        rect.center = (0, 0)  # A copy: the car does not move
+        self.assertEqual(self.car.center, (400, 300))
+        self.assertIs(self.car.image, Car(0, 0, 5, 0.1, 0.05).image)
+
+    def test_fixed_timestep_substeps(self):
+        keys = {pygame.K_UP: True, pygame.K_DOWN: False, pygame.K_LEFT: False, pygame.K_RIGHT: False}
+        fine = Car(400, 300, 5, 0.1, 0.05, dt=1.0, substeps=4)
+        for _ in range(10):
+            self.car.move(keys)
+            fine.move(keys)
+        self.assertAlmostEqual(fine.x, self.car.x)
+
+    def test_bicycle_model_turns_with_speed(self):
+        keys = {pygame.K_UP: False, pygame.K_DOWN: False, pygame.K_LEFT: True, pygame.K_RIGHT: False}
+        car = Car(400, 300, 5, 0.1, 0, model='bicycle')
+        car.move(keys)
+        self.assertEqual(car.angle, 0)  # Standing still: steering does not rotate the car
+        car.speed = 3
+        for _ in range(10):
+            car.move(keys)
+        self.assertGreater(car.angle, 0)
+        self.assertLess(car.y, 300)  # Turning left bends the path upwards on screen
+        keys[pygame.K_LEFT] = False
+        car.move(keys)
+        self.assertEqual(car.steering, 0)
+
 class TestRadar(unittest.TestCase):
     def setUp(self):
         self.radar = Radar(200, 60)
@@ -128,6 +649,388 @@ class TestRadar(unittest.TestCase):
             self.assertIsInstance(distance, (int, float))
             self.assertIsInstance(angle, (int, float))
 
+    def test_radar_scan_returns_nearest_hit(self):
+        # The far obstacle comes first in the list but is occluded by the near one
+        obstacles = [Obstacle(550, 280, 30, 40), Obstacle(450, 280, 30, 40)]
+        detections = dict((angle, distance) for distance, angle in self.radar.scan(self.car, obstacles))
+        self.assertAlmostEqual(detections[0], 50)
+
+    def test_radar_scan_ranges(self):
+        rel_angles, distances = self.radar.scan_ranges(self.car, self.obstacles)
+        self.assertEqual(rel_angles.shape, distances.shape)
+        self.assertEqual(list(rel_angles), list(range(-30, 31, 5)))
+        self.assertAlmostEqual(distances[list(rel_angles).index(0)], 100)
+        self.assertTrue(np.isinf(distances[0]))
+
+    def test_scan_cache_follows_pose_and_obstacles(self):
+        obstacles = ObstacleSet(self.obstacles)
+        first = self.radar.scan_ranges(self.car, obstacles)
+        self.assertIs(self.radar.scan_ranges(self.car, obstacles), first)
+        self.assertEqual(self.radar.scan(self.car, obstacles), self.radar.scan(self.car, obstacles))
+        self.assertEqual(self.radar.computed_scans, 1)
+        with self.assertRaises(ValueError):
+            first[1][0] = 0  # Shared by every consumer, so read-only
+
+        self.car.x += 1
+        self.assertAlmostEqual(self.radar.scan_ranges(self.car, obstacles)[1][6], 99)
+        obstacles.append(Obstacle(450, 290, 10, 20))
+        self.assertAlmostEqual(self.radar.scan_ranges(self.car, obstacles)[1][6], 49)
+        self.assertEqual(self.radar.computed_scans, 3)
+
+        # Plain lists carry no version and are scanned every time
+        self.radar.scan_ranges(self.car, self.obstacles)
+        self.radar.scan_ranges(self.car, self.obstacles)
+        self.assertEqual(self.radar.computed_scans, 5)
+
+    def test_beam_layouts(self):
+        np.testing.assert_array_equal(beam_offsets(60), np.arange(-30, 31, 5))
+        lidar = beam_offsets(360, spacing=0.25)
+        self.assertEqual(len(lidar), 1440)  # -180 and +180 are the same beam
+        self.assertEqual((lidar[0], lidar[-1]), (-180, 179.75))
+        np.testing.assert_allclose(beam_offsets(90, num_beams=4), [-45, -15, 15, 45])
+        np.testing.assert_allclose(beam_offsets(360, num_beams=4), [-180, -90, 0, 90])
+
+    def test_beam_layouts_are_centred(self):
+        np.testing.assert_array_equal(beam_offsets(60, 5, 1), [0])  # One beam looks straight ahead
+        np.testing.assert_array_equal(beam_offsets(360, num_beams=1), [0])
+        uneven = beam_offsets(60, 7)  # 7 does not divide 60: 9 beams, centred in the cone
+        np.testing.assert_allclose(uneven, np.arange(-28, 29, 7))
+        np.testing.assert_allclose(uneven, -uneven[::-1])
+        self.assertTrue(np.all(np.abs(uneven) <= 30))
+        circle = beam_offsets(360, 7)
+        self.assertIn(0, circle)
+        self.assertTrue(np.all((circle >= -180) & (circle < 180)))
+        radar = Radar(200, 60, num_beams=1)
+        self.car.angle = 0
+        _, distances = radar.scan_ranges(self.car, [Obstacle(self.car.x + 50, self.car.y - 5, 10, 10)])
+        self.assertAlmostEqual(distances[0], 50)
+
+    def test_rotated_direction_table_matches_trig(self):
+        radar = Radar(200, 120, spacing=0.5)
+        self.car.angle = 37.5
+        angles = np.radians(radar.beam_angles(self.car))
+        np.testing.assert_allclose(radar.beam_directions(self.car),
+                                   np.stack([np.cos(angles), -np.sin(angles)], axis=-1), atol=1e-12)
+
+    def test_dense_lidar_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        obstacles = [Obstacle(int(x), int(y), 12, 12) for x, y in rng.integers(0, 800, (400, 2))]
+        radar = Radar(200, 360, spacing=0.25)
+        self.car.angle = 10
+        rel_angles, indexed = radar.scan_ranges(self.car, ObstacleSet(obstacles))
+        _, brute = radar.scan_ranges(self.car, obstacles)
+        self.assertEqual(len(rel_angles), 1440)
+        np.testing.assert_allclose(indexed, brute)
+        self.assertTrue(np.isfinite(indexed).any())
+
+        narrow = Radar(400, 10)  # Three beams: the grid is walked along each one
+        np.testing.assert_allclose(narrow.scan_ranges(self.car, ObstacleSet(obstacles))[1],
+                                   narrow.scan_ranges(self.car, obstacles)[1])
+
+    def test_simulator_scans_once_per_tick(self):
+        pygame.init()
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, observation="radar", seed=0)
+        simulator.step(0)
+        before = simulator.radar.computed_scans
+        simulator.step(0)
+        simulator.update_display(tick=False)
+        self.assertEqual(simulator.radar.computed_scans, before + 1)
+        pygame.quit()
+
+class TestSpatialIndex(unittest.TestCase):
+    def test_uniform_grid_queries(self):
+        grid = UniformGrid(cell_size=50)
+        grid.insert(0, (10, 10, 20, 20))
+        grid.insert(1, (300, 10, 20, 20))
+        self.assertEqual(grid.query_rect((0, 0, 40, 40)), {0})
+        self.assertEqual(grid.query_ray((0, 20), (1, 0), 400), {0, 1})
+        self.assertEqual(grid.query_ray((0, 20), (1, 0), 100), {0})
+        grid.remove(0)
+        self.assertEqual(grid.query_rect((0, 0, 40, 40)), set())
+
+    def test_obstacle_set_tracks_mutations(self):
+        obstacles = ObstacleSet([Obstacle(0, 0, 10, 10), Obstacle(100, 100, 10, 10)])
+        self.assertTrue(obstacles.any_overlap(pygame.Rect(5, 5, 10, 10)))
+        obstacles.pop(0)
+        self.assertFalse(obstacles.any_overlap(pygame.Rect(5, 5, 10, 10)))
+        self.assertEqual(obstacles.overlapping(pygame.Rect(95, 95, 10, 10)), [obstacles[0]])
+        obstacles.clear()
+        self.assertEqual(obstacles.rect_array().shape, (0, 4))
+
+    def test_obstacle_set_reindexes_on_reorder(self):
+        obstacles = ObstacleSet([Obstacle(0, 0, 10, 10), Obstacle(100, 100, 10, 10)])
+        for reorder in (obstacles.reverse, lambda: obstacles.sort(key=lambda o: o.rect.x),
+                        lambda: obstacles.sort(key=lambda o: -o.rect.x)):
+            version = obstacles.version
+            reorder()
+            self.assertNotEqual(obstacles.version, version)
+            self.assertTrue(obstacles.any_overlap((2, 2, 3, 3)))
+            np.testing.assert_array_equal(obstacles.rects_within((0, 0, 20, 20)), [[0, 0, 10, 10]])
+        obstacles *= 2
+        self.assertEqual(len(obstacles), 4)
+        self.assertEqual(len(obstacles.overlapping(pygame.Rect(95, 95, 10, 10))), 2)
+        obstacles += [Obstacle(200, 200, 10, 10)]
+        self.assertTrue(obstacles.any_overlap((205, 205, 1, 1)))
+
+    def test_radar_index_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        obstacles = [Obstacle(int(x), int(y), 10, 10) for x, y in rng.integers(0, 800, (500, 2))]
+        car = Car(400, 300, 5, 0.1, 0.05)
+        radar = Radar(200, 360)
+        _, indexed = radar.scan_ranges(car, ObstacleSet(obstacles))
+        _, brute = radar.scan_ranges(car, obstacles)
+        np.testing.assert_allclose(indexed, brute)
+
+class TestOrientedCollision(unittest.TestCase):
+    def test_obb_against_rects(self):
+        rects = [(112, 95, 10, 10),  # Beside the unrotated car, clear of the upright one
+                 (95, 75, 10, 8),    # Above the unrotated car, touched by the upright one
+                 (110, 95, 10, 10)]  # Only touching an edge
+        overlap = obb_aabb_overlap((100, 100), (20, 10), 90, rects)
+        np.testing.assert_array_equal(overlap, [False, True, False])
+        # At 45 degrees the corner of the unrotated rect is empty
+        self.assertFalse(obb_aabb_overlap((100, 100), (20, 10), 45, [(80, 90, 4, 4)])[0])
+        self.assertTrue(obb_aabb_overlap((100, 100), (20, 10), 45, [(110, 85, 4, 4)])[0])
+
+    def test_obb_matches_point_sampling(self):
+        rng = np.random.default_rng(0)
+        centers = rng.uniform(0, 100, (200, 2))
+        angles = rng.uniform(0, 360, 200)
+        rects = np.concatenate([rng.uniform(0, 100, (200, 5, 2)), rng.uniform(1, 30, (200, 5, 2))], axis=-1)
+        overlap = obb_aabb_overlap(centers, (20, 10), angles, rects)
+        self.assertEqual(overlap.shape, (200, 5))
+
+        # Dense samples of each car box; a sample inside a rect proves an overlap
+        u, v = np.meshgrid(np.linspace(-19.9, 19.9, 41), np.linspace(-9.9, 9.9, 21))
+        rad = np.radians(angles)[:, None]
+        px = centers[:, :1] + u.reshape(1, -1) * np.cos(rad) + v.reshape(1, -1) * np.sin(rad)
+        py = centers[:, 1:] - u.reshape(1, -1) * np.sin(rad) + v.reshape(1, -1) * np.cos(rad)
+        inside = ((px[:, None] > rects[..., :1]) & (px[:, None] < rects[..., :1] + rects[..., 2:3]) &
+                  (py[:, None] > rects[..., 1:2]) & (py[:, None] < rects[..., 1:2] + rects[..., 3:])).any(axis=-1)
+        self.assertTrue(np.all(overlap[inside]))
+        self.assertGreater(inside.sum(), 100)
+
+    def test_simulator_uses_rotated_car(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 0, headless=True, seed=0)
+        simulator.car.center = (100, 100)
+        simulator.obstacles.append(Obstacle(112, 95, 10, 10))
+        self.assertTrue(simulator.check_collision())
+        simulator.car.angle = 90
+        self.assertFalse(simulator.check_collision())
+
+class TestMovingObstacles(unittest.TestCase):
+    def test_behaviours(self):
+        movers = MovingObstacles((0, 0, 200, 100), max_speed=3, seed=0)
+        movers.add(0, 0, 10, 10, 10, 0, behaviour='patrol', patrol_to=[(100, 0)])
+        movers.add(185, 50, 10, 10, 4, -3, behaviour='bounce')
+        movers.add(100, 50, 10, 10, 0, 0, behaviour='random_walk')
+        xs = []
+        for _ in range(20):
+            movers.update()
+            xs.append(movers.x[0])
+            self.assertTrue(np.all((movers.x >= 0) & (movers.x <= 190) & (movers.y >= 0) & (movers.y <= 90)))
+        self.assertAlmostEqual(xs[9], 100)
+        self.assertAlmostEqual(xs[19], 0)
+        self.assertLess(movers.vx[1], 0)  # Bounced off the right edge
+        self.assertLessEqual(np.hypot(movers.vx[2], movers.vy[2]), 3 + 1e-9)
+
+    def test_incremental_index_stays_exact(self):
+        movers = MovingObstacles((0, 0, 800, 600), seed=1)
+        movers.spawn(300, behaviour=['bounce', 'patrol', 'random_walk'] * 100)
+        version = movers.version
+        for _ in range(100):
+            movers.update()
+        self.assertNotEqual(movers.version, version)
+        for i in range(len(movers)):
+            self.assertEqual(sorted(movers.index.item_cells[i]),
+                             sorted(movers.index._covered_cells(movers._rect(i))))
+        rng = np.random.default_rng(2)
+        for x, y in rng.uniform(0, 700, (20, 2)):
+            rects = movers.rect_array()
+            brute = ((rects[:, 0] < x + 100) & (rects[:, 0] + rects[:, 2] > x) &
+                     (rects[:, 1] < y + 100) & (rects[:, 1] + rects[:, 3] > y)).any()
+            self.assertEqual(movers.any_overlap((x, y, 100, 100)), brute)
+
+    def test_simulator_sees_and_hits_movers(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 0, headless=True, observation="radar",
+                              num_movers=20, seed=3)
+        self.assertFalse(simulator.check_collision())  # Spawned clear of the start
+        simulator.movers.add(440, 290, 20, 20, -1, 0)
+        rel_angles, distances = simulator.radar.scan_ranges(simulator.car, simulator.scene)
+        self.assertAlmostEqual(distances[list(rel_angles).index(0)], 40)
+        simulator.movers.update()  # Moves one pixel closer and invalidates the cached scan
+        rel_angles, distances = simulator.radar.scan_ranges(simulator.car, simulator.scene)
+        self.assertAlmostEqual(distances[list(rel_angles).index(0)], 39)
+        simulator.movers.add(400, 300, 10, 10, 0, 0)
+        self.assertTrue(simulator.check_collision())
+
+    def test_reset_clears_the_start_area(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 0, headless=True, observation="radar",
+                              num_movers=150, seed=0)
+        blocked = 0
+        for _ in range(100):
+            simulator.step(0)
+            blocked += simulator.movers.any_overlap(simulator.start_area)
+            simulator.reset()
+            self.assertFalse(simulator.check_collision())
+            self.assertFalse(simulator.movers.any_overlap(simulator.start_area))
+        self.assertGreater(blocked, 10)  # Movers did drift back in
+        for i in range(len(simulator.movers)):  # Moved movers are re-indexed
+            self.assertEqual(sorted(simulator.movers.index.item_cells[i]),
+                             sorted(simulator.movers.index._covered_cells(simulator.movers._rect(i))))
+
+    def test_snapshot_restores_movers(self):
+        simulator = Simulator(800, 600, 5, 0.1, 0.05, 200, 60, 5, headless=True, num_movers=50,
+                              mover_behaviour="random_walk", seed=4)
+        snapshot = simulator.snapshot()
+        first = [simulator.step(0)[0] for _ in range(5)]
+        simulator.restore(snapshot)
+        second = [simulator.step(0)[0] for _ in range(5)]
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a, b)
+
+class TestMultiCarWorld(unittest.TestCase):
+    def test_sweep_pairs_match_brute_force(self):
+        rng = np.random.default_rng(0)
+        boxes = np.concatenate([rng.uniform(0, 200, (300, 2)), rng.uniform(1, 20, (300, 2))], axis=1)
+        x, y, w, h = boxes.T
+        brute = {(a, b) for a in range(300) for b in range(a + 1, 300)
+                 if x[a] < x[b] + w[b] and x[b] < x[a] + w[a] and y[a] < y[b] + h[b] and y[b] < y[a] + h[a]}
+        first, second = sweep_pairs(boxes)
+        self.assertEqual(set(zip(first.tolist(), second.tolist())), brute)
+        self.assertEqual(len(first), len(brute))
+
+    def test_oriented_box_overlap_and_rays(self):
+        half = (20, 10)
+        self.assertTrue(obb_obb_overlap((0, 0), half, 0, (35, 0), half, 0))
+        self.assertFalse(obb_obb_overlap((0, 0), half, 0, (41, 0), half, 0))
+        self.assertTrue(obb_obb_overlap((0, 0), half, 0, (0, 25), half, 90))
+        self.assertFalse(obb_obb_overlap((0, 0), half, 45, (28, 28), half, 45))  # Side by side, diagonal
+        # Ray along +x against a box rotated by 90 degrees: its short side faces the ray
+        distances = ray_obb_distances((0, 0), [[1, 0]], [(100, 0)], half, [90], 200)
+        self.assertAlmostEqual(distances[0, 0], 90)
+        self.assertTrue(np.isinf(ray_obb_distances((0, 0), [[1, 0]], [(100, 50)], half, [0], 200)[0, 0]))
+
+    def place(self, world, *poses):
+        for i, (x, y, angle) in enumerate(poses):
+            world.car_x[i], world.car_y[i], world.car_angle[i] = x, y, angle
+
+    def test_radar_sees_other_cars(self):
+        world = MultiCarWorld(2, 800, 600, 5, 0.1, 0.05, 200, 60, 0, seed=0)
+        self.place(world, (100, 300, 0), (200, 300, 90))
+        distances = world.scan()
+        ahead = list(world.radar.offsets).index(0)
+        self.assertAlmostEqual(distances[0, ahead], 90)  # Rotated car: 10 px half width
+        self.assertTrue(np.isinf(distances[1]).all())  # Facing away, and never sees itself
+
+    def test_crash_ends_both_episodes(self):
+        world = MultiCarWorld(3, 800, 600, 5, 0.1, 0.05, 200, 60, 0, seed=1)
+        self.place(world, (100, 300, 0), (135, 305, 180), (500, 500, 0))
+        world.goals[:] = (700, 50, 20, 20)
+        _, rewards, dones, _ = world.step([0, 0, 0])
+        np.testing.assert_array_equal(rewards, [-100, -100, -1])
+        np.testing.assert_array_equal(dones, [True, True, False])
+        hit_car, hit_obstacle = world.collisions()
+        self.assertFalse(hit_car.any() or hit_obstacle.any())  # Both respawned apart
+
+    def test_broad_phase_matches_brute_force(self):
+        world = MultiCarWorld(150, 800, 600, 5, 0.2, 0.15, 200, 60, 20, seed=2, num_movers=10)
+        rng = np.random.default_rng(3)
+        for _ in range(30):
+            states, rewards, dones, _ = world.step(rng.integers(0, 4, 150))
+        self.assertEqual(states.shape, (150, world.state_dim))
+        n = world.num_cars
+        centers = world.car_centers()
+        directions = world.beam_directions()
+        to_cars = ray_obb_distances(centers, directions, np.broadcast_to(centers, (n, n, 2)), (20, 10),
+                                    np.broadcast_to(world.car_angle, (n, n)), 200)
+        to_cars[np.arange(n), :, np.arange(n)] = np.inf
+        rects = world.scene.rect_array()
+        expected = np.minimum(to_cars.min(axis=-1), ray_aabb_distances(centers, directions, rects, 200))
+        np.testing.assert_allclose(world.scan(), expected)
+
+        overlap = obb_obb_overlap(centers[:, None], (20, 10), world.car_angle[:, None],
+                                  centers[None], (20, 10), world.car_angle[None])
+        np.fill_diagonal(overlap, False)
+        hit_car, hit_obstacle = world.collisions()
+        np.testing.assert_array_equal(hit_car, overlap.any(axis=1))
+        np.testing.assert_array_equal(hit_obstacle, obb_aabb_overlap(centers, (20, 10), world.car_angle, rects).any(axis=1))
+
+    def test_matches_vector_simulator_without_obstacles(self):
+        # Same cars, goals and actions: the shared dynamics and state layout agree
+        world = MultiCarWorld(2, 800, 600, 5, 0.1, 0.05, 200, 60, 0, seed=4, observation="slam")
+        envs = VectorSimulator(2, 800, 600, 5, 0.1, 0.05, 200, 60, 0, seed=4)
+        self.place(world, (100, 100, 0), (600, 400, 45))
+        self.place(envs, (100, 100, 0), (600, 400, 45))
+        envs.goals[:] = world.goals
+        for action in [0, 0, 2, 0, 3, 1]:
+            states, rewards, dones, truncated = world.step([action, action])
+            expected = envs.step([action, action])
+            for got, want in zip((states, rewards, dones, truncated), expected):
+                np.testing.assert_allclose(got, want)
+        np.testing.assert_allclose(world.beam_directions(), envs.beam_directions())
+
+class TestVectorSimulator(unittest.TestCase):
+    def setUp(self):
+        self.envs = VectorSimulator(8, 800, 600, 5, 0.1, 0.05, 200, 60, 5, seed=0)
+
+    def test_initialization(self):
+        self.assertEqual(self.envs.obstacles.shape, (8, 5, 4))
+        self.assertEqual(self.envs.grids.shape, (8, 120, 160))
+        self.assertEqual(self.envs.state_dim, 120 * 160 + 6)
+
+    def test_step_shapes(self):
+        states, rewards, dones, truncated = self.envs.step(np.zeros(8, dtype=np.int64))
+        self.assertEqual(states.shape, (8, self.envs.state_dim))
+        self.assertEqual(rewards.shape, (8,))
+        self.assertEqual(dones.dtype, bool)
+        self.assertEqual(truncated.dtype, bool)
+        self.assertTrue(np.all(self.envs.car_speed > 0))
+
+    def test_compact_observations(self):
+        for observation, size in (("local", 16 * 16 + 6), ("radar", 13 + 6)):
+            envs = VectorSimulator(4, 800, 600, 5, 0.1, 0.05, 200, 60, 5, seed=0, observation=observation)
+            states, _, _, _ = envs.step(np.zeros(4, dtype=np.int64))
+            self.assertEqual(states.shape, (4, size))
+            self.assertEqual(envs.state_dim, size)
+
+    def test_radar_observation_keeps_no_grids(self):
+        envs = VectorSimulator(4, 800, 600, 5, 0.1, 0.05, 200, 60, 5, seed=0, observation="radar", max_steps=3)
+        self.assertEqual(envs.grids.shape, (0, 120, 160))
+        for _ in range(4):  # Past max_steps, so every env resets once
+            states, _, _, _ = envs.step(np.zeros(4, dtype=np.int64))
+        self.assertEqual(states.shape, (4, 13 + 6))
+
+    def test_crowded_world_raises(self):
+        with self.assertRaises(RuntimeError):
+            VectorSimulator(2, 100, 100, 5, 0.1, 0.05, 100, 60, 50, max_attempts=20)
+
+    def test_collision_auto_resets_env(self):
+        self.envs.obstacles[3, 0] = (self.envs.car_x[3] + 5, self.envs.car_y[3] - 15, 30, 30)
+        self.envs.car_speed[3] = 4
+        _, rewards, dones, truncated = self.envs.step(np.zeros(8, dtype=np.int64))
+        self.assertEqual(rewards[3], -100)
+        self.assertTrue(dones[3])
+        self.assertFalse(truncated[3])
+        self.assertEqual(self.envs.car_speed[3], 0)
+        self.assertEqual(self.envs.car_x[3], 400)
+
+    def test_timeout_is_truncated_not_done(self):
+        envs = VectorSimulator(4, 800, 600, 5, 0.1, 0.05, 200, 60, 0, seed=0, max_steps=2)
+        _, _, dones, truncated = envs.step(np.full(4, 2))  # Turning in place: no goal, no crash
+        self.assertFalse(dones.any() or truncated.any())
+        _, rewards, dones, truncated = envs.step(np.full(4, 2))
+        np.testing.assert_array_equal(rewards, -1)
+        self.assertFalse(dones.any())
+        self.assertTrue(truncated.all())
+        np.testing.assert_array_equal(envs.steps, 0)  # Still restarted
+
+    def test_radar_detects_obstacle_ahead(self):
+        self.envs.obstacles[0] = (0, 0, 1, 1)
+        self.envs.obstacles[0, 0] = (500, 280, 30, 40)
+        distances = self.envs.scan()
+        self.assertAlmostEqual(distances[0, len(self.envs.beam_offsets) // 2], 100)
+
 class TestDQNAgent(unittest.TestCase):
     def setUp(self):
         state_dim = 100
@@ -146,6 +1049,25 @@ class TestDQNAgent(unittest.TestCase):
         self.assertIsInstance(action, int)
         self.assertTrue(0 <= action < 4)
 
+    def test_get_actions_batch(self):
+        states = np.random.rand(64, 100)
+        actions = self.agent.get_actions(states)
+        self.assertEqual(actions.shape, (64,))
+        self.assertTrue(np.all((0 <= actions) & (actions < 4)))
+
+        self.agent.epsilon = 0
+        with torch.no_grad():
+            expected = self.agent.model(torch.tensor(states, dtype=torch.float32)).argmax(dim=1).numpy()
+        np.testing.assert_array_equal(self.agent.get_actions(states), expected)
+        self.assertEqual(self.agent.get_action(states[0]), expected[0])
+
+    def test_scripted_inference_tracks_training(self):
+        agent = DQNAgent(100, 4, epsilon=0, inference_backend="script")
+        states = np.random.rand(16, 100)
+        with torch.no_grad():
+            agent.model.fc3.bias.copy_(torch.tensor([0.0, 0.0, 1e6, 0.0]))  # As if updated by training
+        np.testing.assert_array_equal(agent.get_actions(states), np.full(16, 2))
+
     def test_remember(self):
         initial_memory_size = len(self.agent.memory)
         self.agent.remember(np.zeros(100), 0, 1, np.ones(100), False)
@@ -163,5 +1085,184 @@ class TestDQNAgent(unittest.TestCase):
         # Check if epsilon decayed
         self.assertLess(self.agent.epsilon, 1.0)
 
+class TestReplayBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReplayBuffer(8, 5, quantized_dim=3, seed=0)
+
+    def make_state(self, i):
+        return np.array([0.2, 0.6, 1.0, i, -i], dtype=np.float64)
+
+    def test_consecutive_states_use_one_slot(self):
+        states = [self.make_state(i) for i in range(4)]
+        for i in range(3):
+            self.buffer.add(states[i], i, float(i), states[i + 1], False)
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(self.buffer.size, 4)
+        self.assertEqual(self.buffer.quantized.dtype, np.uint8)
+
+    def test_sample_round_trips_transitions(self):
+        self.buffer.add(self.make_state(0), 1, 0.5, self.make_state(1), False)
+        self.buffer.add(self.make_state(7), 2, -1.0, self.make_state(8), True)  # Episode boundary
+        states, actions, rewards, next_states, dones = self.buffer.sample(64)
+        self.assertEqual(states.dtype, np.float32)
+        for state, action, reward, next_state, done in zip(states, actions, rewards, next_states, dones):
+            start = state[3]
+            np.testing.assert_allclose(state, self.make_state(start), rtol=1e-6)
+            np.testing.assert_allclose(next_state, self.make_state(start + 1), rtol=1e-6)
+            self.assertEqual(action, 1 if start == 0 else 2)
+            self.assertEqual(bool(done), start == 7)
+
+    def test_wraparound_drops_oldest(self):
+        for i in range(20):
+            self.buffer.add(self.make_state(i), 0, 0.0, self.make_state(i + 1), False)
+        self.assertEqual(len(self.buffer), 7)
+        states, _, _, next_states, _ = self.buffer.sample(32)
+        self.assertTrue(np.all(states[:, 3] >= 13))
+        np.testing.assert_allclose(next_states[:, 3], states[:, 3] + 1)
+
+    def test_memmap_buffer_resumes(self):
+        with tempfile.TemporaryDirectory() as path:
+            buffer = ReplayBuffer(8, 5, quantized_dim=3, path=path)
+            for i in range(4):
+                buffer.add(self.make_state(i), i, 0.0, self.make_state(i + 1), False)
+            buffer.flush()
+            del buffer
+
+            resumed = ReplayBuffer(8, 5, quantized_dim=3, path=path)
+            self.assertEqual(len(resumed), 4)
+            self.assertIsInstance(resumed.quantized, np.memmap)
+            # Continuing from the stored next_state reuses its slot
+            resumed.add(self.make_state(4), 0, 0.0, self.make_state(5), False)
+            self.assertEqual(len(resumed), 5)
+            self.assertEqual(resumed.size, 6)
+            states, actions, _, next_states, _ = resumed.sample(32)
+            np.testing.assert_allclose(next_states[:, 3], states[:, 3] + 1)
+
+            with self.assertRaises(ValueError):
+                ReplayBuffer(16, 5, quantized_dim=3, path=path)
+
+class TestPrioritizedReplay(unittest.TestCase):
+    def test_sum_tree(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [1.0, 0.0, 2.0, 3.0, 4.0])
+        self.assertEqual(tree.total, 10.0)
+        np.testing.assert_array_equal(tree.find([0.5, 1.0, 2.9, 3.0, 9.99]), [0, 2, 2, 3, 4])
+        tree.update([4], [0.0])
+        self.assertEqual(tree.total, 6.0)
+
+    def test_sampling_follows_priorities(self):
+        buffer = PrioritizedReplayBuffer(16, 2, seed=0, alpha=1.0)
+        for i in range(4):
+            buffer.add(np.array([i, 0.0]), 0, 0.0, np.array([i + 1, 0.0]), False)
+        buffer.update_priorities(np.array([0, 1, 2, 3]), np.array([0.0, 0.0, 0.0, 10.0]))
+        states, _, _, _, _, slots, weights = buffer.sample(32)
+        self.assertGreater(np.mean(slots == 3), 0.9)
+        self.assertEqual(weights.max(), 1.0)
+        self.assertTrue(np.all(states[slots == 3, 0] == 3))
+
+    def test_agent_trains_with_prioritized_replay(self):
+        agent = DQNAgent(10, 4, prioritized=True)
+        state = np.random.rand(10)
+        for _ in range(32):
+            next_state = np.random.rand(10)
+            agent.remember(state, 1, 1.0, next_state, False)
+            state = next_state
+        agent.train()
+        self.assertLess(agent.epsilon, 1.0)
+        # Sampled transitions now carry their TD-error priority instead of the initial one
+        self.assertFalse(np.allclose(agent.memory.tree[np.arange(32)], 1.0))
+
+class TestActorLearner(unittest.TestCase):
+    def test_transition_ring_round_trip(self):
+        ctx = mp.get_context('spawn')
+        ring = TransitionRing(ctx, 4, 5, 3)
+        agent = DQNAgent(5, 4, quantized_dim=3)
+        stop_event = ctx.Event()
+        state = np.array([0.2, 0.4, 1.0, 0.5, -0.5])
+        next_state = np.array([0.0, 0.4, 0.8, 0.25, 0.75])
+        self.assertTrue(ring.put(state, 2, -1.0, next_state, False, stop_event))
+        self.assertEqual(ring.drain_into(agent), 1)
+        self.assertEqual(len(agent.memory), 1)
+        states, actions, _, next_states, _ = agent.memory.sample(1)
+        np.testing.assert_allclose(states[0], state, rtol=1e-6)
+        np.testing.assert_allclose(next_states[0], next_state, rtol=1e-6)
+        self.assertEqual(actions[0], 2)
+
+    def test_transition_ring_put_stops_when_full(self):
+        ctx = mp.get_context('spawn')
+        ring = TransitionRing(ctx, 1, 5, 3)
+        stop_event = ctx.Event()
+        self.assertTrue(ring.put(np.zeros(5), 0, 0.0, np.zeros(5), False, stop_event))
+        stop_event.set()
+        self.assertFalse(ring.put(np.zeros(5), 0, 0.0, np.zeros(5), False, stop_event))
+
+    def test_train_actor_learner(self):
+        simulator_kwargs = dict(width=200, height=150, car_speed=5, car_acceleration=0.1,
+                                car_deceleration=0.05, radar_range=100, radar_angle=60, num_obstacles=3,
+                                headless=False)  # Actors and the learner's agent are headless regardless
+        agent = train_actor_learner(simulator_kwargs, num_actors=1, num_train_steps=10,
+                                    batch_size=8, sync_every=5, max_steps=20)
+        self.assertGreaterEqual(len(agent.memory), 8)
+        self.assertLess(agent.epsilon, 1.0)
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        self.simulator_kwargs = dict(width=200, height=150, car_speed=5, car_acceleration=0.1, car_deceleration=0.05,
+                                     radar_range=100, radar_angle=60, num_obstacles=3, observation="radar")
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'model.pt')
+        Simulator(**self.simulator_kwargs, headless=True).agent.save(self.checkpoint)
+
+    def test_report_is_reproducible_across_processes(self):
+        report = evaluation.evaluate(self.checkpoint, self.simulator_kwargs, num_scenarios=12, num_workers=0,
+                                     max_steps=40, seed=5, chunk_size=5)
+        self.assertEqual([seed for seed, _, _ in report['episodes']], list(range(5, 17)))
+        self.assertAlmostEqual(report['success_rate'] + report['collision_rate'] + report['timeout_rate'], 1)
+        self.assertEqual(report['env_steps'], sum(steps for _, _, steps in report['episodes']))
+        self.assertGreater(report['env_steps_per_s'], 0)
+        for _, outcome, steps in report['episodes']:
+            self.assertTrue(outcome != evaluation.TIMEOUT or steps == 40)
+
+        pooled = evaluation.evaluate(self.checkpoint, self.simulator_kwargs, num_scenarios=12, num_workers=2,
+                                     max_steps=40, seed=5)
+        self.assertEqual(pooled['episodes'], report['episodes'])
+
+    def test_cli_matches_the_trained_layout(self):
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'beams.pt')
+        Simulator(800, 600, 5, 0.2, 0.15, 200, 60, 5, headless=True, observation="radar",
+                  radar_beams=7).agent.save(checkpoint)
+        output = os.path.join(os.path.dirname(checkpoint), 'report.json')
+        self.assertEqual(evaluation.main([checkpoint, '--scenarios', '2', '--workers', '0', '--max-steps', '5',
+                                          '--observation', 'radar', '--radar-beams', '7', '--output', output]), 0)
+        with open(output) as f:
+            self.assertEqual(json.load(f)['scenarios'], 2)
+
+    def test_accepts_headless_in_kwargs(self):
+        report = evaluation.evaluate(self.checkpoint, dict(self.simulator_kwargs, headless=False), num_scenarios=2,
+                                     num_workers=0, max_steps=5)
+        self.assertEqual(report['scenarios'], 2)
+
+    def test_steps_to_goal_distribution(self):
+        episodes = [(0, evaluation.GOAL, 10), (1, evaluation.GOAL, 30), (2, evaluation.COLLISION, 5),
+                    (3, evaluation.TIMEOUT, 100)]
+        report = evaluation.summarize(episodes, 145, 1.0)
+        self.assertEqual(report['success_rate'], 0.5)
+        self.assertEqual(report['steps_to_goal']['p50'], 20)
+        self.assertEqual(report['steps_to_goal']['max'], 30)
+        self.assertIsNone(evaluation.summarize(episodes[2:], 105, 1.0)['steps_to_goal'])
+
+    def test_trained_agent_runs_greedy(self):
+        simulator = Simulator(**self.simulator_kwargs, headless=True, seed=0)
+        agent = simulator.agent
+        agent.load(self.checkpoint)
+        agent.epsilon = 0.5
+        seen = []
+        get_action = agent.get_action
+        agent.get_action = lambda state: seen.append(agent.epsilon) or get_action(state)
+        simulator.run_trained_agent(max_steps=20)
+        self.assertEqual(set(seen), {0})
+        self.assertEqual(agent.epsilon, 0.5)  # Exploration is restored for further training
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
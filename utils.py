@@ -1,3 +1,6 @@
+import math
+import numpy as np
+
 def line_line_intersection(line1_start, line1_end, line2_start, line2_end):
     x1, y1 = line1_start
     x2, y2 = line1_end
@@ -28,4 +31,128 @@ def line_rectangle_intersection(start, end, rect):
         if intersection:
             return intersection
 
-    return None
\ No newline at end of file
+    return None
+
+def ray_aabb_distances(origins, directions, rects, max_range):
+    # Slab-method ray/AABB test for every ray against every rect in one array operation.
+    # origins: (..., 2), directions: (..., B, 2) unit vectors, rects: (..., M, 4) as (x, y, w, h).
+    # Returns (..., B) distances to the nearest rect, np.inf where nothing is hit within max_range.
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    rects = np.asarray(rects, dtype=np.float64)
+    if rects.shape[-2] == 0:
+        return np.full(directions.shape[:-1], np.inf)
+
+    direction = directions[..., :, None, :]                   # (..., B, 1, 2)
+    origin = origins[..., None, None, :]                      # (..., 1, 1, 2)
+    lo = rects[..., None, :, :2]                              # (..., 1, M, 2)
+    hi = lo + rects[..., None, :, 2:]
+    return _slab_distances(origin, direction, lo, hi, max_range).min(axis=-1)
+
+def ray_obb_distances(origins, directions, centers, half_sizes, angles, max_range):
+    # Rays against oriented boxes: each ray is moved into the box's own frame, where the
+    # box is axis-aligned, and hits the slab test there. origins: (..., 2), directions:
+    # (..., B, 2), centers: (..., M, 2), half_sizes: (2,) or (..., M, 2), angles: (..., M)
+    # in degrees. Returns the (..., B, M) distance per ray and box (np.inf for no hit), so
+    # callers can mask pairs, e.g. a car's own box, before taking the minimum.
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+    half_sizes = np.asarray(half_sizes, dtype=np.float64)
+    angles_rad = np.radians(np.asarray(angles, dtype=np.float64))
+    u = np.stack([np.cos(angles_rad), -np.sin(angles_rad)], axis=-1)[..., None, :, :]  # (..., 1, M, 2)
+    v = np.stack([np.sin(angles_rad), np.cos(angles_rad)], axis=-1)[..., None, :, :]
+
+    relative = origins[..., None, None, :] - centers[..., None, :, :]                 # (..., 1, M, 2)
+    direction = directions[..., :, None, :]                                            # (..., B, 1, 2)
+    origin_local = np.stack([(relative * u).sum(-1), (relative * v).sum(-1)], axis=-1)
+    direction_local = np.stack([(direction * u).sum(-1), (direction * v).sum(-1)], axis=-1)
+    half = half_sizes[..., None, :, :] if half_sizes.ndim > 1 else half_sizes
+    return _slab_distances(origin_local, direction_local, -half, half, max_range)
+
+def _slab_distances(origin, direction, lo, hi, max_range):
+    # Slab test on broadcastable (..., 2) arrays, distance per ray/box pair
+    parallel = np.abs(direction) < 1e-12
+    inside = (origin >= lo) & (origin <= hi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1.0 / direction
+        t1 = np.where(parallel, np.where(inside, -np.inf, np.inf), (lo - origin) * inv)
+        t2 = np.where(parallel, np.inf, (hi - origin) * inv)
+    t_near = np.minimum(t1, t2).max(axis=-1)                  # (..., B, M)
+    t_far = np.maximum(t1, t2).min(axis=-1)
+
+    hit = (t_near <= t_far) & (t_far >= 0) & (t_near <= max_range)
+    return np.where(hit, np.maximum(t_near, 0.0), np.inf)
+
+def rects_overlap(a, b):
+    # Strict overlap of (x, y, w, h) rects like pygame.Rect.colliderect, broadcasting over
+    # leading dimensions
+    return ((a[..., 0] < b[..., 0] + b[..., 2]) & (a[..., 0] + a[..., 2] > b[..., 0]) &
+            (a[..., 1] < b[..., 1] + b[..., 3]) & (a[..., 1] + a[..., 3] > b[..., 1]))
+
+def rotate_directions(directions, angles):
+    # A (B, 2) table of unit directions rotated by headings in degrees (counter-clockwise
+    # on screen, y pointing down): (..., B, 2) for angles of shape (...). One 2x2 rotation
+    # per heading instead of trig per beam.
+    angles_rad = np.radians(np.asarray(angles, dtype=np.float64))[..., None]
+    c, s = np.cos(angles_rad), np.sin(angles_rad)
+    bx, by = directions[:, 0], directions[:, 1]
+    return np.stack([c * bx + s * by, c * by - s * bx], axis=-1)
+
+def obb_bounds(center, half_size, angle):
+    # Axis-aligned (x, y, w, h) bounds of an oriented box, for broad-phase queries
+    angle_rad = math.radians(angle)
+    c, s = abs(math.cos(angle_rad)), abs(math.sin(angle_rad))
+    ex = half_size[0] * c + half_size[1] * s
+    ey = half_size[0] * s + half_size[1] * c
+    return center[0] - ex, center[1] - ey, 2 * ex, 2 * ey
+
+def obb_aabb_overlap(centers, half_sizes, angles, rects):
+    # Separating-axis test of oriented boxes against axis-aligned rects, all pairs at once.
+    # centers: (..., 2), half_sizes: (..., 2) half length/width, angles: (...) in degrees
+    # (counter-clockwise on screen, y pointing down), rects: (..., M, 4) as (x, y, w, h).
+    # Returns (..., M) booleans; boxes that only touch do not overlap, like Rect.colliderect.
+    centers = np.asarray(centers, dtype=np.float64)[..., None, :]          # (..., 1, 2)
+    half_sizes = np.asarray(half_sizes, dtype=np.float64)[..., None, :]
+    angles_rad = np.radians(np.asarray(angles, dtype=np.float64))[..., None]
+    rects = np.asarray(rects, dtype=np.float64)
+    cos, sin = np.cos(angles_rad), np.sin(angles_rad)
+
+    half_extent = rects[..., 2:] / 2
+    d = rects[..., :2] + half_extent - centers                             # (..., M, 2)
+    # Box axes in screen coordinates: forward (cos, -sin) and sideways (sin, cos)
+    ux, uy, vx, vy = cos, -sin, sin, cos
+    hl, hw = half_sizes[..., 0], half_sizes[..., 1]
+    rx, ry = half_extent[..., 0], half_extent[..., 1]
+    abs_c, abs_s = np.abs(cos), np.abs(sin)
+
+    # World x and y axes, then the box's own two axes
+    overlap_x = np.abs(d[..., 0]) < rx + hl * abs_c + hw * abs_s
+    overlap_y = np.abs(d[..., 1]) < ry + hl * abs_s + hw * abs_c
+    overlap_u = np.abs(d[..., 0] * ux + d[..., 1] * uy) < hl + rx * abs_c + ry * abs_s
+    overlap_v = np.abs(d[..., 0] * vx + d[..., 1] * vy) < hw + rx * abs_s + ry * abs_c
+    return overlap_x & overlap_y & overlap_u & overlap_v
+
+def obb_obb_overlap(centers_a, half_a, angles_a, centers_b, half_b, angles_b):
+    # Separating-axis test between pairs of oriented boxes, broadcasting like the inputs:
+    # centers (..., 2), half sizes (2,) or (..., 2), angles (...) in degrees. Touching
+    # boxes do not overlap.
+    d = np.asarray(centers_b, dtype=np.float64) - np.asarray(centers_a, dtype=np.float64)
+    half_a = np.asarray(half_a, dtype=np.float64)
+    half_b = np.asarray(half_b, dtype=np.float64)
+
+    def axes(angles):
+        rad = np.radians(np.asarray(angles, dtype=np.float64))
+        c, s = np.cos(rad), np.sin(rad)
+        return np.stack([c, -s], axis=-1), np.stack([s, c], axis=-1)
+
+    u_a, v_a = axes(angles_a)
+    u_b, v_b = axes(angles_b)
+
+    def radius(half, u, v, axis):
+        return half[..., 0] * np.abs((u * axis).sum(-1)) + half[..., 1] * np.abs((v * axis).sum(-1))
+
+    overlap = True
+    for axis in (u_a, v_a, u_b, v_b):
+        overlap = overlap & (np.abs((d * axis).sum(-1)) < radius(half_a, u_a, v_a, axis) + radius(half_b, u_b, v_b, axis))
+    return overlap
@@ -0,0 +1,224 @@
+import numpy as np
+from car import CAR_SIZE, CAR_HALF_SIZE
+from observations import OBSERVATION_MODES, local_patch_shape, local_patches, normalized_ranges
+from slam_map import scan_cells, integrate_scan
+from radar import beam_offsets
+from utils import ray_aabb_distances, obb_aabb_overlap, rects_overlap, rotate_directions
+
+GOAL_SIZE = 20
+
+ACTION_UP, ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT = range(4)
+
+
+class CarBatch:
+    # Cars held as arrays and advanced together, shared by VectorSimulator (one car per
+    # world) and MultiCarWorld (many cars in one world) so their dynamics, rewards and state
+    # layout are the same code; they match Simulator.step / Simulator.get_state. Subclasses
+    # keep car_x, car_y, car_angle, car_speed, steps and goals per car, grids (one per car,
+    # or none when the observation does not read them) and the last scan in
+    # _last_distances, and provide beam_offsets, beam_table and radar_range.
+    @property
+    def state_dim(self):
+        if self.observation == "slam":
+            return self.grid_width * self.grid_height + 6
+        if self.observation == "local":
+            rows, cols = local_patch_shape()
+            return rows * cols + 6
+        return len(self.beam_offsets) + 6
+
+    def beam_directions(self):
+        # (N, B, 2): the beam table rotated by each heading, like Radar.beam_directions
+        return rotate_directions(self.beam_table, self.car_angle)
+
+    def _move_cars(self, actions):
+        up = actions == ACTION_UP
+        down = actions == ACTION_DOWN
+        self.car_speed = np.where(
+            up, np.minimum(self.car_speed + self.acceleration, self.max_speed),
+            np.where(down, np.maximum(self.car_speed - self.acceleration, -self.max_speed / 2),
+                     self.car_speed * (1 - self.deceleration)))
+        self.car_angle += 2 * (actions == ACTION_LEFT) - 2 * (actions == ACTION_RIGHT)
+
+        angle_rad = np.radians(self.car_angle)
+        half_w, half_h = CAR_HALF_SIZE
+        self.car_x = np.clip(self.car_x + self.car_speed * np.cos(angle_rad), half_w, self.width - half_w)
+        self.car_y = np.clip(self.car_y - self.car_speed * np.sin(angle_rad), half_h, self.height - half_h)
+
+    def _outcomes(self, collision, goal_reached):
+        # Rewards like Simulator.step. Hitting max_steps is not terminal (Simulator.train
+        # never records it as done): it is reported as truncated so a learner can bootstrap
+        # instead of treating it as an end.
+        rewards = np.where(collision, -100.0, np.where(goal_reached, 100.0, -1.0))
+        dones = collision | goal_reached
+        truncated = ~dones & (self.steps >= self.max_steps)
+        return rewards, dones, truncated
+
+    def _update_slam(self, distances):
+        # All cars' beams go through one scan_cells/integrate_scan call, like SlamMap.update_ranges
+        if not len(self.grids):
+            return
+        num_cars, num_beams = distances.shape
+        car = np.repeat(np.arange(num_cars), num_beams)
+        angles = (self.car_angle[:, None] + self.beam_offsets).reshape(-1)
+        (free_beam, free_y, free_x), (hit_beam, hit_y, hit_x) = scan_cells(
+            self.car_x[car], self.car_y[car], angles, distances.reshape(-1), self.radar_range, self.resolution)
+        integrate_scan(self.grids, (car[free_beam], free_y, free_x), (car[hit_beam], hit_y, hit_x))
+
+    def get_states(self):
+        num_cars = len(self.car_x)
+        car_state = np.stack([
+            self.car_x / (3 * self.width),  # Same normalisation as Simulator.get_state
+            self.car_y / self.height,
+            self.car_angle / 360,
+            self.car_speed / self.max_speed,
+            (self.goals[:, 0] + self.goals[:, 2] / 2) / (3 * self.width),
+            (self.goals[:, 1] + self.goals[:, 3] / 2) / self.height,
+        ], axis=-1)
+        states = np.empty((num_cars, self.state_dim), dtype=np.float32)
+        if self.observation == "slam":
+            states[:, :-6] = self.grids.reshape(num_cars, -1)
+        elif self.observation == "local":
+            states[:, :-6] = local_patches(self.grids, self.car_x, self.car_y, self.resolution).reshape(num_cars, -1)
+        else:
+            states[:, :-6] = normalized_ranges(self._last_distances, self.radar_range)
+        states[:, -6:] = car_state
+        return states
+
+
+class VectorSimulator(CarBatch):
+    # N independent worlds stepped together. Every per-world quantity lives in a stacked
+    # array indexed by env, so one step() call advances all of them without per-env Python work.
+    def __init__(self, num_envs, width, height, car_speed, car_acceleration, car_deceleration,
+                 radar_range, radar_angle, num_obstacles, resolution=5, max_steps=1000, seed=None,
+                 observation="slam", radar_spacing=5, max_attempts=1000):
+        if observation not in OBSERVATION_MODES:
+            raise ValueError(f"Unknown observation mode {observation!r}, expected one of {OBSERVATION_MODES}")
+        self.observation = observation
+        self.num_envs = num_envs
+        self.width = width  # World width (Simulator.width additionally spans the radar and SLAM views)
+        self.height = height
+        self.max_speed = car_speed
+        self.acceleration = car_acceleration
+        self.deceleration = car_deceleration
+        self.radar_range = radar_range
+        self.radar_angle = radar_angle
+        self.num_obstacles = num_obstacles
+        self.resolution = resolution
+        self.max_steps = max_steps
+        self.max_attempts = max_attempts  # Rejection-sampling tries per goal/obstacle, like Simulator
+        self.rng = np.random.default_rng(seed)
+
+        self.beam_offsets = beam_offsets(radar_angle, radar_spacing)
+        offsets_rad = np.radians(self.beam_offsets)
+        self.beam_table = np.stack([np.cos(offsets_rad), -np.sin(offsets_rad)], axis=-1)  # (B, 2)
+
+        self.grid_width = width // resolution
+        self.grid_height = height // resolution
+        # SLAM grids only when the observation reads them, like MultiCarWorld
+        grid_envs = num_envs if observation != "radar" else 0
+        self.grids = np.zeros((grid_envs, self.grid_height, self.grid_width), dtype=np.float32)
+
+        self.car_x = np.zeros(num_envs)
+        self.car_y = np.zeros(num_envs)
+        self.car_angle = np.zeros(num_envs)
+        self.car_speed = np.zeros(num_envs)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.goals = np.zeros((num_envs, 4))
+        self.obstacles = np.zeros((num_envs, num_obstacles, 4))
+
+        all_envs = np.arange(num_envs)
+        self._reset_cars(all_envs)
+        self._spawn_goals(all_envs, avoid_obstacles=False)
+        self._spawn_obstacles(all_envs)
+        self._last_distances = self.scan()  # Radar observation until the first step
+
+    def car_rects(self):
+        w, h = CAR_SIZE
+        return np.stack([self.car_x - w / 2, self.car_y - h / 2,
+                         np.full(self.num_envs, w), np.full(self.num_envs, h)], axis=-1)
+
+    def _reset_cars(self, env_ids):
+        self.car_x[env_ids] = self.width // 2
+        self.car_y[env_ids] = self.height // 2
+        self.car_angle[env_ids] = 0
+        self.car_speed[env_ids] = 0
+        self.steps[env_ids] = 0
+
+    def _spawn_goals(self, env_ids, avoid_obstacles=True):
+        pending = np.asarray(env_ids)
+        for _ in range(self.max_attempts):
+            if not pending.size:
+                return
+            x = self.rng.integers(50, self.width - 50 + 1, pending.size)
+            y = self.rng.integers(50, self.height - 50 + 1, pending.size)
+            size = np.full(pending.size, GOAL_SIZE)
+            candidates = np.stack([x, y, size, size], axis=-1).astype(np.float64)
+            ok = np.ones(pending.size, dtype=bool)
+            if avoid_obstacles:
+                ok = ~rects_overlap(candidates[:, None], self.obstacles[pending]).any(axis=1)
+            self.goals[pending[ok]] = candidates[ok]
+            pending = pending[~ok]
+        if pending.size:
+            raise RuntimeError(f"Could not place the goal of {pending.size} envs in {self.max_attempts} attempts")
+
+    def _spawn_obstacles(self, env_ids):
+        # Rejection sampling like Simulator.spawn_initial_obstacles, vectorized across envs
+        env_ids = np.asarray(env_ids)
+        car_rects = self.car_rects()
+        for m in range(self.num_obstacles):
+            pending = env_ids
+            for _ in range(self.max_attempts):
+                if not pending.size:
+                    break
+                size = self.rng.integers(20, 60 + 1, pending.size)
+                x = self.rng.integers(0, self.width - size + 1)
+                y = self.rng.integers(0, self.height - size + 1)
+                candidates = np.stack([x, y, size, size], axis=-1).astype(np.float64)
+                ok = ~rects_overlap(candidates, car_rects[pending]) & \
+                     ~rects_overlap(candidates, self.goals[pending]) & \
+                     ~rects_overlap(candidates[:, None], self.obstacles[pending, :m]).any(axis=1)
+                self.obstacles[pending[ok], m] = candidates[ok]
+                pending = pending[~ok]
+            if pending.size:
+                raise RuntimeError(f"Could not place obstacle {m + 1} of {pending.size} envs "
+                                   f"in {self.max_attempts} attempts")
+
+    def scan(self):
+        # (N, B) distance to the nearest obstacle along each beam, np.inf where nothing is in range
+        origins = np.stack([self.car_x, self.car_y], axis=-1)
+        return ray_aabb_distances(origins, self.beam_directions(), self.obstacles, self.radar_range)
+
+    def reset(self):
+        all_envs = np.arange(self.num_envs)
+        self._reset_cars(all_envs)
+        self._spawn_goals(all_envs)
+        self.grids[:] = 0
+        self._last_distances = self.scan()
+        self._update_slam(self._last_distances)
+        return self.get_states()
+
+    def step(self, actions):
+        # Returns (states, rewards, dones, truncated), one row or entry per env
+        actions = np.asarray(actions)
+        self._move_cars(actions)
+        self.steps += 1
+
+        # Rotated car boxes against every obstacle and goal of their env, like Simulator
+        centers = np.stack([self.car_x, self.car_y], axis=-1)
+        collision = obb_aabb_overlap(centers, CAR_HALF_SIZE, self.car_angle, self.obstacles).any(axis=1)
+        goal_reached = obb_aabb_overlap(centers, CAR_HALF_SIZE, self.car_angle, self.goals[:, None])[:, 0]
+
+        rewards, dones, truncated = self._outcomes(collision, goal_reached)
+
+        # Finished envs start a new episode right away; their returned state is the first one
+        # of that episode, so it is no next state for a done or truncated transition
+        done_ids = np.nonzero(dones | truncated)[0]
+        if done_ids.size:
+            self._reset_cars(done_ids)
+            self._spawn_goals(done_ids)
+            if len(self.grids):
+                self.grids[done_ids] = 0
+
+        self._last_distances = self.scan()
+        self._update_slam(self._last_distances)
+        return self.get_states(), rewards, dones, truncated